@@ -5,14 +5,24 @@
 
 #include "common.h"
 #include "SpGEMM2DModel.h"
+#include "SpGEMM3DModel.h"
 #include "SpGEMMParams.h"
 #include "PlatformParams.h"
+#include "TuningCache.h"
+#include "Distributor.h"
 
 namespace autotuning {
 
 
 using namespace combblas;
 
+/* How the search space is explored */
+enum searchStrategy {
+    BRUTE_FORCE,   // Predict every config
+    BRANCH_BOUND   // Skip configs whose lower bound cannot beat the best prediction so far
+} typedef SearchStrategy;
+
+
 class Autotuner {
 
 public:
@@ -25,13 +35,21 @@ public:
     Autotuner(PlatformParams& params): platformParams(params) {
         ASSERT(initCalled, "Please call autotuning::Init() first.");
     }
+
+
+    /* Reuse tuning decisions stored in path for matrices that match under policy */
+    void EnableCache(const std::string path, TuningCachePolicy policy = TuningCachePolicy()) {
+        cache.reset(new TuningCache(path, policy));
+    }
     
     
     /* TUNING */
     template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
     SpGEMMParams TuneSpGEMM2DAnalytical(SpParMat<AIT, ANT, ADER>& A, SpParMat<BIT, BNT, BDER>& B, 
                                     std::string& matpathA, std::string& matpathB,
-                                    uint32_t maxNodes = 0, uint32_t maxPPN = 0)
+                                    uint32_t maxNodes = 0, uint32_t maxPPN = 0,
+                                    SearchStrategy strategy = BRUTE_FORCE,
+                                    int redistMults = 1, bool searchThreads = false)
     {
 
 #ifdef PROFILE
@@ -47,33 +65,182 @@ public:
 #ifdef PROFILE
         infoPtr->StartTimerGlobal("TuneSpGEMM2DAnalytical");
 #endif
+        TRACE_BEGIN("TuneSpGEMM2DAnalytical");
 
-        typedef SpGEMM2DModel<SpGEMM2DModelAnalytical> ModelType;
-        ModelType model;
-        model.Create(platformParams);
-        
+        if (maxNodes==0)
+            maxNodes = jobPtr->nodes; //if maxNodes not specified, assume we can scale to max number of nodes in job
+        if (maxPPN==0)
+            maxPPN = jobPtr->tasksPerNode;
+
+        SpGEMMParams resultParams; 
+
+        // A cache hit skips Inputs, which is most of the tuning time
+        TuningKey key;
+        bool cacheHit = false;
+        if (cache) {
+            key = cache->MakeKey("TuneSpGEMM2DAnalytical-redist" + std::to_string(redistMults) +
+                                    (searchThreads ? "-threads" : ""),
+                                    A, B, platformParams, maxNodes, maxPPN);
+            cacheHit = cache->Lookup(key, resultParams);
 #ifdef PROFILE
-        infoPtr->StartTimerGlobal("Inputs");
+            infoPtr->PutGlobal("TuningCacheHit", std::to_string(cacheHit));
+            infoPtr->PrintGlobal("TuningCacheHit");
 #endif
-        SpGEMM2DModelAnalytical::Inputs<AIT,ANT,ADER,BIT,BNT,BDER> inputs(A, B);
+        }
+
+        if (!cacheHit) {
+
+            typedef SpGEMM2DModel<SpGEMM2DModelAnalytical> ModelType;
+            ModelType model;
+            model.Create(platformParams);
+            
+#ifdef PROFILE
+            infoPtr->StartTimerGlobal("Inputs");
+#endif
+            SpGEMM2DModelAnalytical::Inputs<AIT,ANT,ADER,BIT,BNT,BDER> inputs(A, B);
+
+#ifdef PROFILE
+            infoPtr->EndTimerGlobal("Inputs");
+            infoPtr->PrintGlobal("Inputs");
+#endif
+                                        
+            // With searchThreads, each config is also tried with every thread count that fits on a node
+            std::vector<SpGEMMParams> searchSpace = searchThreads ?
+                SpGEMMParams::ConstructSearchSpace2DThreaded(platformParams, maxNodes, maxPPN) :
+                SpGEMMParams::ConstructSearchSpace2D(platformParams, maxNodes, maxPPN);
+
+            // Cost of moving A and B off the current grid, spread over the redistMults multiplications
+            // expected on the new one. redistMults=0 leaves it out.
+            std::vector<float> redistCosts;
+            if (redistMults>0) {
+                SpGEMMParams currParams = SpGEMMParams::GetDefaultParams();
+                AIT nnzA = A.getnnz();
+                BIT nnzB = B.getnnz();
+                redistCosts.resize(searchSpace.size());
+                std::transform(searchSpace.begin(), searchSpace.end(), redistCosts.begin(),
+                    [&](auto& params) {
+                        return (Distributor::RedistributionTime<AIT,ANT>(nnzA, currParams, params, platformParams) +
+                                Distributor::RedistributionTime<BIT,BNT>(nnzB, currParams, params, platformParams)) 
+                                / redistMults;
+                    }
+                );
+            }
+
+            if (strategy==BRANCH_BOUND)
+                resultParams = SearchBranchBound<SpGEMMParams, ModelType>(inputs, model, searchSpace, redistCosts);
+            else
+                resultParams = SearchBruteForce<SpGEMMParams, ModelType>(inputs, model, searchSpace, redistCosts);
 
 #ifdef PROFILE
-        infoPtr->EndTimerGlobal("Inputs");
-        infoPtr->PrintGlobal("Inputs");
+            if (redistMults>0) {
+                SpGEMMParams currParams = SpGEMMParams::GetDefaultParams();
+                double redistTime = Distributor::RedistributionTime<AIT,ANT>(A.getnnz(), currParams, resultParams, platformParams) +
+                                    Distributor::RedistributionTime<BIT,BNT>(B.getnnz(), currParams, resultParams, platformParams);
+                infoPtr->PutGlobal("PredRedistTime", std::to_string(redistTime));
+            }
 #endif
-        
+
+            if (cache)
+                cache->Insert(key, resultParams);
+
+        }
+
+        TRACE_END();
+
+#ifdef PROFILE
+        infoPtr->EndTimerGlobal("TuneSpGEMM2DAnalytical");
+        infoPtr->PrintGlobal("TuneSpGEMM2DAnalytical");
+#endif
+
+#ifdef PROFILE
+        infoPtr->WriteInfoGlobal();
+        delete infoPtr;
+#endif
+
+        MPI_Barrier(A.getcommgrid()->GetWorld());
+
+        return resultParams;
+
+    }
+
+    /* Search over (nodes, ppn, layers) with the 3D SUMMA model. One layer configs are 2D SUMMA,
+     * so the result is 2D whenever layering does not pay off. */
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    SpGEMMParams TuneSpGEMM3D(SpParMat<AIT, ANT, ADER>& A, SpParMat<BIT, BNT, BDER>& B, 
+                                std::string& matpathA, std::string& matpathB,
+                                uint32_t maxNodes = 0, uint32_t maxPPN = 0,
+                                SearchStrategy strategy = BRUTE_FORCE)
+    {
+
+#ifdef PROFILE
+        std::string matnameA = ExtractMatName(matpathA);
+        std::string matnameB = ExtractMatName(matpathA);
+        infoPtr = new InfoLog("info-"+matnameA+"x"+matnameB+"-"+
+                                std::to_string(autotuning::rank)+".out", 
+                                autotuning::rank);
+#endif
+
+        MPI_Barrier(A.getcommgrid()->GetWorld());
+
+#ifdef PROFILE
+        infoPtr->StartTimerGlobal("TuneSpGEMM3D");
+#endif
+        TRACE_BEGIN("TuneSpGEMM3D");
+
         if (maxNodes==0)
-            maxNodes = jobPtr->nodes; //if maxNodes not specified, assume we can scale to max number of nodes in job
+            maxNodes = jobPtr->nodes;
         if (maxPPN==0)
             maxPPN = jobPtr->tasksPerNode;
-                                    
+
         SpGEMMParams resultParams; 
-        std::vector<SpGEMMParams> searchSpace = SpGEMMParams::ConstructSearchSpace2D(platformParams, maxNodes, maxPPN);
-        resultParams = SearchBruteForce<SpGEMMParams, ModelType>(inputs, model, searchSpace);
 
+        TuningKey key;
+        bool cacheHit = false;
+        if (cache) {
+            key = cache->MakeKey("TuneSpGEMM3D", A, B, platformParams, maxNodes, maxPPN);
+            cacheHit = cache->Lookup(key, resultParams);
 #ifdef PROFILE
-        infoPtr->EndTimerGlobal("TuneSpGEMM2DAnalytical");
-        infoPtr->PrintGlobal("TuneSpGEMM2DAnalytical");
+            infoPtr->PutGlobal("TuningCacheHit", std::to_string(cacheHit));
+            infoPtr->PrintGlobal("TuningCacheHit");
+#endif
+        }
+
+        if (!cacheHit) {
+
+            typedef SpGEMM2DModel<SpGEMM3DModelAnalytical> ModelType;
+            ModelType model;
+            model.Create(platformParams);
+
+            std::vector<SpGEMMParams> searchSpace = SpGEMMParams::ConstructSearchSpace3D(platformParams, maxNodes, maxPPN);
+            
+#ifdef PROFILE
+            infoPtr->StartTimerGlobal("Inputs");
+#endif
+            SpGEMM3DModelAnalytical::Inputs<AIT,ANT,ADER,BIT,BNT,BDER> inputs(A, B);
+
+            // One histogram per matrix covers every grid, so predictions need no communication
+            inputs.ComputeNnzHistograms(searchSpace);
+
+#ifdef PROFILE
+            infoPtr->EndTimerGlobal("Inputs");
+            infoPtr->PrintGlobal("Inputs");
+#endif
+
+            if (strategy==BRANCH_BOUND)
+                resultParams = SearchBranchBound<SpGEMMParams, ModelType>(inputs, model, searchSpace);
+            else
+                resultParams = SearchBruteForce<SpGEMMParams, ModelType>(inputs, model, searchSpace);
+
+            if (cache)
+                cache->Insert(key, resultParams);
+
+        }
+
+        TRACE_END();
+
+#ifdef PROFILE
+        infoPtr->EndTimerGlobal("TuneSpGEMM3D");
+        infoPtr->PrintGlobal("TuneSpGEMM3D");
 #endif
 
 #ifdef PROFILE
@@ -139,7 +306,7 @@ public:
     }
 
 
-#ifdef XGB
+#ifdef XGB_MODEL
     
     template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
     SpGEMMParams TuneSpGEMM2DXgb(SpParMat<AIT, ANT, ADER>& A, SpParMat<BIT, BNT, BDER>& B, 
@@ -162,7 +329,8 @@ public:
         SpGEMM2DModelXgb::Inputs<AIT,ANT,ADER,BIT,BNT,BDER> inputs(A, B);
         
         SpGEMMParams resultParams; 
-        resultParams = SearchInference<SpGEMMParams>(inputs, model);
+        std::vector<SpGEMMParams> searchSpace = SpGEMMParams::ConstructSearchSpace2D(platformParams, jobPtr->nodes, jobPtr->tasksPerNode);
+        resultParams = SearchInference<SpGEMMParams>(inputs, model, searchSpace);
 
 #ifdef PROFILE
         infoPtr->EndTimerGlobal("TuneSpGEMM2DXgb");
@@ -180,7 +348,7 @@ public:
 #endif
 
 
-#ifdef XGB
+#ifdef XGB_MODEL
 
     //TODO: This should probably just be a tuneinference function with a template parameter
     template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
@@ -224,8 +392,10 @@ public:
     }
 #endif
 
+    /* fixedCosts, if not empty, is added to the prediction of each config */
     template <typename P, typename M, typename I>
-    P SearchBruteForce(I& inputs, M& model, std::vector<P>& searchSpace) {
+    P SearchBruteForce(I& inputs, M& model, std::vector<P>& searchSpace, 
+                        const std::vector<float>& fixedCosts = std::vector<float>()) {
 
 #ifdef PROFILE
         infoPtr->StartTimerGlobal("BruteForceSearch");
@@ -238,6 +408,7 @@ public:
 #endif
 
         std::vector<float> predictions = model.Predict(inputs, searchSpace);
+        AddFixedCosts(predictions, fixedCosts);
 
 #ifdef DEBUG
         debugPtr->Print("Searching for min");
@@ -262,32 +433,113 @@ public:
         return bestParams;
     }
     
+    /* Best-first branch and bound. Configs are visited in order of model.LowerBound, and the full model
+     * is only evaluated while the next bound is below the best prediction found so far.
+     * Requires a model with a LowerBoundImpl. */
     template <typename P, typename M, typename I>
-    P ParSearchBruteForce(I& inputs, M& model, std::vector<P>& searchSpace) {
+    P SearchBranchBound(I& inputs, M& model, std::vector<P>& searchSpace,
+                        const std::vector<float>& fixedCosts = std::vector<float>()) {
 
 #ifdef PROFILE
-        infoPtr->StartTimerGlobal("BruteForceSearch");
+        infoPtr->StartTimerGlobal("BranchBoundSearch");
 #endif
 
-        std::vector<P> localSpace;
-        std::vector<int> recvCounts(autotuning::worldSize);
-        int partitionSize = std::max(1, (int)(searchSpace.size() / autotuning::worldSize));
-        for (int i=0; i<searchSpace.size(); i++) {
-            int target = std::min(i / partitionSize, autotuning::worldSize);
-            if (target==autotuning::rank) {
-                localSpace.push_back(searchSpace[i]);
+        ASSERT(searchSpace.size()>0, "Global search space is of size 0!");
+
+#ifdef PROFILE
+        infoPtr->PutGlobal("SearchSpaceSize", std::to_string(searchSpace.size()));
+#endif
+
+        // A fixed cost shifts a config's bound and prediction alike
+        std::vector<float> bounds = model.LowerBound(inputs, searchSpace);
+        AddFixedCosts(bounds, fixedCosts);
+
+        // A NaN bound proves nothing, so it must never prune
+        std::for_each(bounds.begin(), bounds.end(), 
+            [](float& bound) {
+                if (std::isnan(bound)) bound = std::numeric_limits<float>::lowest();
+            }
+        );
+
+        std::vector<int> order(searchSpace.size());
+        std::iota(order.begin(), order.end(), 0);
+        std::stable_sort(order.begin(), order.end(), 
+            [&bounds](int i, int j) {return bounds[i] < bounds[j];}
+        );
+
+        std::vector<P> evaluated;
+        std::vector<float> predictions;
+        float bestTime = std::numeric_limits<float>::max();
+        int bestIdx = order[0];
+
+        // The whole pruned loop is timed once, as Predict times the whole space in the other searches
+#ifdef PROFILE
+        infoPtr->StartTimerGlobal("Prediction");
+#endif
+        TRACE_BEGIN("Prediction");
+
+        for (int idx : order) {
+
+            // Every remaining bound is at least this large
+            if (bounds[idx] >= bestTime)
+                break;
+
+            float time = model.PredictOne(inputs, searchSpace[idx]) + (fixedCosts.empty() ? 0 : fixedCosts[idx]);
+
+            evaluated.push_back(searchSpace[idx]);
+            predictions.push_back(time);
+
+            if (time < bestTime) {
+                bestTime = time;
+                bestIdx = idx;
             }
-            recvCounts[target] += 1;
         }
+
+        TRACE_END();
+#ifdef PROFILE
+        infoPtr->WriteInfo();
+        infoPtr->EndTimerGlobal("Prediction");
+#endif
+
+        P bestParams = searchSpace[bestIdx];
+
+#ifdef DEBUG
+        debugPtr->Print("Pruned " + std::to_string(searchSpace.size() - evaluated.size()) + " configs");
+#endif
+
+#ifdef PROFILE
+
+        model.WritePrediction(evaluated, predictions);
+
+        infoPtr->PutGlobal("PrunedConfigs", std::to_string(searchSpace.size() - evaluated.size()));
+        infoPtr->PutGlobal("BestParams", bestParams.OutStr());
+        infoPtr->PutGlobal("PredSpGEMMTime", std::to_string(bestTime));
+
+        infoPtr->EndTimerGlobal("BranchBoundSearch");
+        infoPtr->PrintGlobal("BranchBoundSearch");
+        infoPtr->PrintGlobal("PrunedConfigs");
+        infoPtr->PrintGlobal("BestParams");
+        infoPtr->PrintGlobal("PredSpGEMMTime");
+#endif
         
-        std::vector<int> displs(autotuning::worldSize);
-        for (int i=1; i<displs.size(); i++) {
-            displs[i] = displs[i-1] + recvCounts[i-1];
-        }
+        return bestParams;
+    }
+    
+
+    template <typename P, typename M, typename I>
+    P ParSearchBruteForce(I& inputs, M& model, std::vector<P>& searchSpace) {
 
+#ifdef PROFILE
+        infoPtr->StartTimerGlobal("BruteForceSearch");
+#endif
 
         ASSERT(searchSpace.size()>0, "Global search space is of size 0!");
 
+        std::vector<int> recvCounts, displs;
+        PartitionSearchSpace(searchSpace.size(), recvCounts, displs);
+        std::vector<P> localSpace(searchSpace.begin() + displs[autotuning::rank],
+                                    searchSpace.begin() + displs[autotuning::rank] + recvCounts[autotuning::rank]);
+
 #ifdef PROFILE
         infoPtr->PutGlobal("SearchSpaceSize", std::to_string(searchSpace.size()));
         infoPtr->PutGlobal("LocalSearchSpaceSize", std::to_string(localSpace.size()));
@@ -337,13 +589,21 @@ public:
 
         ASSERT(searchSpace.size()>0, "Search space is of size 0!");
 
+        // Each rank runs inference on its own block of the search space
+        std::vector<int> recvCounts, displs;
+        PartitionSearchSpace(searchSpace.size(), recvCounts, displs);
+        std::vector<P> localSpace(searchSpace.begin() + displs[autotuning::rank],
+                                    searchSpace.begin() + displs[autotuning::rank] + recvCounts[autotuning::rank]);
+
 #ifdef PROFILE
+        infoPtr->PutGlobal("SearchSpaceSize", std::to_string(searchSpace.size()));
+        infoPtr->PutGlobal("LocalSearchSpaceSize", std::to_string(localSpace.size()));
         infoPtr->StartTimer("FeatureMat");
 #endif
 
         //NOTE: FeatureMat is in row-major order
         std::vector<float> featureMat;
-        featureMat = model.MakeFeatureMat(inputs, searchSpace);
+        featureMat = model.MakeFeatureMat(inputs, localSpace);
 
 #ifdef PROFILE
         infoPtr->EndTimer("FeatureMat");
@@ -354,8 +614,15 @@ public:
         infoPtr->StartTimer("Prediction");
 #endif
         
-        std::vector<float> predictions;
-        predictions = model.Predict(featureMat);
+        // One batched call over the whole block, ranks left without configs skip it
+        std::vector<float> localPredictions;
+        if (!localSpace.empty())
+            localPredictions = model.Predict(featureMat);
+
+        std::vector<float> predictions(searchSpace.size());
+        MPI_Allgatherv((void*)(localPredictions.data()), localPredictions.size(), MPI_FLOAT,
+                        (void*)(predictions.data()), recvCounts.data(), displs.data(),
+                        MPI_FLOAT, MPI_COMM_WORLD);
 
 #ifdef PROFILE
         infoPtr->EndTimer("Prediction");
@@ -383,10 +650,29 @@ public:
 
     }
 
+    /* Contiguous blocks of a search space of size n, one per rank, with sizes that differ by at most 1.
+     * counts and displs are laid out the way MPI_Allgatherv takes them. */
+    static void PartitionSearchSpace(int n, std::vector<int>& counts, std::vector<int>& displs) {
+        counts.resize(autotuning::worldSize);
+        displs.resize(autotuning::worldSize);
+        for (int r=0; r<autotuning::worldSize; r++) {
+            counts[r] = n / autotuning::worldSize + (r < n % autotuning::worldSize);
+            displs[r] = (r==0) ? 0 : displs[r-1] + counts[r-1];
+        }
+    }
+
+    static void AddFixedCosts(std::vector<float>& predictions, const std::vector<float>& fixedCosts) {
+        if (fixedCosts.empty()) return;
+        ASSERT(predictions.size()==fixedCosts.size(), "One fixed cost per config is needed");
+        std::transform(predictions.begin(), predictions.end(), fixedCosts.begin(), predictions.begin(), 
+                        std::plus<float>());
+    }
+
     ~Autotuner(){}
 
 private:
     PlatformParams platformParams;
+    std::shared_ptr<TuningCache> cache;
 
 };//Autotuner
 
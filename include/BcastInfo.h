@@ -10,6 +10,9 @@
 #include "PlatformParams.h"
 #include "CommModel.h"
 
+#include <map>
+#include <set>
+
 namespace autotuning {
 
 using namespace combblas;
@@ -45,6 +48,134 @@ BcastAlgorithm SelectBcastAlgSimple(IT msgSize, int commSize) {
 BcastAlgorithm SelectBcastAlgTree() {return BCAST_BIN_TREE;}
 
 
+/* Measured bcast times compiled by tuning-experiments/bcast_table.py from calibrate bcast sweeps.
+ * One line per grid point, <commSize> <log2 bytes> <BcastAlgorithm> <time us>, holding the fastest algorithm.
+ * Time() interpolates linearly over log2 message size x log2 comm size. Past the largest message
+ * it scales with message size, past the largest communicator with log2 of its size. */
+class BcastTable {
+
+public:
+
+	BcastTable(){}
+
+	BcastTable(const std::string& path) {
+
+		std::ifstream ifs(path);
+		ASSERT(ifs.good(), "Could not open bcast table " + path);
+
+		std::map<std::pair<int,int>, std::pair<int,double>> points;
+		std::set<int> commSizes, logSizes;
+
+		std::string line;
+		while (std::getline(ifs, line)) {
+			if (line.empty() || line[0]=='#') continue;
+			std::stringstream ss(line);
+			int commSize, logSize, alg;
+			double time;
+			if (!(ss>>commSize>>logSize>>alg>>time)) continue;
+			points[{commSize, logSize}] = {alg, time};
+			commSizes.insert(commSize);
+			logSizes.insert(logSize);
+		}
+
+		for (int commSize : commSizes) logCommSizes.push_back(std::log2(commSize));
+		for (int logSize : logSizes) logMsgSizes.push_back(logSize);
+
+		times.resize(commSizes.size(), std::vector<double>(logSizes.size()));
+		algs.resize(commSizes.size(), std::vector<BcastAlgorithm>(logSizes.size()));
+
+		int ci = 0;
+		for (int commSize : commSizes) {
+			int li = 0;
+			for (int logSize : logSizes) {
+				auto point = points.find({commSize, logSize});
+				ASSERT(point!=points.end(), "Bcast table " + path + " is missing commSize " + 
+						std::to_string(commSize) + ", log2 bytes " + std::to_string(logSize));
+				algs[ci][li] = static_cast<BcastAlgorithm>(point->second.first);
+				times[ci][li] = point->second.second;
+				li++;
+			}
+			ci++;
+		}
+	}
+
+
+	/* Predicted time in us */
+	double Time(double msgSize, int commSize) const {
+
+		if (msgSize<=0 || commSize<=1 || Empty())
+			return 0;
+
+		double x = std::log2(commSize);
+		double y = std::log2(msgSize);
+
+		double scale = 1.0;
+		if (x > logCommSizes.back()) {
+			scale *= x / logCommSizes.back();
+			x = logCommSizes.back();
+		}
+		if (y > logMsgSizes.back()) {
+			scale *= std::exp2(y - logMsgSizes.back());
+			y = logMsgSizes.back();
+		}
+		x = std::max(x, logCommSizes.front());
+		y = std::max(y, logMsgSizes.front());
+
+		auto [ci, cw] = Bracket(logCommSizes, x);
+		auto [li, lw] = Bracket(logMsgSizes, y);
+		int ciNext = std::min(ci+1, (int)logCommSizes.size()-1);
+		int liNext = std::min(li+1, (int)logMsgSizes.size()-1);
+
+		double low = times[ci][li]*(1-lw) + times[ci][liNext]*lw;
+		double high = times[ciNext][li]*(1-lw) + times[ciNext][liNext]*lw;
+
+		return (low*(1-cw) + high*cw) * scale;
+	}
+
+
+	/* Fastest measured algorithm at the nearest grid point */
+	BcastAlgorithm Alg(double msgSize, int commSize) const {
+
+		if (msgSize<=0 || commSize<=1 || Empty())
+			return BCAST_NONE;
+
+		auto Nearest = [](const std::vector<double>& grid, double v) {
+			auto it = std::min_element(grid.begin(), grid.end(), 
+				[v](double a, double b) {return std::abs(a-v) < std::abs(b-v);});
+			return std::distance(grid.begin(), it);
+		};
+
+		return algs[Nearest(logCommSizes, std::log2(commSize))][Nearest(logMsgSizes, std::log2(msgSize))];
+	}
+
+
+	inline bool Empty() const {return times.empty();}
+
+private:
+
+	/* Index i and weight w so that v = grid[i]*(1-w) + grid[i+1]*w */
+	static std::pair<int,double> Bracket(const std::vector<double>& grid, double v) {
+		if (grid.size()==1)
+			return {0, 0.0};
+		int i = std::upper_bound(grid.begin(), grid.end(), v) - grid.begin() - 1;
+		i = std::min(std::max(i, 0), (int)grid.size()-2);
+		return {i, (v - grid[i]) / (grid[i+1] - grid[i])};
+	}
+
+	std::vector<double> logCommSizes;
+	std::vector<double> logMsgSizes;
+	std::vector<std::vector<double>> times;
+	std::vector<std::vector<BcastAlgorithm>> algs;
+
+};
+
+
+template <typename IT>
+BcastAlgorithm SelectBcastAlgTable(IT msgSize, int commSize, const BcastTable& table) {
+	return table.Alg(msgSize, commSize);
+}
+
+
 //JB: See https://github.com/open-mpi/ompi/blob/f0261cbef73897133177f17351b80eee6111f1bf/ompi/mca/coll/tuned/coll_tuned_decision_fixed.c#L512
 // This is pretty much ripped from this function
 template <typename IT>
@@ -127,8 +258,7 @@ BcastAlgorithm SelectBcastAlg(IT msgSize, int commSize) {
 template <typename IT>
 CommInfo<IT> * MakeBcastCommInfo(const int bcastWorldSize,  const IT msgSize) {
 
-	BcastAlgorithm alg = SelectBcastAlgTree(msgSize, bcastWorldSize);
-	//BcastAlgorithm alg = SelectBcastAlgTree();
+	BcastAlgorithm alg = SelectBcastAlgTree();
 
 	CommInfo<IT> * info = new CommInfo<IT>();
 
@@ -220,6 +350,30 @@ CommInfo<IT> * MakeBcastCommInfo(const int bcastWorldSize,  const IT msgSize) {
 }
 
 
+/* Bcast over a communicator spanning placement.first nodes, with up to placement.second ranks on each.
+ * The root's node broadcasts to one rank on every other node, then each of those within its node,
+ * and each stage is priced with its own alpha and beta. With one rank per node it is the flat bcast.
+ * latency=false leaves out the alpha terms. Time in us. */
+template <typename IT>
+double HierarchicalBcastTime(IT msgSize, std::pair<int,int> placement, CommModel<IT>& model, bool latency=true) {
+
+	CommOpts internode {false};
+	CommOpts intranode {true};
+
+	double time = 0;
+	for (auto stage : {std::make_pair(placement.first, &internode), std::make_pair(placement.second, &intranode)}) {
+		if (stage.first<=1) continue;
+		CommInfo<IT> * info = MakeBcastCommInfo(stage.first, msgSize);
+		if (!latency) info->numMsgs = 0;
+		time += model.Time(info, stage.second);
+		delete info;
+	}
+
+	return time;
+
+}
+
+
 }//combblas
 
 
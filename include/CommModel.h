@@ -46,25 +46,35 @@ class PostCommModel : public CommModel<IT> {
 public:
 
     PostCommModel(double alpha, double internodeBeta, double intranodeBeta):
-        alpha(alpha), internodeBeta(internodeBeta), intranodeBeta(intranodeBeta) 
+        PostCommModel(alpha, internodeBeta, alpha, intranodeBeta)
+    {
+
+    }
+
+    PostCommModel(double internodeAlpha, double internodeBeta, double intranodeAlpha, double intranodeBeta):
+        internodeAlpha(internodeAlpha), internodeBeta(internodeBeta),
+        intranodeAlpha(intranodeAlpha), intranodeBeta(intranodeBeta)
     {
 
     }
 
     double Time(CommInfo<IT> * info, CommOpts * opts) {
-        double beta;
+        double alpha, beta;
         
-        if (opts->intranode)
+        if (opts->intranode) {
+            alpha = intranodeAlpha;
             beta = intranodeBeta;
-        else
+        } else {
+            alpha = internodeAlpha;
             beta = internodeBeta;
+        }
         
         return info->numMsgs*alpha + info->numBytes/beta;
     }   
 
 private:
-    double alpha; double internodeBeta; double intranodeBeta;
-    int coresPerNode;
+    double internodeAlpha; double internodeBeta; 
+    double intranodeAlpha; double intranodeBeta;
 
 };
 
@@ -226,6 +226,36 @@ public:
     }
 
 
+    /* Modeled time in seconds for ReDistributeMatrix to move a matrix with nnz nonzeros from the oldParams
+     * grid onto the newParams grid, assuming nonzeros are spread evenly over tiles.
+     * Scaling down, each new rank receives a tile from every old rank in its superTileDim x superTileDim
+     * super tile. Scaling up, each old rank sends a piece of its tile to superTileDim^2 new ranks.
+     * Either way a rank pair exchanges nnz/max(Pold,Pnew) tuples, and the busiest rank handles superTileDim^2 of them. */
+    template <typename IT, typename NT>
+    static double RedistributionTime(IT nnz, SpGEMMParams& oldParams, SpGEMMParams& newParams, 
+                                    PlatformParams& platformParams)
+    {
+        if (oldParams.GetNodes()==newParams.GetNodes() && oldParams.GetPPN()==newParams.GetPPN())
+            return 0;
+
+        int maxProcs = std::max(oldParams.GetTotalProcs(), newParams.GetTotalProcs());
+        double pairBytes = (static_cast<double>(nnz) / maxProcs) * (2*sizeof(IT) + sizeof(NT));
+
+        int superTileDim = std::max(oldParams.GetGridDim(), newParams.GetGridDim()) / 
+                            std::min(oldParams.GetGridDim(), newParams.GetGridDim());
+        int numMsgs = superTileDim*superTileDim;
+
+        bool intranode = oldParams.GetNodes()==1 && newParams.GetNodes()==1;
+        double alpha = intranode ? platformParams.GetIntranodeAlpha() : platformParams.GetInternodeAlpha();
+        double beta = intranode ? platformParams.GetIntranodeBeta() : platformParams.GetInternodeBeta();
+
+        // Alltoall of the message sizes, then the Alltoallv
+        double sizesTime = std::log2(worldSize) * alpha;
+
+        return (sizesTime + numMsgs*(alpha + pairBytes/beta)) / 1e6;
+    }
+
+
     template <typename IT>
     static std::tuple<int,int> TargetRankMapper(IT i, IT j, 
                                                 IT ncols, IT nrows,
@@ -3,6 +3,10 @@
 
 #include <fstream>
 #include <map>
+#include <cstdlib>
+#include <cstring>
+#include <cstdio>
+#include <cctype>
 
 namespace autotuning {
 using namespace combblas;
@@ -11,6 +15,9 @@ class InfoLog {
 public:
     InfoLog(const std::string fileName, int rank) : rank(rank) {
         ofs.open(fileName, std::ofstream::out);
+        // AUTOTUNING_OUTPUT=jsonl writes one JSON record per section instead of key:value text
+        const char * format = std::getenv("AUTOTUNING_OUTPUT");
+        jsonl = format!=nullptr && !strcmp(format, "jsonl");
     }
 
 
@@ -40,6 +47,10 @@ public:
 
     /* Write all info into file */
     void WriteInfo() {
+        if (jsonl) {
+            WriteRecord("prediction", infoMap);
+            return;
+        }
         ofs<<"----PREDICTION INFO----"<<std::endl;
         std::for_each(infoMap.begin(), infoMap.end(),
             [this](auto const& elem) {
@@ -51,6 +62,11 @@ public:
 
     void WriteInfoGlobal() {
 
+        if (jsonl) {
+            WriteInfoGlobalJsonl();
+            return;
+        }
+
         ofs<<std::endl;
 
         ofs<<"----GLOBALS RANK " <<rank<<"----"<<std::endl;
@@ -76,6 +92,87 @@ public:
 
     }
 
+    void WriteInfoGlobalJsonl() {
+        WriteRecord("globals", infoMapGlobal);
+
+        float sum = std::atof(infoMapGlobal[std::string("TuneSpGEMM2DPhase")].c_str());
+        std::map<std::string, std::string> percentages;
+        for (auto const& elem : infoMapGlobal) {
+            if (!strcmp(elem.first.c_str(), "FeatureInit") || !strcmp(elem.first.c_str(), "Prediction")) {
+                percentages[elem.first] = std::to_string(std::atof(elem.second.c_str())*100/sum);
+            }
+        }
+        WriteRecord("percentages", percentages);
+    }
+
+
+    /* One JSON object per line, numeric values are written as numbers */
+    void WriteRecord(const std::string section, const std::map<std::string, std::string>& record) {
+        ofs<<"{\"section\":\""<<section<<"\",\"rank\":"<<rank;
+        for (auto const& elem : record) {
+            ofs<<","<<JsonString(elem.first)<<":"<<JsonValue(elem.second);
+        }
+        ofs<<"}"<<std::endl;
+    }
+
+    static std::string JsonString(const std::string& str) {
+        std::string result("\"");
+        for (char c : str) {
+            if (c=='"' || c=='\\') {
+                result += '\\';
+                result += c;
+            } else if (c=='\n') {
+                result += "\\n";
+            } else if ((unsigned char)c < 0x20) {
+                // Every other control character is invalid in a JSON string
+                char escaped[7];
+                std::snprintf(escaped, sizeof(escaped), "\\u%04x", (unsigned char)c);
+                result += escaped;
+            } else {
+                result += c;
+            }
+        }
+        return result + "\"";
+    }
+
+    /* Values that are JSON numbers are written bare, anything else (e.g. 0x10, .5, +1, inf) quoted */
+    static std::string JsonValue(const std::string& str) {
+        if (IsJsonNumber(str))
+            return str;
+        return JsonString(str);
+    }
+
+    /* -?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)? */
+    static bool IsJsonNumber(const std::string& str) {
+        size_t i = 0, n = str.size();
+        auto digits = [&]() {
+            size_t start = i;
+            while (i<n && std::isdigit((unsigned char)str[i])) i++;
+            return i>start;
+        };
+
+        if (i<n && str[i]=='-') i++;
+        if (i<n && str[i]=='0') {
+            i++;
+        } else if (!(i<n && str[i]>='1' && str[i]<='9') || !digits()) {
+            return false;
+        }
+        if (i<n && str[i]=='.') {
+            i++;
+            if (!digits()) return false;
+        }
+        if (i<n && (str[i]=='e' || str[i]=='E')) {
+            i++;
+            if (i<n && (str[i]=='+' || str[i]=='-')) i++;
+            if (!digits()) return false;
+        }
+        return i==n;
+    }
+
+    bool Jsonl() {return jsonl;}
+    int Rank() {return rank;}
+
+
     void WriteOne(const std::string key) {
         this->ofs<<key<<":"<<infoMap[key]<<std::endl;
     }
@@ -144,6 +241,7 @@ private:
     std::map<std::string, std::string> infoMap;
     std::map<std::string, std::string> infoMapGlobal;
     int rank;
+    bool jsonl;
 
 };
 
@@ -33,6 +33,8 @@ struct LocalSpGEMMInfo {
     float globDensityB;
     float locDensityB;
 
+    int threads = 0; // OpenMP threads running the multiply, 0 if unset
+
     void SetFLOPS(SpGEMMParams& params, FLOPS_STRAT strat) {
         switch(strat) {
             case FLOPS_GLOB_DENSITY:
@@ -124,7 +126,8 @@ public:
         AIT totalBytes = bytesReadA + bytesReadB; //TODO: cast as whichever type is larger
 
         double memMovementTime = totalBytes/params.GetMemBW(); // memBW is MB/s==B/us
-        double computationTime = info->FLOPS * params.GetCostFLOP() + std::log2(info->nnzB);  //heap cost
+        double computationTime = (info->FLOPS * params.GetCostFLOP() + std::log2(info->nnzB)) /  //heap cost
+                                    params.ThreadSpeedup(info->threads);
                                                                                               
         //TODO: What about hashSpGEMM?
 
@@ -4,22 +4,29 @@
 
 
 #include <exception>
+#include <fstream>
+#include <sstream>
+#include <string>
+#include <map>
+#include <cmath>
 
 
+#define PINGPONG_ITERS 100
+#define PINGPONG_BYTES (1<<22)
+
 namespace autotuning {
 
 using namespace combblas;
 
 /* 
- * TODO: Topology specific params
- * TODO: intrasocket,intranode alpha/beta
+ * Intranode alpha and beta price messages between ranks of one node, SpGEMMParams::CommPlacement
+ * gives how a grid's communicators are split across nodes.
+ * TODO: intrasocket alpha/beta
  */
 
 class PlatformParams {
 public:
     
-    //TODO: Provide utilities for measuring members     
-
     PlatformParams(){}
 
     //alpha is us
@@ -28,7 +35,8 @@ public:
     PlatformParams(float internodeAlpha, float internodeBeta, float intranodeBeta, 
                     int coresPerNode, int devsPerNode, 
                     long peakFLOPS, float costFLOP, long memBW, float costMem): 
-        internodeAlpha(internodeAlpha), internodeBeta(internodeBeta), intranodeBeta(intranodeBeta), 
+        internodeAlpha(internodeAlpha), internodeBeta(internodeBeta), 
+        intranodeAlpha(internodeAlpha), intranodeBeta(intranodeBeta), 
 
         coresPerNode(coresPerNode), devsPerNode(devsPerNode),
 
@@ -38,6 +46,7 @@ public:
     
     inline float GetInternodeAlpha() const {return internodeAlpha;} 
     inline float GetInternodeBeta() const {return internodeBeta;} 
+    inline float GetIntranodeAlpha() const {return intranodeAlpha;}
     inline float GetIntranodeBeta() const {return intranodeBeta;}
     inline int GetCoresPerNode() const {return coresPerNode;}
     inline int GetDevsPerNode() const {return devsPerNode;}
@@ -47,9 +56,182 @@ public:
     inline float GetCostFLOP() const {return costFLOP;}
     inline long GetMemBW() const {return memBW;}
     inline float GetCostMem() const {return costMem;}
+
+
+    /* Speedup of the local multiply on threads threads per rank over one thread: threads times the
+     * calibrated parallel efficiency, interpolated in log2(threads). Past the largest calibrated count
+     * the speedup stays flat. Without a curve, or for threads<=1, it is 1 and costFLOP is per rank.
+     * With a curve costFLOP is the single thread cost, see SpGEMMParams::ThreadsPerRank. */
+    float ThreadSpeedup(int threads) const {
+
+        if (threads<=1 || threadEfficiency.empty())
+            return 1;
+
+        auto first = threadEfficiency.begin();
+        auto last = std::prev(threadEfficiency.end());
+
+        if (threads<=first->first)
+            return threads * first->second;
+        if (threads>=last->first)
+            return last->first * last->second;
+
+        auto high = threadEfficiency.upper_bound(threads);
+        auto low = std::prev(high);
+        double w = (std::log2(threads) - std::log2(low->first)) / (std::log2(high->first) - std::log2(low->first));
+
+        return threads * (low->second*(1-w) + high->second*w);
+    }
+
+    inline bool HasThreadCurve() const {return !threadEfficiency.empty();}
+    inline const std::map<int,float>& GetThreadEfficiency() const {return threadEfficiency;}
     
-    float MeasureInternodeAlpha() {throw std::runtime_error("Not implemented");}
-    float MeasureInternodeBeta() {throw std::runtime_error("Not implemented");}
+    /* MEASUREMENT */
+
+    /* All of these are collective over MPI_COMM_WORLD, set the member and return it.
+     * Internode ones need ranks on at least two nodes, intranode ones two ranks on rank 0's node. */
+
+    float MeasureInternodeAlpha() {
+        internodeAlpha = PingPongTime(InternodePartner(), 1, PINGPONG_ITERS);
+        return internodeAlpha;
+    }
+
+    float MeasureInternodeBeta() {
+        int partner = InternodePartner();
+        float t = PingPongTime(partner, PINGPONG_BYTES, PINGPONG_ITERS) - PingPongTime(partner, 1, PINGPONG_ITERS);
+        internodeBeta = PINGPONG_BYTES / t;
+        return internodeBeta;
+    }
+
+    float MeasureIntranodeAlpha() {
+        intranodeAlpha = PingPongTime(IntranodePartner(), 1, PINGPONG_ITERS);
+        return intranodeAlpha;
+    }
+
+    float MeasureIntranodeBeta() {
+        int partner = IntranodePartner();
+        float t = PingPongTime(partner, PINGPONG_BYTES, PINGPONG_ITERS) - PingPongTime(partner, 1, PINGPONG_ITERS);
+        intranodeBeta = PINGPONG_BYTES / t;
+        return intranodeBeta;
+    }
+
+
+    /* One way time in us of a bytes sized message between rank 0 and partner, averaged over iters
+     * round trips. Every rank gets the result. */
+    static float PingPongTime(int partner, size_t bytes, int iters) {
+
+        int myRank;
+        MPI_Comm_rank(MPI_COMM_WORLD, &myRank);
+
+        ASSERT(partner>0, "No rank to ping-pong with");
+
+        std::vector<char> buf(bytes);
+        double time = 0;
+
+        MPI_Barrier(MPI_COMM_WORLD);
+
+        if (myRank==0 || myRank==partner) {
+            int other = (myRank==0) ? partner : 0;
+            // First round trip is warmup
+            double stime = 0;
+            for (int i=0; i<=iters; i++) {
+                if (i==1) stime = MPI_Wtime();
+                if (myRank==0) {
+                    MPI_Send(buf.data(), bytes, MPI_CHAR, other, 0, MPI_COMM_WORLD);
+                    MPI_Recv(buf.data(), bytes, MPI_CHAR, other, 0, MPI_COMM_WORLD, MPI_STATUS_IGNORE);
+                } else {
+                    MPI_Recv(buf.data(), bytes, MPI_CHAR, other, 0, MPI_COMM_WORLD, MPI_STATUS_IGNORE);
+                    MPI_Send(buf.data(), bytes, MPI_CHAR, other, 0, MPI_COMM_WORLD);
+                }
+            }
+            time = ((MPI_Wtime() - stime) / (2.0*iters)) * 1e6;
+        }
+
+        MPI_Bcast(&time, 1, MPI_DOUBLE, 0, MPI_COMM_WORLD);
+
+        return time;
+    }
+
+
+    /* First rank on another node than rank 0, -1 if there is none */
+    static int InternodePartner() {
+        std::vector<int> leaders = NodeLeaders();
+        for (int r=1; r<leaders.size(); r++) {
+            if (leaders[r]!=leaders[0]) return r;
+        }
+        return -1;
+    }
+
+    /* First rank other than rank 0 on rank 0's node, -1 if there is none */
+    static int IntranodePartner() {
+        std::vector<int> leaders = NodeLeaders();
+        for (int r=1; r<leaders.size(); r++) {
+            if (leaders[r]==leaders[0]) return r;
+        }
+        return -1;
+    }
+
+    /* Lowest world rank on each rank's node, indexed by world rank */
+    static std::vector<int> NodeLeaders() {
+
+        int myRank, nRanks;
+        MPI_Comm_rank(MPI_COMM_WORLD, &myRank);
+        MPI_Comm_size(MPI_COMM_WORLD, &nRanks);
+
+        MPI_Comm localComm;
+        MPI_Comm_split_type(MPI_COMM_WORLD, MPI_COMM_TYPE_SHARED, myRank, MPI_INFO_NULL, &localComm);
+
+        int leader;
+        MPI_Allreduce(&myRank, &leader, 1, MPI_INT, MPI_MIN, localComm);
+        MPI_Comm_free(&localComm);
+
+        std::vector<int> leaders(nRanks);
+        MPI_Allgather(&leader, 1, MPI_INT, leaders.data(), 1, MPI_INT, MPI_COMM_WORLD);
+
+        return leaders;
+    }
+
+
+    /* PROFILES */
+
+    /* Read a profile written by tuning-experiments/calibrate_platform.py, one "<member> <value>" per line.
+     * Members missing from the file keep their value in defaults.
+     * threadEfficiency<threads> lines are points of the parallel efficiency curve. */
+    static PlatformParams LoadProfile(const std::string& path, const PlatformParams& defaults) {
+
+        PlatformParams params(defaults);
+
+        std::ifstream ifs(path);
+        ASSERT(ifs.good(), "Could not open platform profile " + path);
+
+        bool curveRead = false;
+
+        std::string line;
+        while (std::getline(ifs, line)) {
+            std::stringstream ss(line);
+            std::string key;
+            double value;
+            if (!(ss>>key>>value)) continue;
+
+            if (key=="internodeAlpha") params.internodeAlpha = value;
+            else if (key=="internodeBeta") params.internodeBeta = value;
+            else if (key=="intranodeAlpha") params.intranodeAlpha = value;
+            else if (key=="intranodeBeta") params.intranodeBeta = value;
+            else if (key=="coresPerNode") params.coresPerNode = value;
+            else if (key=="devsPerNode") params.devsPerNode = value;
+            else if (key=="peakFLOPS") params.peakFLOPS = value;
+            else if (key=="costFLOP") params.costFLOP = value;
+            else if (key=="memBW") params.memBW = value;
+            else if (key=="costMem") params.costMem = value;
+            else if (key.rfind("threadEfficiency", 0)==0) {
+                // A profile with a curve replaces the default one
+                if (!curveRead) params.threadEfficiency.clear();
+                curveRead = true;
+                params.threadEfficiency[std::stoi(key.substr(std::string("threadEfficiency").size()))] = value;
+            }
+        }
+
+        return params;
+    }
 
     
 
@@ -58,6 +240,7 @@ private:
     float internodeAlpha;
     float internodeBeta;
     
+    float intranodeAlpha;
     float intranodeBeta;
 
     int coresPerNode;
@@ -67,6 +250,9 @@ private:
     float costFLOP;
     long memBW;
     float costMem;
+
+    // threads per rank -> parallel efficiency of the local multiply
+    std::map<int,float> threadEfficiency;
     
 };
 
@@ -79,7 +265,7 @@ PlatformParams perlmutterParams(3.9, //alpha
                                 (3.5*1e9)*2*2*8, //peak FLOPS
                                 5.2e-9, //time for single FLOP in us, measured using simple benchmark 
                                 39598, //memBW, measured using STREAM
-                                1e-3   //cost for memory movement, right now totally random
+                                1e-3   //cost for memory movement, right now totally random, calibrate_platform.py fits it
                                 );
 PlatformParams fractusParams(4.2, //alpha
                              15676.06, //internode beta
@@ -0,0 +1,183 @@
+#ifndef SAMPLEDESTIMATION_H
+#define SAMPLEDESTIMATION_H
+
+#include <random>
+#include <vector>
+#include <tuple>
+#include <cmath>
+#include <cstdlib>
+
+#include "CombBLAS/CombBLAS.h"
+
+#define SAMPLE_DEFAULT_Z 1.96
+
+namespace autotuning {
+using namespace combblas;
+
+
+/* Estimates of the FLOPs and output nnz of a local multiply from a Bernoulli sample of B's columns,
+ * instead of the symbolic pass over every column that estimateFLOP/estimateNNZ_Hash make.
+ * The sum of a per column quantity over the sample is scaled by 1/rate (Horvitz-Thompson),
+ * and its variance is estimated by (1-rate)/rate^2 times the sum of squares over the sample.
+ * Enabled at runtime with AUTOTUNING_SAMPLE_RATE=<rate in (0,1)>, AUTOTUNING_SAMPLE_Z sets the
+ * z score of the confidence interval, 1.96 (95%) by default.
+ * Only depends on CombBLAS, so tuning-experiments can include it as well. */
+
+
+struct SampledEstimate {
+    double value = 0;
+    double variance = 0;
+    int64_t sampledCols = 0;
+
+    /* value +- HalfWidth(z) is the confidence interval */
+    inline double HalfWidth(float z) const {return z*std::sqrt(variance);}
+
+    /* Estimates from independent samples add, and so do their variances */
+    SampledEstimate& operator+=(const SampledEstimate& other) {
+        value += other.value;
+        variance += other.variance;
+        sampledCols += other.sampledCols;
+        return *this;
+    }
+};
+
+
+struct SamplingPolicy {
+    float rate = 1.0;
+    float z = SAMPLE_DEFAULT_Z;
+    uint64_t seed = 0;
+
+    inline bool Enabled() const {return rate>0 && rate<1;}
+
+    static SamplingPolicy FromEnv() {
+        SamplingPolicy policy;
+        const char * rateStr = std::getenv("AUTOTUNING_SAMPLE_RATE");
+        if (rateStr!=nullptr)
+            policy.rate = std::atof(rateStr);
+        const char * zStr = std::getenv("AUTOTUNING_SAMPLE_Z");
+        if (zStr!=nullptr)
+            policy.z = std::atof(zStr);
+        return policy;
+    }
+};
+
+
+/* Sampled FLOPs and, if countNnz, output nnz of A*B on local matrices.
+ * stream picks the random stream, so different stages and ranks draw different samples.
+ * Output nnz of a sampled column is counted exactly with a dense marker over A's rows. */
+template <typename ADER, typename BDER>
+std::pair<SampledEstimate, SampledEstimate> SampledFLOPNnz(ADER& A, BDER& B, const SamplingPolicy& policy,
+                                                            uint64_t stream, bool countNnz=true)
+{
+    typedef typename ADER::LocalIT LIA;
+    typedef typename ADER::SpColIter AColIter;
+
+    SampledEstimate flops, nnz;
+
+    // Nonempty columns of A, looked up by B's row ids
+    std::vector<int64_t> colPos(A.getncol(), -1);
+    std::vector<AColIter> aCols;
+    aCols.reserve(A.getnzc());
+    for (auto colIter = A.begcol(); colIter!=A.endcol(); colIter++) {
+        colPos[colIter.colid()] = aCols.size();
+        aCols.push_back(colIter);
+    }
+
+    // marker[row]==stamp if row is already in the current output column
+    std::vector<int64_t> marker(countNnz ? A.getnrow() : 0, -1);
+
+    std::mt19937_64 gen(policy.seed + stream);
+    std::bernoulli_distribution coin(policy.rate);
+
+    double scale = 1.0 / policy.rate;
+    double varScale = (1.0 - policy.rate) / (policy.rate*policy.rate);
+
+    for (auto colIter = B.begcol(); colIter!=B.endcol(); colIter++) {
+
+        if (!coin(gen)) continue;
+
+        int64_t stamp = flops.sampledCols++;
+        double colFlops = 0;
+        double colNnz = 0;
+
+        for (auto nzIter = B.begnz(colIter); nzIter!=B.endnz(colIter); nzIter++) {
+            int64_t pos = colPos[nzIter.rowid()];
+            if (pos<0) continue;
+
+            colFlops += aCols[pos].nnz();
+
+            if (!countNnz) continue;
+            for (auto aNzIter = A.begnz(aCols[pos]); aNzIter!=A.endnz(aCols[pos]); aNzIter++) {
+                LIA row = aNzIter.rowid();
+                if (marker[row]!=stamp) {
+                    marker[row] = stamp;
+                    colNnz++;
+                }
+            }
+        }
+
+        flops.value += colFlops*scale;
+        flops.variance += colFlops*colFlops*varScale;
+        nnz.value += colNnz*scale;
+        nnz.variance += colNnz*colNnz*varScale;
+    }
+
+    nnz.sampledCols = countNnz ? flops.sampledCols : 0;
+
+    return std::make_pair(flops, nnz);
+}
+
+
+/* Keep or drop decision for global column col, a hash of (seed, col) against rate.
+ * Every rank that holds a piece of col gets the same decision. */
+inline bool KeepColumn(const SamplingPolicy& policy, uint64_t col)
+{
+    // splitmix64 finalizer
+    uint64_t z = policy.seed + (col + 1) * 0x9e3779b97f4a7c15ULL;
+    z = (z ^ (z >> 30)) * 0xbf58476d1ce4e5b9ULL;
+    z = (z ^ (z >> 27)) * 0x94d049bb133111ebULL;
+    z = z ^ (z >> 31);
+    return (z >> 11) * (1.0 / 9007199254740992.0) < policy.rate; // top 53 bits as a double in [0,1)
+}
+
+
+/* B restricted to a Bernoulli sample of its global columns, distributed like B.
+ * A global column is split across every rank of its process column, so the sample is drawn
+ * on global column ids: all its pieces are kept or dropped together. Dropping only some pieces
+ * would still leave FLOPs unbiased, but not output nnz, which is a union over the pieces.
+ * FLOPs or output nnz of A times it, scaled by 1/rate, estimate those of A*B. */
+template <typename IT, typename NT, typename DER>
+SpParMat<IT,NT,DER> SampleColumns(SpParMat<IT,NT,DER>& B, const SamplingPolicy& policy)
+{
+    typedef typename DER::LocalIT LIT;
+
+    DER * locB = B.seqptr();
+
+    // Global id of the first local column, the local columns of the ranks before in the process row
+    uint64_t localCols = locB->getncol();
+    uint64_t colOffset = 0;
+    MPI_Exscan(&localCols, &colOffset, 1, MPI_UINT64_T, MPI_SUM, B.getcommgrid()->GetRowWorld());
+    if (B.getcommgrid()->GetRankInProcRow()==0)
+        colOffset = 0; // MPI_Exscan leaves it undefined on the first rank
+
+    std::vector<std::tuple<LIT,LIT,NT>> kept;
+    for (auto colIter = locB->begcol(); colIter!=locB->endcol(); colIter++) {
+        if (!KeepColumn(policy, colOffset + colIter.colid())) continue;
+        for (auto nzIter = locB->begnz(colIter); nzIter!=locB->endnz(colIter); nzIter++) {
+            kept.push_back(std::make_tuple(nzIter.rowid(), colIter.colid(), nzIter.value()));
+        }
+    }
+
+    auto tuples = new std::tuple<LIT,LIT,NT>[kept.size()];
+    std::copy(kept.begin(), kept.end(), tuples);
+
+    // Columns were visited in order, so the tuples are already column sorted
+    SpTuples<LIT,NT> spTuples(kept.size(), locB->getnrow(), locB->getncol(), tuples, true, true);
+
+    return SpParMat<IT,NT,DER>(new DER(spTuples, false), B.getcommgrid());
+}
+
+
+}//autotuning
+
+#endif
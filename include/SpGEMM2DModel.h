@@ -11,6 +11,7 @@
 #include "MergeModel.h"
 #include "SpGEMMParams.h"
 #include "PlatformParams.h"
+#include "SampledEstimation.h"
 
 
 namespace autotuning {
@@ -47,6 +48,14 @@ public:
         return static_cast<MT*>(this)->PredictImpl(inputs, params);
     }
 
+    /* Predict for a single config without the timer, trace span and info block Predict wraps around
+     * the whole search space, for searches that evaluate configs one at a time and time themselves.
+     * The caller writes the info block. */
+    template <typename I>
+    float PredictOne(I& inputs, SpGEMMParams& params) {
+        return static_cast<MT*>(this)->PredictOneImpl(inputs, params);
+    }
+
     std::vector<float> Predict(std::vector<float>& X) {
         return static_cast<MT*>(this)->PredictImpl(X);
     }
@@ -62,11 +71,36 @@ public:
         return static_cast<MT*>(this)->MakeFeatureMatImpl(inputs,params);
     }
 
+    /* Cheap lower bound on Predict for every entry of params, used to prune the search space */
+    template <typename I>
+    std::vector<float> LowerBound(I& inputs, std::vector<SpGEMMParams>& params) {
+        return static_cast<MT*>(this)->LowerBoundImpl(inputs, params);
+    }
+
+    /* Comm model with the platform's internode and intranode alpha and beta */
+    template <typename IT>
+    PostCommModel<IT> MakeCommModel() const {
+        return PostCommModel<IT>(platformParams.GetInternodeAlpha(), platformParams.GetInternodeBeta(),
+                                 platformParams.GetIntranodeAlpha(), platformParams.GetIntranodeBeta());
+    }
+
     //TODO: replace this with somethine non-embarrassing 
 #ifdef PROFILE
     void WritePrediction(std::vector<SpGEMMParams>& searchSpace, std::vector<float>& predictions) {
-        infoPtr->OFS()<<"----RUNTIME ESTIMATES----"<<std::endl;
         ASSERT(searchSpace.size()==predictions.size(), "sizes not equal");
+        if (infoPtr->Jsonl()) {
+            infoPtr->OFS()<<"{\"section\":\"estimates\",\"rank\":"<<infoPtr->Rank()<<",\"configs\":[";
+            for (int i=0; i<searchSpace.size(); i++) {
+                infoPtr->OFS()<<(i ? "," : "")<<"\""<<searchSpace[i]<<"\"";
+            }
+            infoPtr->OFS()<<"],\"runtimes\":[";
+            for (int i=0; i<predictions.size(); i++) {
+                infoPtr->OFS()<<(i ? "," : "")<<predictions[i]/1e6;
+            }
+            infoPtr->OFS()<<"]}"<<std::endl;
+            return;
+        }
+        infoPtr->OFS()<<"----RUNTIME ESTIMATES----"<<std::endl;
         for (int i=0; i<searchSpace.size(); i++) {
             infoPtr->OFS()<<searchSpace[i]<<":"<<predictions[i]/1e6<<"s ";
         }
@@ -84,7 +118,12 @@ protected:
 class SpGEMM2DModelAnalytical : public SpGEMM2DModel<SpGEMM2DModelAnalytical> {
 public:
 
-    void CreateImpl() {}
+    // AUTOTUNING_BCAST_TABLE=<path> replaces the tree bcast formula with measured times
+    void CreateImpl() {
+        const char * tablePath = std::getenv("AUTOTUNING_BCAST_TABLE");
+        if (tablePath!=nullptr)
+            bcastTable.reset(new BcastTable(std::string(tablePath)));
+    }
     
     template <typename IT, typename NT, typename DER>
     class SpParMatInfoAnalytical : public SpParMatInfo<IT,NT,DER> {
@@ -111,7 +150,7 @@ public:
         
         //TODO: Make this not a pointer
         SpParMatInfoAnalytical(SpParMat<IT,NT,DER> * Mat): 
-            SpParMatInfo<IT,NT,DER>(Mat)
+            SpParMatInfo<IT,NT,DER>(Mat), nnzArr(new std::vector<IT>)
         {
             
 
@@ -223,111 +262,62 @@ public:
         }
 
 
-        void ComputeNnzArr(SpGEMMParams& params) {
+        /* Collective. Nnz per process of every grid in searchSpace, from one histogram fine enough for all of them */
+        void ComputeNnzHistogram(std::vector<SpGEMMParams>& searchSpace) {
 
 #ifdef PROFILE
-            infoPtr->StartTimer("ComputeNnzArr");
+            infoPtr->StartTimer("ComputeNnzHistogram");
 #endif
+            TRACE_BEGIN("ComputeNnzHistogram");
 
-            nnzArr->clear();
-            nnzArr->resize(params.GetTotalProcs());
-
-            switch(split) {
-                case COL_SPLIT:
-                {
-                    ComputeNnzArrColSplit(params);
-                    break;
-                }
-                case ROW_SPLIT:
-                {
-                    ComputeNnzArrRowSplit(params);
-                    break;
-                }
-                default:
-                {
-                    UNREACH_ERR();
-                }
+            // Grid dims and layers are powers of two, so the largest count in each dimension is divisible by the rest
+            int rowBins = std::max(nnzHist.GetRowBins(), 1);
+            int colBins = std::max(nnzHist.GetColBins(), 1);
+            for (auto& params : searchSpace) {
+                auto bins = NnzHistogram<IT>::BinsFor(params, split);
+                rowBins = std::max(rowBins, bins.first);
+                colBins = std::max(colBins, bins.second);
             }
 
+            // Spans the rows and columns of the current 2D grid, as ComputeOwnerGrid does
+            IT procDim2D = RoundedSqrt<IT,IT>(worldSize);
+            nnzHist.Compute(locMat, colRank*locNrows, rowRank*locNcols, procDim2D*locNrows, procDim2D*locNcols,
+                            rowBins, colBins);
+
+            TRACE_END();
 #ifdef PROFILE
-            infoPtr->EndTimer("ComputeNnzArr");
+            infoPtr->EndTimer("ComputeNnzHistogram");
 #endif
 
         }
 
-        
-        /* Given local nnz in initial 2D processor grid, compute nnz per processor in 3D processr grid
-         * WITHOUT explicitly forming the 3D processor grid. */
-        void ComputeNnzArrColSplit(SpGEMMParams& params) {
-
-            const int totalProcs = params.GetTotalProcs();
-
-#ifdef NNZ_TUPLES_COL
-            // Local nnz array
-            std::for_each(nnzTuples->begin(), nnzTuples->end(),
-                [&params,this](auto& t) {
-                    int i = std::get<0>(t);
-                    int j = std::get<1>(t);
-                    int owner = ComputeOwnerGrid(params, i*this->locNrows, j, COL_SPLIT);
-                    this->nnzArr->at(owner) += std::get<2>(t);
-                }
-            );
-#else
-            // Just use local matrix
-            for (auto colIter = locMat->begcol(); colIter!=locMat->endcol(); colIter++) {
-                int j = colIter.colid();
-                for (auto nzIter = locMat->begnz(colIter); nzIter!=locMat->endnz(colIter); nzIter++) {
-                    int i = nzIter.rowid();
-                    int owner = ComputeOwnerGrid(params, i+(colRank*locNrows), j+(rowRank*locNcols), COL_SPLIT);
-                    nnzArr->at(owner) += 1;
-                }
-            }
-#endif
 
-            // Allreduce to get complete counts for each process
-            MPI_Allreduce(MPI_IN_PLACE, (void*)(nnzArr->data()), totalProcs, MPIType<IT>(), MPI_SUM, MPI_COMM_WORLD);
+        /* Nnz per process in params's grid. Coarsens the histogram, which is only recomputed if it is too coarse */
+        void ComputeNnzArr(SpGEMMParams& params) {
 
-#ifdef DEBUG
-         debugPtr->LogVecSameLine(*nnzArr, std::string{"nnzArr A: "});
+#ifdef PROFILE
+            infoPtr->StartTimer("ComputeNnzArr");
 #endif
+            TRACE_BEGIN("ComputeNnzArr");
 
-        }
-        
-
-
-        void ComputeNnzArrRowSplit(SpGEMMParams& params) {
-
-            const int totalProcs = params.GetTotalProcs();
-
-#ifdef NNZ_TUPLES_ROW
-            // Local data
-            std::for_each(nnzTuples->begin(), nnzTuples->end(),
-                [&params, this](auto& t) {
-                    int i = std::get<0>(t);
-                    int j = std::get<1>(t);
-                    int owner = ComputeOwnerGrid(params, i, j*this->locNcols, ROW_SPLIT);
-                    this->nnzArr->at(owner) += std::get<2>(t);
-                }
-            );
-#else
-            for (auto colIter = locMat->begcol(); colIter!=locMat->endcol(); colIter++) {
-                int j = colIter.colid();
-                for (auto nzIter = locMat->begnz(colIter); nzIter!=locMat->endnz(colIter); nzIter++) {
-                    int i = nzIter.rowid();
-                    int owner = ComputeOwnerGrid(params, i+(colRank*locNrows), j+(rowRank*locNcols), ROW_SPLIT);
-                    nnzArr->at(owner) += 1;
-                }
+            if (!nnzHist.Covers(params, split)) {
+                std::vector<SpGEMMParams> single {params};
+                ComputeNnzHistogram(single);
             }
-#endif
 
-            // Allreduce to sum all nnz
-            MPI_Allreduce(MPI_IN_PLACE, (void*)(nnzArr->data()), totalProcs, MPIType<IT>(), MPI_SUM, MPI_COMM_WORLD);
+            *nnzArr = nnzHist.Coarsen(params, split);
 
 #ifdef DEBUG
-            debugPtr->LogVecSameLine(*nnzArr, std::string{"nnzArr B: "});
+            debugPtr->LogVecSameLine(*nnzArr, std::string{"nnzArr: "});
+#endif
+
+            TRACE_END();
+#ifdef PROFILE
+            infoPtr->EndTimer("ComputeNnzArr");
 #endif
 
         }
+
         
         IT ComputeLocNnzGrid(NNZ_STRAT strat, int procRank) {
             switch(strat) {
@@ -406,6 +396,9 @@ public:
 
         // Stores nnz per processor in hypothetical 3D grid
         std::vector<IT> * nnzArr;
+
+        // Nnz over the finest grid needed so far, nnzArr is coarsened from it
+        NnzHistogram<IT> nnzHist;
         
 
     };
@@ -423,6 +416,12 @@ public:
         {
         }
 
+        /* Collective. After this, ComputeNnzArr needs no communication for any params in searchSpace */
+        void ComputeNnzHistograms(std::vector<SpGEMMParams>& searchSpace) {
+            Ainfo.ComputeNnzHistogram(searchSpace);
+            Binfo.ComputeNnzHistogram(searchSpace);
+        }
+
         SpParMatInfoAnalytical<AIT,ANT,ADER> Ainfo;
         SpParMatInfoAnalytical<BIT,BNT,BDER> Binfo;
     };
@@ -438,23 +437,15 @@ public:
 #ifdef PROFILE
         infoPtr->StartTimerGlobal("Prediction");
 #endif
+        TRACE_BEGIN("Prediction");
 
         std::transform(searchSpace.begin(), searchSpace.end(), times.begin(),
             [&inputs, this](auto& params) {
-
-				auto bcastTime = this->BcastTime<AIT, ANT>(inputs, params); 
-                auto localSpGEMMTime = this->LocalSpGEMMTime(inputs, params);
-                auto mergeTime = this->MergeTime(inputs, params);
-#ifdef PROFILE
-                infoPtr->Put("Params", params.OutStr());
-                infoPtr->Put("PredBcastTime", bcastTime);
-                infoPtr->Put("PredLocalSpGEMMTime", localSpGEMMTime);
-                infoPtr->Put("PredMergeTime", mergeTime);
-#endif
-                return bcastTime + localSpGEMMTime + mergeTime;
+                return this->PredictOneImpl(inputs, params);
             }
         );
 
+        TRACE_END();
 #ifdef PROFILE
         infoPtr->WriteInfo();
         infoPtr->EndTimerGlobal("Prediction");
@@ -464,19 +455,36 @@ public:
     }
 
 
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    float PredictOneImpl(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, SpGEMMParams& params) {
+
+        auto bcastTime = this->BcastTime<AIT, ANT>(inputs, params); 
+        auto localSpGEMMTime = this->LocalSpGEMMTime(inputs, params);
+        auto mergeTime = this->MergeTime(inputs, params);
+#ifdef PROFILE
+        infoPtr->Put("Params", params.OutStr());
+        infoPtr->Put("PredBcastTime", bcastTime);
+        infoPtr->Put("PredLocalSpGEMMTime", localSpGEMMTime);
+        infoPtr->Put("PredMergeTime", mergeTime);
+#endif
+        return bcastTime + localSpGEMMTime + mergeTime;
+
+    }
+
+
     /* BROADCAST */
 
     //TODO: Consider nnz estimator class + template to make switching between things here easier
     template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
     float BcastTime(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, SpGEMMParams& params) {
 
-		auto Ainfo = inputs.Ainfo;
-		auto Binfo = inputs.Binfo;
-		
-        auto TreeBcast = [this](int commSize, AIT msgSize) {
-            float alpha = this->platformParams.GetInternodeAlpha() * std::log2(commSize);
-            float beta = (std::log2(commSize) * msgSize) / this->platformParams.GetInternodeBeta();
-            return (alpha + beta) / (1e6);
+		auto& Ainfo = inputs.Ainfo;
+		auto& Binfo = inputs.Binfo;
+
+        // A is broadcast along process rows and B along process columns, which can share nodes
+        PostCommModel<AIT> commModel = this->MakeCommModel<AIT>();
+        auto TreeBcast = [&commModel](std::pair<int,int> placement, AIT msgSize) {
+            return HierarchicalBcastTime(msgSize, placement, commModel) / (1e6);
         };
 
         auto MsgSize = [](AIT nnz) {
@@ -490,9 +498,14 @@ public:
 		
 		AIT bytesA = MsgSize(nnzA);
 		BIT bytesB = MsgSize(nnzB);
+
+        if (bcastTable) {
+            return ((bcastTable->Time(bytesA, params.GetGridDim()) + 
+                    bcastTable->Time(bytesB, params.GetGridDim())) / 1e6) * params.GetGridDim();
+        }
 		
-		double bcastA = TreeBcast(params.GetGridDim(), bytesA);
-		double bcastB = TreeBcast(params.GetGridDim(), bytesB);
+		double bcastA = TreeBcast(params.RowCommPlacement(), bytesA);
+		double bcastB = TreeBcast(params.ColCommPlacement(), bytesB);
 		
 		return (bcastA + bcastB) * params.GetGridDim();
 
@@ -503,8 +516,8 @@ public:
     
     template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
     float LocalSpGEMMTime(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, SpGEMMParams& params) {
-		auto Ainfo = inputs.Ainfo;
-		auto Binfo = inputs.Binfo;
+		auto& Ainfo = inputs.Ainfo;
+		auto& Binfo = inputs.Binfo;
 		
 		auto FLOPS = [](float c, AIT n, int p){
             float singleMultTime = 2.0*(std::min(1.0, (c/(std::sqrt(p))))) +
@@ -513,8 +526,9 @@ public:
             return singleMultTime * std::sqrt(p);
 		};
 
+        // Threads of a rank split its local multiply
         return FLOPS(Ainfo.GetGlobDensity()*Ainfo.GetNcols(), Ainfo.GetNcols(), params.GetTotalProcs())*
-                        this->platformParams.GetCostFLOP();
+                        this->platformParams.GetCostFLOP() / this->platformParams.ThreadSpeedup(params.ThreadsPerRank(this->platformParams));
 
     }
 
@@ -523,8 +537,8 @@ public:
     template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
     float MergeTime(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, SpGEMMParams& params) {
 
-		auto Ainfo = inputs.Ainfo;
-		auto Binfo = inputs.Binfo;
+		auto& Ainfo = inputs.Ainfo;
+		auto& Binfo = inputs.Binfo;
 
         auto FLOPS = [](float c, AIT n, int p) {
             return (std::pow(c,2.0)*n*std::log2(std::sqrt(p))) / p;
@@ -534,6 +548,80 @@ public:
                     params.GetTotalProcs())*
                     this->platformParams.GetCostFLOP();
     }
+
+
+    /* LOWER BOUND */
+
+    /* Bandwidth-only broadcast plus a FLOP bound on the local multiply. 
+     * Each term is at most the matching term of PredictImpl, and MergeTime is never negative,
+     * so the sum never exceeds the full prediction. */
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    std::vector<float> LowerBoundImpl(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, std::vector<SpGEMMParams>& searchSpace) {
+
+        std::vector<float> bounds(searchSpace.size());
+
+        std::transform(searchSpace.begin(), searchSpace.end(), bounds.begin(),
+            [&inputs, this](auto& params) {
+                // Measured bcast times have no latency term to drop, so the bound uses them as is
+                float bcastBound = this->bcastTable ? this->BcastTime<AIT, ANT>(inputs, params)
+                                                    : this->BcastBandwidthTime<AIT, ANT>(inputs, params);
+                return bcastBound + this->LocalFLOPBound(inputs, params);
+            }
+        );
+
+        return bounds;
+
+    }
+
+
+    /* BcastTime without the latency term */
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    float BcastBandwidthTime(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, SpGEMMParams& params) {
+
+		auto& Ainfo = inputs.Ainfo;
+		auto& Binfo = inputs.Binfo;
+
+        PostCommModel<AIT> commModel = this->MakeCommModel<AIT>();
+        auto TreeBcastBW = [&commModel](std::pair<int,int> placement, AIT msgSize) {
+            return HierarchicalBcastTime(msgSize, placement, commModel, false) / (1e6);
+        };
+
+        auto MsgSize = [](AIT nnz) {
+            return nnz*sizeof(ANT) + nnz*sizeof(AIT) + (nnz + 1) * sizeof(AIT);
+        };
+
+        float c = (float)(Ainfo.GetNnz()) / (float)(Ainfo.GetNcols());
+
+        AIT nnzA = (c*Ainfo.GetNcols()) / params.GetTotalProcs();
+        BIT nnzB = (c*Binfo.GetNcols()) / params.GetTotalProcs();
+
+        return (TreeBcastBW(params.RowCommPlacement(), MsgSize(nnzA)) + 
+                TreeBcastBW(params.ColCommPlacement(), MsgSize(nnzB))) * params.GetGridDim();
+
+    }
+
+
+    /* The c^2n/p multiply-adds of LocalSpGEMMTime, scaled by its log factor only when that is below 1 */
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    float LocalFLOPBound(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, SpGEMMParams& params) {
+
+		auto& Ainfo = inputs.Ainfo;
+
+        float c = Ainfo.GetGlobDensity()*Ainfo.GetNcols();
+        AIT n = Ainfo.GetNcols();
+        int p = params.GetTotalProcs();
+
+        float flops = (std::pow(c,2.0)*n) / p;
+        float logFactor = std::log2(std::min(n/std::sqrt(p), (std::pow(c,2.0)*n)/(std::sqrt(p)*p)));
+
+        return flops * std::min(1.0f, logFactor) * this->platformParams.GetCostFLOP() /
+                this->platformParams.ThreadSpeedup(params.ThreadsPerRank(this->platformParams));
+
+    }
+
+private:
+
+    std::shared_ptr<BcastTable> bcastTable;
  
 };
 
@@ -633,6 +721,7 @@ public:
 #ifdef PROFILE
         infoPtr->StartTimerGlobal("Prediction");
 #endif
+        TRACE_BEGIN("Prediction");
 
         std::vector<float> allTimes(0);
         
@@ -665,6 +754,7 @@ public:
             }
         );
 
+        TRACE_END();
 #ifdef PROFILE
         infoPtr->EndTimerGlobal("Prediction");
 #endif
@@ -690,8 +780,8 @@ public:
         infoPtr->StartTimer("FeatureCollection");
 #endif
 
-        auto Ainfo = inputs.Ainfo;
-        auto Binfo = inputs.Binfo;
+        auto& Ainfo = inputs.Ainfo;
+        auto& Binfo = inputs.Binfo;
 
         std::vector<LocInfo_t *> featureMat(nFeatures*params.GetTotalProcs());
 
@@ -877,7 +967,7 @@ public:
         inline float GetMaxDensityCol() const {return maxDensityCol;}
         inline float GetStdevDensityCol() const {return stdevDensityCol;}
 
-        inline std::map<std::string, float> GetFeatureMap() const {return featureMap;} 
+        inline const std::map<std::string, float>& GetFeatureMap() const {return featureMap;} 
 
     private:
 
@@ -900,28 +990,69 @@ public:
         Inputs(SpParMat<AIT,ANT,ADER>& A, SpParMat<BIT,BNT,BDER>& B):
             Ainfo(A),Binfo(B)
         {
+            // Looked up once here instead of once per config
+            auto& featureMapA = Ainfo.GetFeatureMap();
+            auto& featureMapB = Binfo.GetFeatureMap();
+            matFeatures.reserve(2*FeatureOrder().size());
+            for (auto& featureName : FeatureOrder()) {
+                // Order is always feature-A, feature-B
+                matFeatures.push_back(featureMapA.at(featureName));
+                matFeatures.push_back(featureMapB.at(featureName));
+            }
+
+            // Column features are only reduced along process rows, so rank 0's are used everywhere
+            MPI_Bcast((void*)(matFeatures.data()), matFeatures.size(), MPI_FLOAT, 0, A.getcommgrid()->GetWorld());
         }
 
         SpParMatInfoXgb<AIT,ANT,ADER> Ainfo;
         SpParMatInfoXgb<BIT,BNT,BDER> Binfo;
+
+        // Features of A and B in FeatureOrder, the part of a feature matrix row shared by every config
+        std::vector<float> matFeatures;
         
     };
 
+
+    /* Per matrix features in the order the model was trained with */
+    static const std::vector<std::string>& FeatureOrder() {
+        static const std::vector<std::string> featureOrder{
+            "avgDensityCol",
+            "avgNnzCol",
+            "density",
+            "m",
+            "maxDensityCol",
+            "maxNnzCol",
+            "minDensityCol",
+            "minNnzCol",
+            "n",
+            "nnz",
+            "stdevDensityCol",
+            "stdevNnzCol"
+        };
+        return featureOrder;
+    }
+
+
     std::vector<float> PredictImpl(std::vector<float>& X) {
 
-        // Create DMat
         int nSamples = X.size() / nFeatures;
-        DMatrixHandle dMatHandle;
-        XGB_CHECK(XGDMatrixCreateFromMat(X.data(), nSamples, nFeatures, 0.0, &dMatHandle)); 
 
-        // Make prediction
+        // Array interface over X, so the booster reads it in place instead of through a DMatrix
+        std::stringstream arrayInterface;
+        arrayInterface<<"{\"data\": ["<<reinterpret_cast<uintptr_t>(X.data())<<", true], "
+                        <<"\"shape\": ["<<nSamples<<", "<<nFeatures<<"], "
+                        <<"\"typestr\": \"<f4\", \"version\": 3}";
+        std::string values = arrayInterface.str();
+
+        // Make prediction, zeros are missing values as in XGDMatrixCreateFromMat
         char const config[] =
         "{\"training\": false, \"type\": 0, "
-        "\"iteration_begin\": 0, \"iteration_end\": 0, \"strict_shape\": false}";
+        "\"iteration_begin\": 0, \"iteration_end\": 0, \"strict_shape\": false, "
+        "\"cache_id\": 0, \"missing\": 0.0}";
         bst_ulong outDim;
         const bst_ulong * outShape; 
         const float * prediction;
-        XGB_CHECK(XGBoosterPredictFromDMatrix(bstHandle, dMatHandle, config, &outShape, &outDim, &prediction));
+        XGB_CHECK(XGBoosterPredictFromDense(bstHandle, values.c_str(), config, nullptr, &outShape, &outDim, &prediction));
 
         return std::vector<float>(prediction, prediction+nSamples);
 
@@ -932,49 +1063,25 @@ public:
     std::vector<float> MakeFeatureMatImpl(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, 
                                             std::vector<SpGEMMParams>& searchSpace) {
 
-        auto Ainfo = inputs.Ainfo;
-        auto Binfo = inputs.Binfo;
+        auto& matFeatures = inputs.matFeatures;
         
         int nSamples = searchSpace.size();
 
-        // Feature order
-        std::vector<std::string> featureOrder{
-            "avgDensityCol",
-            "avgNnzCol",
-            "density",
-            "m",
-            "maxDensityCol",
-            "maxNnzCol",
-            "minDensityCol",
-            "minNnzCol",
-            "n",
-            "nnz",
-            "stdevDensityCol",
-            "stdevNnzCol"
-        };
+        ASSERT(2 + matFeatures.size()==nFeatures,
+            "Model expects " + std::to_string(nFeatures) + " features, but got " + std::to_string(2 + matFeatures.size()));
 
         // Each row is a sample
-        std::vector<float> featureMat;
-        featureMat.reserve(nSamples*nFeatures);
+        std::vector<float> featureMat(nSamples*nFeatures);
 
-        //TODO: There has to be a better way to do this
-        // Populate the feature matrix
         for (int i=0; i<nSamples; i++) {
 
+            auto row = featureMat.begin() + i*nFeatures;
+
             // Nodes and PPN always go first
-            auto currParams = searchSpace[i];
-            featureMat.push_back(currParams.GetNodes());
-            featureMat.push_back(currParams.GetPPN());
-            
-            // Iterate through features in this sample according to feature order defined earlier
-            // and push them onto the matrix
-            std::for_each(featureOrder.begin(), featureOrder.end(),
-                [&featureMat, &Ainfo, &Binfo](auto& featureName) {
-                    // Order is always feature-A, feature-B
-                    featureMat.push_back(Ainfo.GetFeatureMap()[featureName]);
-                    featureMat.push_back(Binfo.GetFeatureMap()[featureName]);
-                }
-            );
+            row[0] = searchSpace[i].GetNodes();
+            row[1] = searchSpace[i].GetPPN();
+
+            std::copy(matFeatures.begin(), matFeatures.end(), row + 2);
         }
 
 
@@ -1064,6 +1171,7 @@ public:
 #ifdef PROFILE
             infoPtr->StartTimerGlobal("FeatureInit");
 #endif
+            TRACE_BEGIN("FeatureInit");
 
             //ComputeProblemStats(A,B,&outputNnzFinal,&outputNnzIntermediate,&FLOPS);
             ComputeProblemStatsOneSided(A,B, &outputNnzFinal, &outputNnzIntermediate,
@@ -1090,6 +1198,7 @@ public:
             MPI_Allgather((void*)(sendBuf.data()), sendBuf.size(), MPI_FLOAT, (void*)(globalFeatures.data()),
                         sendBuf.size(), MPI_FLOAT, Ainfo.gridComm);
 
+            TRACE_END();
 #ifdef PROFILE
             infoPtr->EndTimerGlobal("FeatureInit");
 #endif
@@ -1323,10 +1432,22 @@ public:
 			double flopTime = 0;
 			double nnzTime = 0;
             
-            LIB flopCLocal = 0;
-            LIB * colFlopC = estimateFLOP(*(A.seqptr()), *(B.seqptr()), &flopCLocal);
+            // With sampling, FLOPs and nnz come from a sample of B's columns instead of a symbolic multiply
+            SamplingPolicy sampling = SamplingPolicy::FromEnv();
+            SampledEstimate flopEst, nnzEst, flopEstLocal;
+            uint64_t streamBase = static_cast<uint64_t>(A.getcommgrid()->GetRank()) * stages;
 
-            *nnzC_local = estimateNNZ_HashFast(*(A.seqptr()), *(B.seqptr()), colFlopC);
+            LIB flopCLocal = 0;
+            if (sampling.Enabled()) {
+                auto est = SampledFLOPNnz(*(A.seqptr()), *(B.seqptr()), sampling, streamBase + Aself);
+                flopCLocal = est.first.value;
+                *nnzC_local = est.second.value;
+                flopEstLocal = est.first;
+                nnzEst += est.second;
+            } else {
+                LIB * colFlopC = estimateFLOP(*(A.seqptr()), *(B.seqptr()), &flopCLocal);
+                *nnzC_local = estimateNNZ_HashFast(*(A.seqptr()), *(B.seqptr()), colFlopC);
+            }
 
 			for(int i = 0; i < stages; ++i)
 			{
@@ -1358,12 +1479,19 @@ public:
                 if (i==Aself && i==Bself) {
                     nnzC = *nnzC_local;
                     *FLOPS_local += flopCLocal;
+                    flopEst += flopEstLocal;
                 } else {
 #ifdef PROFILE
                     t0 = MPI_Wtime();
 #endif
                     LIB flopC = 0;
-                    LIB * colFlopC = estimateFLOP(*ARecv, *BRecv, &flopC);
+                    if (sampling.Enabled()) {
+                        auto est = SampledFLOPNnz(*ARecv, *BRecv, sampling, streamBase + i, false);
+                        flopC = est.first.value;
+                        flopEst += est.first;
+                    } else {
+                        LIB * colFlopC = estimateFLOP(*ARecv, *BRecv, &flopC);
+                    }
                     *FLOPS_local += flopC;
 #ifdef PROFILE
                     t1 = MPI_Wtime();
@@ -1400,6 +1528,11 @@ public:
 
 #ifdef PROFILE
             infoPtr->PutGlobal("FeatureFetchTime", std::to_string(fetchTime));
+            if (sampling.Enabled()) {
+                infoPtr->PutGlobal("FeatureSampleRate", std::to_string(sampling.rate));
+                infoPtr->PutGlobal("FeatureFLOPHalfWidth", std::to_string(flopEst.HalfWidth(sampling.z)));
+                infoPtr->PutGlobal("FeatureNnzHalfWidth", std::to_string(nnzEst.HalfWidth(sampling.z)));
+            }
             infoPtr->PutGlobal("FeatureNnzInit", std::to_string(nnzTime));
             infoPtr->PutGlobal("FeatureFLOPInit", std::to_string(flopTime));
 #endif
@@ -1428,6 +1561,7 @@ public:
 #ifdef PROFILE
         infoPtr->StartTimerGlobal("Prediction");
 #endif
+        TRACE_BEGIN("Prediction");
 
         std::transform(searchSpace.begin(), searchSpace.end(), times.begin(),
             [&inputs, this](auto& params) {
@@ -1468,6 +1602,7 @@ public:
             }
         );
 
+        TRACE_END();
 #ifdef PROFILE
         infoPtr->EndTimerGlobal("Prediction");
 #endif
@@ -1485,8 +1620,8 @@ public:
         infoPtr->StartTimer("FeatureCollection");
 #endif
 
-        auto Ainfo = inputs.Ainfo;
-        auto Binfo = inputs.Binfo;
+        auto& Ainfo = inputs.Ainfo;
+        auto& Binfo = inputs.Binfo;
 
         std::vector<float> featureMat(nFeatures*params.GetTotalProcs());
 
@@ -0,0 +1,322 @@
+#ifndef SPGEMM3DMODEL_H
+#define SPGEMM3DMODEL_H
+
+
+#include "common.h"
+#include "SpParMatInfo.h"
+#include "CommModel.h"
+#include "BcastInfo.h"
+#include "SpGEMMParams.h"
+#include "PlatformParams.h"
+#include "SpGEMM2DModel.h"
+
+
+namespace autotuning {
+
+using namespace combblas;
+
+
+/* Analytical model of Mult_AnXBn_SUMMA3D on a gridDim x gridDim x layers grid.
+ * A is split by columns and B by rows across the layers, each layer runs 2D SUMMA on its slices,
+ * and the partial results are exchanged with an alltoall among the layers and merged.
+ * With one layer the multiply and merge terms reduce to those of SpGEMM2DModelAnalytical.
+ * Bcast time is taken from the per process nnz of the hypothetical 3D grid instead of the average,
+ * so load imbalance across rows and layers shows up in it.
+ * Reuses the CRTP base of the 2D models, nothing in it depends on the grid being 2D. */
+class SpGEMM3DModelAnalytical : public SpGEMM2DModel<SpGEMM3DModelAnalytical> {
+public:
+
+    // AUTOTUNING_BCAST_TABLE=<path> replaces the tree bcast formula with measured times
+    void CreateImpl() {
+        const char * tablePath = std::getenv("AUTOTUNING_BCAST_TABLE");
+        if (tablePath!=nullptr)
+            bcastTable.reset(new BcastTable(std::string(tablePath)));
+    }
+
+
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    class Inputs : public SpGEMM2DInputs<AIT,ANT,ADER,BIT,BNT,BDER> {
+
+    public:
+        Inputs(){}
+
+        Inputs<AIT,ANT,ADER,BIT,BNT,BDER>(SpParMat<AIT,ANT,ADER>& A,
+                                            SpParMat<BIT,BNT,BDER>& B):
+            Ainfo(&A),Binfo(&B)
+        {
+            // How SpParMat3D lays A and B out across the layers
+            Ainfo.SetSplit(COL_SPLIT);
+            Binfo.SetSplit(ROW_SPLIT);
+        }
+
+        /* Collective. After this, ComputeNnzArr needs no communication for any params in searchSpace */
+        void ComputeNnzHistograms(std::vector<SpGEMMParams>& searchSpace) {
+            Ainfo.ComputeNnzHistogram(searchSpace);
+            Binfo.ComputeNnzHistogram(searchSpace);
+        }
+
+        SpGEMM2DModelAnalytical::SpParMatInfoAnalytical<AIT,ANT,ADER> Ainfo;
+        SpGEMM2DModelAnalytical::SpParMatInfoAnalytical<BIT,BNT,BDER> Binfo;
+    };
+
+
+    /* Get runtime estimate of a certain combo of parameters */
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    std::vector<float> PredictImpl(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, std::vector<SpGEMMParams>& searchSpace) {
+
+        std::vector<float> times(searchSpace.size());
+
+#ifdef PROFILE
+        infoPtr->StartTimerGlobal("Prediction");
+#endif
+        TRACE_BEGIN("Prediction");
+
+        std::transform(searchSpace.begin(), searchSpace.end(), times.begin(),
+            [&inputs, this](auto& params) {
+                return this->PredictOneImpl(inputs, params);
+            }
+        );
+
+        TRACE_END();
+#ifdef PROFILE
+        infoPtr->WriteInfo();
+        infoPtr->EndTimerGlobal("Prediction");
+#endif
+        return times;
+
+    }
+
+
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    float PredictOneImpl(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, SpGEMMParams& params) {
+
+        inputs.Ainfo.ComputeNnzArr(params);
+        inputs.Binfo.ComputeNnzArr(params);
+
+        auto bcastTime = this->BcastTime<AIT, ANT>(inputs, params);
+        auto localSpGEMMTime = this->LocalSpGEMMTime(inputs, params);
+        auto layerReduceTime = this->LayerReduceTime<AIT, ANT>(inputs, params);
+        auto mergeTime = this->MergeTime(inputs, params);
+#ifdef PROFILE
+        infoPtr->Put("Params", params.OutStr());
+        infoPtr->Put("PredBcastTime", bcastTime);
+        infoPtr->Put("PredLocalSpGEMMTime", localSpGEMMTime);
+        infoPtr->Put("PredLayerReduceTime", layerReduceTime);
+        infoPtr->Put("PredMergeTime", mergeTime);
+#endif
+        return bcastTime + localSpGEMMTime + layerReduceTime + mergeTime;
+
+    }
+
+
+    /* BROADCAST */
+
+    /* SUMMA within each layer. Every tile of a process row is broadcast along that row once,
+     * so the slowest row of A's tiles and the slowest column of B's tiles set the time.
+     * Tile nnz come from the last ComputeNnzArr, which must have been called for params. */
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    float BcastTime(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, SpGEMMParams& params) {
+
+        const int gridDim = params.GetGridDim();
+        if (gridDim==1)
+            return 0;
+
+        PostCommModel<AIT> commModel = this->MakeCommModel<AIT>();
+
+        auto TileTime = [&](AIT nnz, std::pair<int,int> placement) {
+            AIT bytes = MsgSize<AIT,ANT>(nnz);
+            return bcastTable ? bcastTable->Time(bytes, gridDim) / 1e6 
+                                : HierarchicalBcastTime(bytes, placement, commModel) / 1e6;
+        };
+
+        auto RowTileTime = [&](AIT nnz) {return TileTime(nnz, params.RowCommPlacement());};
+        auto ColTileTime = [&](AIT nnz) {return TileTime(nnz, params.ColCommPlacement());};
+
+        return SlowestFiber(*(inputs.Ainfo.GetNnzArr()), params, true, RowTileTime) +
+                SlowestFiber(*(inputs.Binfo.GetNnzArr()), params, false, ColTileTime);
+
+    }
+
+
+    /* Local SpGEMM */
+
+    /* gridDim SUMMA stages, each multiplying tiles with 1/layers of the shared dimension */
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    float LocalSpGEMMTime(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, SpGEMMParams& params) {
+
+        auto& Ainfo = inputs.Ainfo;
+
+        auto FLOPS = [](float c, AIT n, int p, int d) {
+            float singleMultTime = 2.0*(std::min(1.0, (double)c/d)) +
+                                        ((std::pow(c,2.0)*n) / (d*p)) *
+                                        std::log2(std::min((double)n/d, (std::pow(c,2.0)*n)/(d*p)));
+            return singleMultTime * d;
+        };
+
+        return FLOPS(Ainfo.GetGlobDensity()*Ainfo.GetNcols(), Ainfo.GetNcols(),
+                        params.GetTotalProcs(), params.GetGridDim())*
+                        this->platformParams.GetCostFLOP() / this->platformParams.ThreadSpeedup(params.ThreadsPerRank(this->platformParams));
+
+    }
+
+
+    /* Cross-layer reduction */
+
+    /* Alltoall of the partial results among the layers, each process keeps 1/layers of its own.
+     * Pieces sent to layers on the same node are intranode messages. */
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    float LayerReduceTime(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, SpGEMMParams& params) {
+
+        const int layers = params.GetLayers();
+        if (layers==1)
+            return 0;
+
+        auto& Ainfo = inputs.Ainfo;
+
+        float c = Ainfo.GetGlobDensity()*Ainfo.GetNcols();
+        AIT n = Ainfo.GetNcols();
+
+        // Partial results are unmerged across layers, so their size is the per process FLOPs
+        double partialNnz = (std::pow(c,2.0)*n) / params.GetTotalProcs();
+        double bytes = partialNnz * (sizeof(ANT) + 2*sizeof(AIT));
+
+        auto placement = params.FiberCommPlacement();
+        int intraPeers = placement.second - 1;
+        int interPeers = layers - placement.second;
+
+        PostCommModel<AIT> commModel = this->MakeCommModel<AIT>();
+        CommOpts internode {false};
+        CommOpts intranode {true};
+        CommInfo<AIT> interInfo {interPeers, static_cast<AIT>((interPeers * bytes) / layers)};
+        CommInfo<AIT> intraInfo {intraPeers, static_cast<AIT>((intraPeers * bytes) / layers)};
+
+        return (commModel.Time(&interInfo, &internode) + commModel.Time(&intraInfo, &intranode)) / (1e6);
+
+    }
+
+
+    /* Local Merge */
+
+    /* Merging the gridDim stage outputs, then the layers partial results */
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    float MergeTime(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, SpGEMMParams& params) {
+
+        auto& Ainfo = inputs.Ainfo;
+
+        auto FLOPS = [](float c, AIT n, int p, int d, int l) {
+            return (std::pow(c,2.0)*n*(std::log2(d) + std::log2(l))) / p;
+        };
+
+        return FLOPS(Ainfo.GetGlobDensity()*Ainfo.GetNcols(), Ainfo.GetNcols(),
+                    params.GetTotalProcs(), params.GetGridDim(), params.GetLayers())*
+                    this->platformParams.GetCostFLOP();
+    }
+
+
+    /* LOWER BOUND */
+
+    /* Bandwidth-only broadcast plus a FLOP bound on the local multiply.
+     * The reduce and merge terms are never negative, so the sum never exceeds the full prediction. */
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    std::vector<float> LowerBoundImpl(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, std::vector<SpGEMMParams>& searchSpace) {
+
+        std::vector<float> bounds(searchSpace.size());
+
+        std::transform(searchSpace.begin(), searchSpace.end(), bounds.begin(),
+            [&inputs, this](auto& params) {
+                inputs.Ainfo.ComputeNnzArr(params);
+                inputs.Binfo.ComputeNnzArr(params);
+                // Measured bcast times have no latency term to drop, so the bound uses them as is
+                float bcastBound = this->bcastTable ? this->BcastTime<AIT, ANT>(inputs, params)
+                                                    : this->BcastBandwidthTime<AIT, ANT>(inputs, params);
+                return bcastBound + this->LocalFLOPBound(inputs, params);
+            }
+        );
+
+        return bounds;
+
+    }
+
+
+    /* BcastTime without the latency term */
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    float BcastBandwidthTime(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, SpGEMMParams& params) {
+
+        const int gridDim = params.GetGridDim();
+        if (gridDim==1)
+            return 0;
+
+        PostCommModel<AIT> commModel = this->MakeCommModel<AIT>();
+
+        auto RowTileTime = [&](AIT nnz) {
+            return HierarchicalBcastTime(MsgSize<AIT,ANT>(nnz), params.RowCommPlacement(), commModel, false) / (1e6);
+        };
+        auto ColTileTime = [&](AIT nnz) {
+            return HierarchicalBcastTime(MsgSize<AIT,ANT>(nnz), params.ColCommPlacement(), commModel, false) / (1e6);
+        };
+
+        return SlowestFiber(*(inputs.Ainfo.GetNnzArr()), params, true, RowTileTime) +
+                SlowestFiber(*(inputs.Binfo.GetNnzArr()), params, false, ColTileTime);
+
+    }
+
+
+    /* The c^2n/p multiply-adds of LocalSpGEMMTime, scaled by its log factor only when that is below 1 */
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    float LocalFLOPBound(Inputs<AIT,ANT,ADER,BIT,BNT,BDER>& inputs, SpGEMMParams& params) {
+
+        auto& Ainfo = inputs.Ainfo;
+
+        float c = Ainfo.GetGlobDensity()*Ainfo.GetNcols();
+        AIT n = Ainfo.GetNcols();
+        int p = params.GetTotalProcs();
+        int d = params.GetGridDim();
+
+        float flops = (std::pow(c,2.0)*n) / p;
+        float logFactor = std::log2(std::min((double)n/d, (std::pow(c,2.0)*n)/(d*p)));
+
+        return flops * std::min(1.0f, logFactor) * this->platformParams.GetCostFLOP() /
+                this->platformParams.ThreadSpeedup(params.ThreadsPerRank(this->platformParams));
+
+    }
+
+private:
+
+    template <typename IT, typename NT>
+    static IT MsgSize(IT nnz) {
+        return nnz*sizeof(NT) + nnz*sizeof(IT) + (nnz + 1) * sizeof(IT);
+    }
+
+
+    /* Largest sum of TileTime over the tiles of one process row (rows=true) or column, over every layer.
+     * nnzArr is indexed like ComputeOwnerGrid, pcol + prow*gridDim + player*gridSize */
+    template <typename IT, typename F>
+    static float SlowestFiber(const std::vector<IT>& nnzArr, SpGEMMParams& params, bool rows, F TileTime) {
+
+        const int gridDim = params.GetGridDim();
+        const int gridSize = params.GetGridSize();
+
+        float slowest = 0;
+        for (int layer=0; layer<params.GetLayers(); layer++) {
+            for (int i=0; i<gridDim; i++) {
+                float time = 0;
+                for (int j=0; j<gridDim; j++) {
+                    int procRank = rows ? (j + i*gridDim) : (i + j*gridDim);
+                    time += TileTime(nnzArr[procRank + layer*gridSize]);
+                }
+                slowest = std::max(slowest, time);
+            }
+        }
+
+        return slowest;
+    }
+
+
+    std::shared_ptr<BcastTable> bcastTable;
+
+};
+
+
+}//autotuning
+
+#endif
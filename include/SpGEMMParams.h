@@ -7,6 +7,8 @@
 #include "common.h"
 #include "PlatformParams.h"
 
+#include <map>
+
 
 
 namespace autotuning{
@@ -22,8 +24,9 @@ public:
     SpGEMMParams(){}
 
 
-    SpGEMMParams(int nodes, int ppn, int layers):
-        nodes(nodes), ppn(ppn), layers(layers),
+    // threads is OpenMP threads per rank, 0 if the config does not set it
+    SpGEMMParams(int nodes, int ppn, int layers, int threads=0):
+        nodes(nodes), ppn(ppn), layers(layers), threads(threads),
         totalProcs(nodes*ppn)
     {
         gridSize = totalProcs / layers;
@@ -33,22 +36,32 @@ public:
 
 
     void Print() {
-        std::cout<< "(Nodes: "<<nodes<<", PPN: "<<ppn<<", Layers: "<<layers<<")"<<std::endl;
+        std::cout<< "(Nodes: "<<nodes<<", PPN: "<<ppn<<", Layers: "<<layers;
+        if (threads>0)
+            std::cout<<", Threads: "<<threads;
+        std::cout<<")"<<std::endl;
     }
 
 
     std::string OutStr() {
         std::stringstream ss;
         ss<<nodes<<","<<ppn<<","<<layers;
+        if (threads>0)
+            ss<<","<<threads;
         return ss.str();
     }
 
 
     //TODO: Probably some smart way to make this more generic
-    static std::vector<SpGEMMParams> ConstructSearchSpace3D(PlatformParams& params) {
+    // A limit of 0 means every node of the job, or every core of a node
+    static std::vector<SpGEMMParams> ConstructSearchSpace3D(PlatformParams& params, uint32_t nodeLimit = 0, uint32_t ppnLimit = 0) {
+        if (nodeLimit==0)
+            nodeLimit = jobPtr->nodes;
+        if (ppnLimit==0)
+            ppnLimit = params.GetCoresPerNode();
         std::vector<SpGEMMParams> result;
-        for (int _nodes = 1; _nodes<=jobPtr->nodes; _nodes*=2) {
-            for (int _ppn=1; _ppn<=params.GetCoresPerNode(); _ppn*=2) {
+        for (uint32_t _nodes = 1; _nodes<=nodeLimit; _nodes*=2) {
+            for (uint32_t _ppn=1; _ppn<=ppnLimit; _ppn*=2) {
                 if (IsPerfectSquare(_ppn*_nodes)) {
                     for (int _layers=1; _layers<=_ppn*_nodes; _layers*=2) {
                         int gridSize = (_ppn*_nodes) / _layers;
@@ -76,6 +89,18 @@ public:
 
     }
 
+
+    /* Every 2D config with each power of 2 threads per rank that fits on the node's cores */
+    static std::vector<SpGEMMParams> ConstructSearchSpace2DThreaded(PlatformParams& params, uint32_t nodeLimit, uint32_t ppnLimit) {
+        std::vector<SpGEMMParams> space;
+        for (auto& config : ConstructSearchSpace2D(params, nodeLimit, ppnLimit)) {
+            for (int _threads=1; _threads*config.GetPPN()<=params.GetCoresPerNode(); _threads*=2) {
+                space.push_back(SpGEMMParams(config.GetNodes(), config.GetPPN(), 1, _threads));
+            }
+        }
+        return space;
+    }
+
     
     static SpGEMMParams GetDefaultParams()
     {
@@ -377,9 +402,37 @@ public:
     }
 
 
+    /* Placement of the symbolic grid's communicators on nodes. Ranks fill nodes in blocks of ppn,
+     * as in MakeGridFromParams, and communicators are laid out as in GridComm, RowComm and ColComm.
+     * Each returns (nodes the communicator spans, most of its ranks on one node). */
+
+    std::pair<int,int> CommPlacement(int first, int stride, int commSize) const {
+        std::map<int,int> ranksOnNode;
+        for (int k=0; k<commSize; k++) {
+            ranksOnNode[(first + k*stride) / ppn] += 1;
+        }
+        int maxRanks = 0;
+        for (auto& elem : ranksOnNode) {
+            maxRanks = std::max(maxRanks, elem.second);
+        }
+        return std::make_pair((int)ranksOnNode.size(), maxRanks);
+    }
+
+    inline std::pair<int,int> RowCommPlacement() const {return CommPlacement(0, 1, gridDim);}
+    inline std::pair<int,int> ColCommPlacement() const {return CommPlacement(0, gridDim, gridDim);}
+    inline std::pair<int,int> FiberCommPlacement() const {return CommPlacement(0, gridSize, layers);}
+
+
     inline int GetNodes() const {return nodes;}
     inline int GetPPN() const {return ppn;}
     inline int GetLayers() const {return layers;}
+    inline int GetThreads() const {return threads;}
+
+    /* OpenMP threads each rank multiplies with: threads if the config sets it, otherwise the node's cores
+     * split over its ranks, as the sweeps run configs (OMP_NUM_THREADS=coresPerNode/ppn) */
+    inline int ThreadsPerRank(const PlatformParams& params) const {
+        return threads>0 ? threads : std::max(1, params.GetCoresPerNode() / ppn);
+    }
     inline int GetTotalProcs() const {return totalProcs;}
     inline int GetGridSize() const {return gridSize;}
     inline int GetGridDim() const {return gridDim;}
@@ -389,6 +442,7 @@ private:
     int nodes;
     int ppn;
     int layers;
+    int threads;
 
     /* Other handy info */
     int totalProcs;
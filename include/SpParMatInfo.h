@@ -17,6 +17,98 @@ using namespace combblas;
 enum NNZ_STRAT {NNZ_GLOB_DENSITY, NNZ_LOC_DENSITY, NNZ_ARR};
 enum SPLIT {COL_SPLIT, ROW_SPLIT}; //TODO: Move this into SpParMatInfo
 
+
+/* Nnz of a matrix over a fine grid of tiles, from which the nnz per process of any coarser
+ * power-of-two 2D or 3D grid is derived by summing blocks of tiles.
+ * Built with one pass over the local matrix and a single allreduce, so the cost does not depend
+ * on how many grids are derived from it. Rows and columns past the spanned extent fall into the
+ * last tile, like ComputeOwnerGrid clamps them. */
+template <typename IT>
+class NnzHistogram {
+public:
+
+    NnzHistogram(): rowBins(0), colBins(0) {}
+
+
+    /* Collective. Row i of the local matrix is global row i+rowOffset, and likewise for columns */
+    template <typename DER>
+    void Compute(DER * locMat, IT rowOffset, IT colOffset, IT nrowsSpan, IT ncolsSpan,
+                    int rowBins, int colBins)
+    {
+        this->rowBins = rowBins;
+        this->colBins = colBins;
+        counts.assign(rowBins*colBins, 0);
+
+        for (auto colIter = locMat->begcol(); colIter!=locMat->endcol(); colIter++) {
+            int64_t j = colIter.colid() + colOffset;
+            int cb = std::min(j*colBins / static_cast<int64_t>(ncolsSpan), static_cast<int64_t>(colBins-1));
+            for (auto nzIter = locMat->begnz(colIter); nzIter!=locMat->endnz(colIter); nzIter++) {
+                int64_t i = nzIter.rowid() + rowOffset;
+                int rb = std::min(i*rowBins / static_cast<int64_t>(nrowsSpan), static_cast<int64_t>(rowBins-1));
+                counts[cb + rb*colBins] += 1;
+            }
+        }
+
+        MPI_Allreduce(MPI_IN_PLACE, (void*)(counts.data()), counts.size(), MPIType<IT>(), MPI_SUM, MPI_COMM_WORLD);
+    }
+
+
+    /* Row and column bins params's grid needs. The split dimension is cut into layers as well */
+    static std::pair<int,int> BinsFor(const SpGEMMParams& params, SPLIT split) {
+        int rows = params.GetGridDim() * (split==ROW_SPLIT ? params.GetLayers() : 1);
+        int cols = params.GetGridDim() * (split==COL_SPLIT ? params.GetLayers() : 1);
+        return std::make_pair(rows, cols);
+    }
+
+
+    bool Covers(const SpGEMMParams& params, SPLIT split) const {
+        auto bins = BinsFor(params, split);
+        return rowBins>0 && colBins>0 && rowBins%bins.first==0 && colBins%bins.second==0;
+    }
+
+
+    /* Nnz per process of params's grid, indexed like ComputeOwnerGrid */
+    std::vector<IT> Coarsen(const SpGEMMParams& params, SPLIT split) const {
+
+        ASSERT(Covers(params, split), "Histogram is too coarse for " + std::to_string(params.GetGridDim()) + " grid");
+
+        const int gridDim = params.GetGridDim();
+        const int gridSize = params.GetGridSize();
+        const int layers = params.GetLayers();
+
+        auto bins = BinsFor(params, split);
+        const int rowBlock = rowBins / bins.first;
+        const int colBlock = colBins / bins.second;
+
+        std::vector<IT> result(params.GetTotalProcs(), 0);
+
+        for (int rb=0; rb<rowBins; rb++) {
+            for (int cb=0; cb<colBins; cb++) {
+                int r = rb / rowBlock;
+                int c = cb / colBlock;
+                int prow = (split==ROW_SPLIT) ? r / layers : r;
+                int pcol = (split==COL_SPLIT) ? c / layers : c;
+                int player = (split==ROW_SPLIT) ? r % layers : c % layers;
+                result[pcol + prow*gridDim + player*gridSize] += counts[cb + rb*colBins];
+            }
+        }
+
+        return result;
+    }
+
+
+    inline int GetRowBins() const {return rowBins;}
+    inline int GetColBins() const {return colBins;}
+
+private:
+
+    int rowBins;
+    int colBins;
+    std::vector<IT> counts;
+
+};
+
+
 template <typename IT, typename NT, typename DER>
 class SpParMatInfo {
 
@@ -168,6 +260,7 @@ public:
     inline IT GetLocNrows() const {return locNrows;}
 
     inline SPLIT GetSplit() const {return split;}
+    inline void SetSplit(SPLIT s) {split = s;}
 
     inline std::pair<IT,IT> GetGridDims() {return gridDims;}
 
@@ -0,0 +1,186 @@
+#ifndef TRACER_H
+#define TRACER_H
+
+#include <vector>
+#include <string>
+#include <map>
+#include <unordered_map>
+#include <fstream>
+#include <sstream>
+#include <cstdlib>
+#include <limits>
+
+#include "InfoLog.h"
+
+#define TRACE_DEFAULT_CAPACITY (1<<16)
+
+namespace autotuning {
+using namespace combblas;
+
+
+/* One finished span. Times are seconds since the tracer was created */
+struct TraceSpan {
+    int nameId;
+    int depth;
+    double start;
+    double duration;
+};
+
+
+/* Nested spans recorded into a preallocated per-rank buffer. Enabled at runtime with
+ * AUTOTUNING_TRACE=<output path>, AUTOTUNING_TRACE_SPANS sets the buffer size.
+ * Spans past the buffer size are dropped and counted, the buffer never grows. */
+class Tracer {
+public:
+
+    Tracer(int rank, int worldSize): rank(rank), worldSize(worldSize) {
+
+        const char * path = std::getenv("AUTOTUNING_TRACE");
+        enabled = path!=nullptr;
+        if (!enabled) return;
+
+        outPath = std::string(path);
+
+        const char * capacityStr = std::getenv("AUTOTUNING_TRACE_SPANS");
+        capacity = capacityStr!=nullptr ? std::atoi(capacityStr) : TRACE_DEFAULT_CAPACITY;
+        spans.reserve(capacity);
+        openSpans.reserve(64);
+
+        MPI_Barrier(MPI_COMM_WORLD);
+        t0 = MPI_Wtime();
+    }
+
+
+    inline void Begin(const std::string& label) {
+        if (!enabled) return;
+        openSpans.push_back(std::make_pair(NameId(label), MPI_Wtime()));
+    }
+
+
+    /* Closes the innermost open span */
+    inline void End() {
+        if (!enabled || openSpans.empty()) return;
+        double etime = MPI_Wtime();
+        auto span = openSpans.back();
+        openSpans.pop_back();
+        if (spans.size()==capacity) {
+            dropped++;
+            return;
+        }
+        spans.push_back(TraceSpan{span.first, (int)openSpans.size(), span.second - t0, etime - span.second});
+    }
+
+
+    /* Collective. Gathers every rank's spans to rank 0, which writes them as Chrome trace events
+     * (one tid per rank), plus the min/max/mean over ranks of each span's total time per rank */
+    void Write() {
+
+        if (!enabled) return;
+
+        std::stringstream ss;
+        ss.precision(9);
+        for (auto const& span : spans) {
+            ss<<names[span.nameId]<<"\t"<<span.depth<<"\t"<<span.start<<"\t"<<span.duration<<"\n";
+        }
+        std::string local = ss.str();
+
+        int localSize = local.size();
+        std::vector<int> sizes(worldSize);
+        MPI_Gather(&localSize, 1, MPI_INT, sizes.data(), 1, MPI_INT, 0, MPI_COMM_WORLD);
+
+        std::vector<int> displs(worldSize, 0);
+        for (int i=1; i<worldSize; i++) {
+            displs[i] = displs[i-1] + sizes[i-1];
+        }
+
+        std::vector<char> all(rank==0 ? displs[worldSize-1] + sizes[worldSize-1] : 0);
+        MPI_Gatherv(local.data(), localSize, MPI_CHAR, all.data(), sizes.data(), displs.data(),
+                    MPI_CHAR, 0, MPI_COMM_WORLD);
+
+        long totalDropped = 0;
+        MPI_Reduce(&dropped, &totalDropped, 1, MPI_LONG, MPI_SUM, 0, MPI_COMM_WORLD);
+
+        if (rank!=0) return;
+
+        // Span name -> total time and count on each rank that recorded it
+        std::map<std::string, std::map<int, std::pair<double, long>>> totals;
+
+        std::ofstream ofs(outPath, std::ofstream::out);
+        ofs.precision(9);
+        ofs<<"{\"traceEvents\":[";
+
+        bool first = true;
+        for (int r=0; r<worldSize; r++) {
+            std::stringstream chunk(std::string(all.data() + displs[r], sizes[r]));
+            std::string name;
+            int depth;
+            double start, duration;
+            while (std::getline(chunk, name, '\t') && chunk>>depth>>start>>duration) {
+                chunk.ignore(1);
+                ofs<<(first ? "" : ",")<<"{\"name\":"<<InfoLog::JsonString(name)<<",\"ph\":\"X\",\"ts\":"<<start*1e6
+                    <<",\"dur\":"<<duration*1e6<<",\"pid\":0,\"tid\":"<<r<<",\"args\":{\"depth\":"<<depth<<"}}";
+                first = false;
+
+                auto& total = totals[name][r];
+                total.first += duration;
+                total.second++;
+            }
+        }
+
+        ofs<<"],\"summary\":{";
+
+        first = true;
+        for (auto const& elem : totals) {
+            double minTime = std::numeric_limits<double>::max();
+            double maxTime = 0;
+            double sum = 0;
+            long count = 0;
+            for (auto const& rankTotal : elem.second) {
+                minTime = std::min(minTime, rankTotal.second.first);
+                maxTime = std::max(maxTime, rankTotal.second.first);
+                sum += rankTotal.second.first;
+                count += rankTotal.second.second;
+            }
+            ofs<<(first ? "" : ",")<<InfoLog::JsonString(elem.first)<<":{\"min\":"<<minTime<<",\"max\":"<<maxTime
+                <<",\"mean\":"<<sum/elem.second.size()<<",\"ranks\":"<<elem.second.size()<<",\"count\":"<<count<<"}";
+            first = false;
+        }
+
+        ofs<<"},\"dropped\":"<<totalDropped<<"}"<<std::endl;
+
+    }
+
+
+    inline bool Enabled() const {return enabled;}
+
+private:
+
+    int NameId(const std::string& label) {
+        auto it = nameIds.find(label);
+        if (it!=nameIds.end()) return it->second;
+        nameIds[label] = names.size();
+        names.push_back(label);
+        return names.size()-1;
+    }
+
+    int rank;
+    int worldSize;
+    bool enabled;
+    std::string outPath;
+
+    size_t capacity = 0;
+    long dropped = 0;
+    double t0 = 0;
+
+    std::vector<TraceSpan> spans;
+    std::vector<std::pair<int, double>> openSpans;
+
+    std::vector<std::string> names;
+    std::unordered_map<std::string, int> nameIds;
+
+};
+
+
+}//autotuning
+
+#endif
@@ -0,0 +1,270 @@
+#ifndef TUNINGCACHE_H
+#define TUNINGCACHE_H
+
+
+#include "common.h"
+#include "SpGEMMParams.h"
+#include "PlatformParams.h"
+
+#include <fstream>
+#include <iomanip>
+#include <cstdlib>
+
+
+#define FINGERPRINT_STRIDE 64
+
+
+namespace autotuning {
+
+using namespace combblas;
+
+
+/* Cheap distributed summary of a matrix: global dimensions and nnz, plus a hash of its structure.
+ * Each rank hashes every FINGERPRINT_STRIDE-th nonempty local column (column id, nnz and row ids),
+ * and the per-rank hashes are combined with a single allreduce */
+struct MatrixFingerprint {
+    int64_t nrows;
+    int64_t ncols;
+    int64_t nnz;
+    uint64_t structHash;
+
+    std::string OutStr() const {
+        std::stringstream ss;
+        ss<<nrows<<","<<ncols<<","<<nnz<<","<<structHash;
+        return ss.str();
+    }
+
+    static MatrixFingerprint FromStr(const std::string& str) {
+        MatrixFingerprint fp;
+        char sep;
+        std::stringstream ss(str);
+        ss>>fp.nrows>>sep>>fp.ncols>>sep>>fp.nnz>>sep>>fp.structHash;
+        return fp;
+    }
+};
+
+
+/* FNV-1a over one 64 bit word */
+inline uint64_t HashCombine(uint64_t hash, uint64_t word) {
+    for (int b=0; b<8; b++) {
+        hash ^= (word >> (b*8)) & 0xff;
+        hash *= 1099511628211ULL;
+    }
+    return hash;
+}
+
+
+template <typename IT, typename NT, typename DER>
+MatrixFingerprint Fingerprint(SpParMat<IT,NT,DER>& Mat) {
+
+    MatrixFingerprint fp;
+    fp.nrows = Mat.getnrow();
+    fp.ncols = Mat.getncol();
+    fp.nnz = Mat.getnnz();
+
+    DER * locMat = Mat.seqptr();
+    uint64_t locHash = HashCombine(14695981039346656037ULL, Mat.getcommgrid()->GetRank());
+
+    IT colIdx = 0;
+    for (auto colIter = locMat->begcol(); colIter!=locMat->endcol(); colIter++, colIdx++) {
+        if (colIdx % FINGERPRINT_STRIDE) continue;
+        locHash = HashCombine(locHash, colIter.colid());
+        locHash = HashCombine(locHash, colIter.nnz());
+        for (auto nzIter = locMat->begnz(colIter); nzIter!=locMat->endnz(colIter); nzIter++) {
+            locHash = HashCombine(locHash, nzIter.rowid());
+        }
+    }
+
+    // Sum is order independent, so every rank ends up with the same hash
+    MPI_Allreduce(&locHash, &(fp.structHash), 1, MPI_UINT64_T, MPI_SUM, Mat.getcommgrid()->GetWorld());
+
+    return fp;
+}
+
+
+/* When a cached decision may be reused for a new pair of matrices.
+ * Tolerances are relative differences, 0 requires an exact match.
+ * AUTOTUNING_CACHE_DIM_TOL, AUTOTUNING_CACHE_NNZ_TOL and AUTOTUNING_CACHE_MATCH_STRUCTURE=0|1 override them. */
+struct TuningCachePolicy {
+    float dimTol = 0.0;
+    float nnzTol = 0.05;
+    bool matchStructure = true; // Also require equal structure hashes
+
+    static TuningCachePolicy FromEnv() {
+        TuningCachePolicy policy;
+        const char * dimTolStr = std::getenv("AUTOTUNING_CACHE_DIM_TOL");
+        if (dimTolStr!=nullptr)
+            policy.dimTol = std::atof(dimTolStr);
+        const char * nnzTolStr = std::getenv("AUTOTUNING_CACHE_NNZ_TOL");
+        if (nnzTolStr!=nullptr)
+            policy.nnzTol = std::atof(nnzTolStr);
+        const char * structStr = std::getenv("AUTOTUNING_CACHE_MATCH_STRUCTURE");
+        if (structStr!=nullptr)
+            policy.matchStructure = std::atoi(structStr);
+        return policy;
+    }
+};
+
+
+/* Everything a tuning decision depends on */
+struct TuningKey {
+    std::string method;
+    std::string platform; // every PlatformParams member, then the bcast table's hash
+    std::string job; // nodes,ppn of the job and the node/ppn limits of the search
+    MatrixFingerprint A;
+    MatrixFingerprint B;
+};
+
+
+/* Tuning decisions persisted to a text file, one per line:
+ * <method> <platform> <job> <A fingerprint> <B fingerprint> <nodes,ppn,layers>
+ * Only rank 0 reads and writes the file, lookups are broadcast to everyone else. */
+class TuningCache {
+
+public:
+
+    TuningCache(const std::string path, TuningCachePolicy policy = TuningCachePolicy()):
+        path(path), policy(policy)
+    {
+        if (rank==0) Load();
+    }
+
+
+    template <typename AIT, typename ANT, typename ADER, typename BIT, typename BNT, typename BDER>
+    TuningKey MakeKey(const std::string method, SpParMat<AIT,ANT,ADER>& A, SpParMat<BIT,BNT,BDER>& B,
+                        PlatformParams& platformParams, uint32_t maxNodes, uint32_t maxPPN)
+    {
+        std::stringstream platform;
+        platform<<std::setprecision(9)
+                <<platformParams.GetInternodeAlpha()<<","<<platformParams.GetInternodeBeta()<<","
+                <<platformParams.GetIntranodeAlpha()<<","<<platformParams.GetIntranodeBeta()<<","
+                <<platformParams.GetCoresPerNode()<<","<<platformParams.GetDevsPerNode()<<","
+                <<platformParams.GetPeakFLOPS()<<","<<platformParams.GetCostFLOP()<<","
+                <<platformParams.GetMemBW()<<","<<platformParams.GetCostMem();
+        for (auto& point : platformParams.GetThreadEfficiency())
+            platform<<",t"<<point.first<<":"<<point.second;
+        platform<<",bcast"<<BcastTableHash();
+
+        std::stringstream job;
+        job<<jobPtr->nodes<<","<<jobPtr->tasksPerNode<<","<<maxNodes<<","<<maxPPN;
+
+        return TuningKey{method, platform.str(), job.str(), Fingerprint(A), Fingerprint(B)};
+    }
+
+
+    /* Collective. Returns true and sets params if a matching decision is cached */
+    bool Lookup(const TuningKey& key, SpGEMMParams& params) {
+
+        int found[5] = {0, 0, 0, 0, 0};
+
+        if (rank==0) {
+            // Most recent match wins
+            for (auto entry = entries.rbegin(); entry!=entries.rend(); entry++) {
+                if (Matches(key, entry->first)) {
+                    found[0] = 1;
+                    found[1] = entry->second.GetNodes();
+                    found[2] = entry->second.GetPPN();
+                    found[3] = entry->second.GetLayers();
+                    found[4] = entry->second.GetThreads();
+                    break;
+                }
+            }
+        }
+
+        MPI_Bcast(found, 5, MPI_INT, 0, MPI_COMM_WORLD);
+
+        if (found[0])
+            params = SpGEMMParams(found[1], found[2], found[3], found[4]);
+
+        return found[0];
+    }
+
+
+    void Insert(const TuningKey& key, SpGEMMParams& params) {
+
+        if (rank!=0) return;
+
+        entries.push_back(std::make_pair(key, params));
+
+        std::ofstream ofs(path, std::ofstream::app);
+        ofs<<key.method<<" "<<key.platform<<" "<<key.job<<" "<<key.A.OutStr()<<" "<<key.B.OutStr()
+            <<" "<<params.OutStr()<<std::endl;
+    }
+
+
+    inline size_t Size() const {return entries.size();}
+
+private:
+
+    /* Hash of the AUTOTUNING_BCAST_TABLE file the models read, 0 if it is not set */
+    static uint64_t BcastTableHash() {
+        const char * tablePath = std::getenv("AUTOTUNING_BCAST_TABLE");
+        if (tablePath==nullptr)
+            return 0;
+
+        std::ifstream ifs(tablePath, std::ifstream::binary);
+        uint64_t hash = 14695981039346656037ULL;
+        char c;
+        while (ifs.get(c))
+            hash = HashCombine(hash, (unsigned char)c);
+        return hash;
+    }
+
+
+    void Load() {
+
+        std::ifstream ifs(path);
+        std::string line;
+
+        while (std::getline(ifs, line)) {
+            std::stringstream ss(line);
+            std::string A, B, params;
+            TuningKey key;
+            if (!(ss>>key.method>>key.platform>>key.job>>A>>B>>params))
+                continue; // Partially written line
+
+            key.A = MatrixFingerprint::FromStr(A);
+            key.B = MatrixFingerprint::FromStr(B);
+
+            int nodes, ppn, layers, threads = 0;
+            char sep;
+            std::stringstream paramStream(params);
+            paramStream>>nodes>>sep>>ppn>>sep>>layers;
+            paramStream>>sep>>threads; // Only present for configs that set threads
+
+            entries.push_back(std::make_pair(key, SpGEMMParams(nodes, ppn, layers, threads)));
+        }
+    }
+
+
+    bool Matches(const TuningKey& key, const TuningKey& cached) {
+        return key.method==cached.method && key.platform==cached.platform && key.job==cached.job &&
+                Similar(key.A, cached.A) && Similar(key.B, cached.B);
+    }
+
+
+    bool Similar(const MatrixFingerprint& fp, const MatrixFingerprint& cached) {
+
+        auto Within = [](int64_t val, int64_t cachedVal, float tol) {
+            return std::abs(val - cachedVal) <= tol * std::max(std::abs(cachedVal), (int64_t)1);
+        };
+
+        if (policy.matchStructure && fp.structHash!=cached.structHash)
+            return false;
+
+        return Within(fp.nrows, cached.nrows, policy.dimTol) &&
+                Within(fp.ncols, cached.ncols, policy.dimTol) &&
+                Within(fp.nnz, cached.nnz, policy.nnzTol);
+    }
+
+
+    std::string path;
+    TuningCachePolicy policy;
+    std::vector<std::pair<TuningKey, SpGEMMParams>> entries;
+
+};
+
+
+}//autotuning
+
+#endif
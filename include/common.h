@@ -41,6 +41,7 @@
 #include "CombBLAS/SpParMat.h"
 #include "Logger.h"
 #include "InfoLog.h"
+#include "Tracer.h"
 
 #ifdef XGB_MODEL
 #include <xgboost/c_api.h>
@@ -74,6 +75,11 @@
 #define UNREACH_ERR() throw std::runtime_error("Never should have come here...");
 
 
+/* Runtime tracing, a no-op unless AUTOTUNING_TRACE is set */
+#define TRACE_BEGIN(label) do { if (tracePtr) tracePtr->Begin(label); } while (0)
+#define TRACE_END() do { if (tracePtr) tracePtr->End(); } while (0)
+
+
 #ifdef DEBUG
 
 #define DEBUG_PRINT(message) if(rank==0) debugPtr->Print(message);
@@ -176,6 +182,7 @@ bool initCalled = false;
 JobInfo *jobPtr = nullptr;
 Logger *debugPtr = nullptr;
 InfoLog *infoPtr = nullptr;
+Tracer *tracePtr = nullptr;
 
 void Init(JobManager jm) {
 
@@ -193,6 +200,8 @@ void Init(JobManager jm) {
 
     jobPtr = new JobInfo(jm);
 
+    tracePtr = new Tracer(rank, worldSize);
+
 #ifdef DEBUG
     debugPtr = new Logger(rank,"logfile"+std::to_string(rank)+".out", true);
     debugPtr->Print0("Debug mode active");
@@ -212,6 +221,10 @@ void Finalize() {
     delete debugPtr;
 #endif
     delete jobPtr;
+
+    tracePtr->Write();
+    delete tracePtr;
+    tracePtr = nullptr;
     
 }
 
@@ -2,6 +2,9 @@
 
 #include <cassert>
 #include <string>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 
 #include "CombBLAS/CombBLAS.h"
 #include "CombBLAS/CommGrid3D.h"
@@ -18,7 +21,7 @@ using namespace combblas;
 int main(int argc, char ** argv) {
     
     //TODO: Make actual argparser
-    /* ./<binary> <path/to/matA> <path/to/matB> <permute> <maxnodes> <domult>*/
+    /* ./<binary> <path/to/matA> <path/to/matB> <permute> <maxnodes> <domult> [strategy] [redistmults] [dims] [searchthreads]*/
     
     assert(argc>4);
     
@@ -29,7 +32,17 @@ int main(int argc, char ** argv) {
 
     {
         autotuning::Init(autotuning::M_OMPI);
-        autotuning::Autotuner tuner(autotuning::fractusParams);
+        // Platform profile from calibrate_platform.py, members it doesn't set keep fractusParams values
+        autotuning::PlatformParams platformParams = autotuning::fractusParams;
+        if (std::getenv("AUTOTUNING_PLATFORM")!=nullptr)
+            platformParams = autotuning::PlatformParams::LoadProfile(std::getenv("AUTOTUNING_PLATFORM"), 
+                                                                    autotuning::fractusParams);
+
+        autotuning::Autotuner tuner(platformParams);
+
+        // Reuse earlier tuning decisions for matching matrices, AUTOTUNING_CACHE_* set the matching policy
+        if (std::getenv("AUTOTUNING_CACHE")!=nullptr)
+            tuner.EnableCache(std::getenv("AUTOTUNING_CACHE"), autotuning::TuningCachePolicy::FromEnv());
 
         std::string matpathA(argv[1]);
         std::string matpathB(argv[2]);
@@ -65,6 +78,19 @@ int main(int argc, char ** argv) {
         double stime, etime;
     
         int maxNodes = std::atoi(argv[4]);
+
+        // 0 is brute force, 1 is branch and bound
+        autotuning::SearchStrategy strategy = (argc>6) ? (autotuning::SearchStrategy)(std::atoi(argv[6])) 
+                                                        : autotuning::BRUTE_FORCE;
+
+        // Multiplications the redistribution cost is amortized over, 0 leaves it out of the search
+        int redistMults = (argc>7) ? std::atoi(argv[7]) : 1;
+
+        // 3 also searches over layers of 3D SUMMA
+        int dims = (argc>8) ? std::atoi(argv[8]) : 2;
+
+        // 1 also searches over OpenMP threads per rank, 2D only
+        bool searchThreads = (argc>9) && (bool)(std::atoi(argv[9]));
         
         // Test tuning
         stime = MPI_Wtime();
@@ -72,7 +98,11 @@ int main(int argc, char ** argv) {
         autotuning::SpGEMMParams resultParams;
         autotuning::SpGEMMParams defaultParams = autotuning::SpGEMMParams::GetDefaultParams();
 
-        resultParams = tuner.TuneSpGEMM2DAnalytical(A,B,matpathA,matpathB,maxNodes);
+        if (dims==3)
+            resultParams = tuner.TuneSpGEMM3D(A,B,matpathA,matpathB,maxNodes,0,strategy);
+        else
+            resultParams = tuner.TuneSpGEMM2DAnalytical(A,B,matpathA,matpathB,maxNodes,0,strategy,redistMults,
+                                                            searchThreads);
     
         etime = MPI_Wtime();
         tuningTime += (etime - stime);
@@ -88,9 +118,11 @@ int main(int argc, char ** argv) {
         
             SpGEMMTime += (etime - stime);
     
-            auto tunedGrid = resultParams.MakeGridFromParams();
-            DER * ARedist = resultParams.ReDistributeSpMat(A.seqptr(), defaultParams);
-            DER * BRedist = resultParams.ReDistributeSpMat(B.seqptr(),  defaultParams);
+            // A 3D config is formed from the 2D grid over the same processes
+            autotuning::SpGEMMParams gridParams(resultParams.GetNodes(), resultParams.GetPPN(), 1);
+            auto tunedGrid = gridParams.MakeGridFromParams();
+            DER * ARedist = gridParams.ReDistributeSpMat(A.seqptr(), defaultParams);
+            DER * BRedist = gridParams.ReDistributeSpMat(B.seqptr(),  defaultParams);
     
             if (tunedGrid!=NULL) {
                 {
@@ -107,8 +139,19 @@ int main(int argc, char ** argv) {
         
                     redistTime = (etime - stime);
         
+#ifdef _OPENMP
+                    if (resultParams.GetThreads()>0)
+                        omp_set_num_threads(resultParams.GetThreads());
+#endif
+
                     stime = MPI_Wtime();
-                    Mult_AnXBn_Synch<PTTF, UT, DER>(ATuned, BTuned, false, false);
+                    if (resultParams.GetLayers()>1) {
+                        SpParMat3D<IT, UT, DER> ATuned3D(ATuned, resultParams.GetLayers(), true);
+                        SpParMat3D<IT, UT, DER> BTuned3D(BTuned, resultParams.GetLayers(), false);
+                        Mult_AnXBn_SUMMA3D<PTTF, UT, DER>(ATuned3D, BTuned3D);
+                    } else {
+                        Mult_AnXBn_Synch<PTTF, UT, DER>(ATuned, BTuned, false, false);
+                    }
                     etime = MPI_Wtime();
         
                     tunedSpGEMMTime += (etime - stime);
@@ -0,0 +1,209 @@
+#include <cassert>
+#include <string>
+#include <random>
+#include <thread>
+#include <set>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+#include "CombBLAS/CombBLAS.h"
+#include "CombBLAS/CommGrid3D.h"
+#include "CombBLAS/SpParMat3D.h"
+#include "CombBLAS/ParFriends.h"
+#include "CombBLAS/FullyDistVec.h"
+#include "Autotuner.h"
+
+#define THREADED
+
+using namespace combblas;
+
+
+/*
+ * Microbenchmarks for PlatformParams: ping-pong (intranode and internode), bcast, STREAM triad
+ * and local SpGEMM. Rank 0 writes one CSV row per measurement:
+ *      kind,ranks,nodes,size,time_us
+ * size is bytes for communication and memory, FLOPs for spgemm.
+ * tuning-experiments/calibrate_platform.py fits a platform profile to the rows.
+ * Runs on a single node too, internode rows are then skipped.
+ * With "bcast" as the second argument only the bcast sweep runs.
+ * With "threads" as the second argument only the thread sweep runs, meant for a single rank: the local
+ * SpGEMM on 1,2,4... OpenMP threads, up to the node's cores, one row per thread count
+ *      spgemm-threads,<threads>,1,<flops>,<time_us>
+ */
+
+
+typedef int64_t IT;
+typedef double NT;
+typedef SpDCCols<IT,NT> DER;
+typedef PlusTimesSRing<NT,NT> PTTF;
+
+#define ITERS 20
+
+
+/* Slowest rank's average time in us */
+template <typename F>
+double TimeCollective(F f) {
+    f(); // warmup
+    MPI_Barrier(MPI_COMM_WORLD);
+    double stime = MPI_Wtime();
+    for (int i=0; i<ITERS; i++) f();
+    double time = ((MPI_Wtime() - stime) / ITERS) * 1e6;
+    double maxTime;
+    MPI_Reduce(&time, &maxTime, 1, MPI_DOUBLE, MPI_MAX, 0, MPI_COMM_WORLD);
+    return maxTime;
+}
+
+
+/* Random n x n matrix with nnzPerCol nonzeros in every column, same on every rank */
+DER * RandomLocalMat(IT n, IT nnzPerCol) {
+    std::mt19937_64 gen(n + nnzPerCol);
+    std::uniform_int_distribution<IT> rowDist(0, n-1);
+    auto tuples = new std::tuple<IT,IT,NT>[n*nnzPerCol];
+    for (IT j=0; j<n; j++) {
+        for (IT k=0; k<nnzPerCol; k++) {
+            tuples[j*nnzPerCol + k] = std::make_tuple(rowDist(gen), j, 1.0);
+        }
+    }
+    SpTuples<IT,NT> spTuples(n*nnzPerCol, n, n, tuples, false, true);
+    spTuples.SortColBased();
+    spTuples.RemoveDuplicates(PTTF::add);
+    return new DER(spTuples, false);
+}
+
+
+/* Multiply-adds of A*B, nnz(A(:,k)) for every nonzero B(k,j) */
+int64_t LocalFLOPS(DER& A, DER& B) {
+    std::vector<int64_t> colNnz(A.getncol(), 0);
+    for (auto colIter = A.begcol(); colIter!=A.endcol(); colIter++) {
+        colNnz[colIter.colid()] = colIter.nnz();
+    }
+    int64_t flops = 0;
+    for (auto colIter = B.begcol(); colIter!=B.endcol(); colIter++) {
+        for (auto nzIter = B.begnz(colIter); nzIter!=B.endnz(colIter); nzIter++) {
+            flops += colNnz[nzIter.rowid()];
+        }
+    }
+    return flops;
+}
+
+
+int main(int argc, char ** argv) {
+
+    /* ./<binary> [path/to/output.csv] [bcast|threads] */
+
+    int rank; int n;
+    MPI_Init(&argc, &argv);
+    MPI_Comm_rank(MPI_COMM_WORLD, &rank);
+    MPI_Comm_size(MPI_COMM_WORLD, &n);
+
+    {
+        autotuning::Init(autotuning::M_OMPI);
+
+        std::string outPath = (argc>1) ? std::string(argv[1]) : std::string("calibration.csv");
+        std::ofstream ofs;
+        if (rank==0) {
+            ofs.open(outPath, std::ofstream::out);
+            ofs<<"kind,ranks,nodes,size,time_us"<<std::endl;
+            ofs<<"cores,"<<autotuning::jobPtr->tasksPerNode<<","<<autotuning::jobPtr->nodes<<","
+                <<std::thread::hardware_concurrency()<<",0"<<std::endl;
+        }
+
+        int nodes = autotuning::jobPtr->nodes;
+
+        // bcast_table.py runs only the bcast sweep, once per forced Open MPI algorithm
+        bool bcastOnly = (argc>2) && !std::string(argv[2]).compare("bcast");
+
+        // calibrate_platform.py --threads runs the thread sweep alone on one rank
+        bool threadsOnly = (argc>2) && !std::string(argv[2]).compare("threads");
+
+#ifdef _OPENMP
+        /* Local SpGEMM on rank 0 with every power of 2 thread count, same matrix throughout */
+        int cores = std::thread::hardware_concurrency();
+        for (int threads=1; threads<=cores && threadsOnly; threads*=2) {
+            omp_set_num_threads(threads);
+            if (rank==0) {
+                DER * A = RandomLocalMat(1<<18, 16);
+                int64_t flops = LocalFLOPS(*A, *A);
+                SpTuples<IT,NT> * C = LocalSpGEMM<PTTF, NT>(*A, *A, false, false); // warmup
+                delete C;
+                double stime = MPI_Wtime();
+                for (int i=0; i<ITERS; i++) {
+                    C = LocalSpGEMM<PTTF, NT>(*A, *A, false, false);
+                    delete C;
+                }
+                double time = ((MPI_Wtime() - stime) / ITERS) * 1e6;
+                ofs<<"spgemm-threads,"<<threads<<",1,"<<flops<<","<<time<<std::endl;
+                delete A;
+            }
+        }
+        omp_set_num_threads(cores);
+#endif
+
+        /* Ping-pong */
+        int intraPartner = autotuning::PlatformParams::IntranodePartner();
+        int interPartner = autotuning::PlatformParams::InternodePartner();
+        for (size_t bytes=1; bytes<=(1<<24) && !bcastOnly && !threadsOnly; bytes*=4) {
+            if (intraPartner>0) {
+                double time = autotuning::PlatformParams::PingPongTime(intraPartner, bytes, ITERS);
+                if (rank==0) ofs<<"pingpong,2,1,"<<bytes<<","<<time<<std::endl;
+            }
+            if (interPartner>0) {
+                double time = autotuning::PlatformParams::PingPongTime(interPartner, bytes, ITERS);
+                if (rank==0) ofs<<"pingpong,2,2,"<<bytes<<","<<time<<std::endl;
+            }
+        }
+
+        /* Bcast over the first commSize ranks, for every power of 2 commSize */
+        std::vector<int> leaders = autotuning::PlatformParams::NodeLeaders();
+        for (int commSize=2; commSize<=n && !threadsOnly; commSize*=2) {
+
+            MPI_Comm bcastComm;
+            MPI_Comm_split(MPI_COMM_WORLD, rank<commSize, rank, &bcastComm);
+
+            int commNodes = std::set<int>(leaders.begin(), leaders.begin()+commSize).size();
+
+            for (size_t bytes=1; bytes<=(1<<24); bytes*=4) {
+                std::vector<char> buf(bytes);
+                double time = TimeCollective([&buf, bytes, bcastComm, commSize, rank]() {
+                    if (rank<commSize) MPI_Bcast(buf.data(), bytes, MPI_CHAR, 0, bcastComm);
+                });
+                if (rank==0) ofs<<"bcast,"<<commSize<<","<<commNodes<<","<<bytes<<","<<time<<std::endl;
+            }
+
+            MPI_Comm_free(&bcastComm);
+        }
+
+        /* STREAM triad on every rank at once, size is bytes moved per rank */
+        for (size_t len=(1<<20); len<=(1<<24) && !bcastOnly && !threadsOnly; len*=4) {
+            std::vector<double> a(len, 0.0), b(len, 1.0), c(len, 2.0);
+            double time = TimeCollective([&a, &b, &c, len]() {
+                for (size_t i=0; i<len; i++) a[i] = b[i] + 3.0*c[i];
+            });
+            if (rank==0) ofs<<"triad,"<<n<<","<<nodes<<","<<3*len*sizeof(double)<<","<<time<<std::endl;
+        }
+
+        /* Local SpGEMM on every rank at once, size is FLOPs per rank */
+        for (IT dim=(1<<14); dim<=(1<<18) && !bcastOnly && !threadsOnly; dim*=4) {
+            for (IT nnzPerCol=4; nnzPerCol<=32; nnzPerCol*=2) {
+                DER * A = RandomLocalMat(dim, nnzPerCol);
+                int64_t flops = LocalFLOPS(*A, *A);
+                double time = TimeCollective([A]() {
+                    SpTuples<IT,NT> * C = LocalSpGEMM<PTTF, NT>(*A, *A, false, false);
+                    delete C;
+                });
+                if (rank==0) ofs<<"spgemm,"<<n<<","<<nodes<<","<<flops<<","<<time<<std::endl;
+                delete A;
+            }
+        }
+
+        if (rank==0) ofs.close();
+
+        autotuning::Finalize();
+    }
+
+    MPI_Finalize();
+
+    return 0;
+
+}
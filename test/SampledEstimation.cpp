@@ -0,0 +1,159 @@
+
+#include <cassert>
+#include <string>
+
+#include "CombBLAS/CombBLAS.h"
+#include "CombBLAS/CommGrid3D.h"
+#include "CombBLAS/SpParMat3D.h"
+#include "CombBLAS/ParFriends.h"
+#include "CombBLAS/FullyDistVec.h"
+#include "Autotuner.h"
+#include "SampledEstimation.h"
+
+#define THREADED
+
+using namespace combblas;
+using namespace autotuning;
+
+typedef int64_t IT;
+typedef double UT;
+typedef SpDCCols<IT,UT> DER;
+typedef PlusTimesSRing<UT,UT> PTTF;
+
+
+/*
+ * Accuracy and speed of SampledFLOPNnz against the exact estimateFLOP/estimateNNZ_HashFast path,
+ * on each rank's local tiles of A*A over a square grid of every rank.
+ * Rank 0 prints one CSV row per sampling rate:
+ *      matrix,rate,flops,estFlops,flopRelErr,flopCovered,nnz,estNnz,nnzRelErr,nnzCovered,exactTime,sampledTime
+ * Counts are summed over ranks, covered is 1 if the exact count falls inside the confidence interval,
+ * times are the slowest rank's.
+ */
+
+
+std::string GetMatnameFromPath(const std::string& path)
+{
+    size_t start = path.rfind('/') + 1; // +1 to start after '/'
+    size_t end = path.rfind('.');
+    std::string fileName = path.substr(start, end - start);
+    return fileName;
+}
+
+
+void RunSamplingBench(std::string matpath, int rank, std::vector<float>& rates, float z)
+{
+
+    std::string matname = GetMatnameFromPath(matpath);
+
+    std::shared_ptr<CommGrid> grid;
+    grid.reset(new CommGrid(MPI_COMM_WORLD, 0, 0));
+
+    SpParMat<IT,UT,DER> A(grid);
+    A.ParallelReadMM(matpath, true, maximum<double>());
+
+    DER * locA = A.seqptr();
+
+    /* Exact */
+    MPI_Barrier(MPI_COMM_WORLD);
+    double stime = MPI_Wtime();
+
+    IT flopLocal = 0;
+    IT * colFlopC = estimateFLOP(*locA, *locA, &flopLocal);
+    IT nnzLocal = estimateNNZ_HashFast(*locA, *locA, colFlopC);
+    delete [] colFlopC;
+
+    double exactTime = MPI_Wtime() - stime;
+
+    double exact[2] = {(double)flopLocal, (double)nnzLocal};
+    MPI_Allreduce(MPI_IN_PLACE, exact, 2, MPI_DOUBLE, MPI_SUM, MPI_COMM_WORLD);
+    MPI_Allreduce(MPI_IN_PLACE, &exactTime, 1, MPI_DOUBLE, MPI_MAX, MPI_COMM_WORLD);
+
+    /* Sampled */
+    for (float rate : rates) {
+
+        SamplingPolicy policy;
+        policy.rate = rate;
+        policy.z = z;
+
+        MPI_Barrier(MPI_COMM_WORLD);
+        stime = MPI_Wtime();
+
+        auto est = SampledFLOPNnz(*locA, *locA, policy, rank);
+
+        double sampledTime = MPI_Wtime() - stime;
+
+        // Value and variance of both estimates, summed over ranks
+        double sampled[4] = {est.first.value, est.first.variance, est.second.value, est.second.variance};
+        MPI_Allreduce(MPI_IN_PLACE, sampled, 4, MPI_DOUBLE, MPI_SUM, MPI_COMM_WORLD);
+        MPI_Allreduce(MPI_IN_PLACE, &sampledTime, 1, MPI_DOUBLE, MPI_MAX, MPI_COMM_WORLD);
+
+        if (rank==0) {
+            SampledEstimate flops{sampled[0], sampled[1]};
+            SampledEstimate nnz{sampled[2], sampled[3]};
+            auto RelErr = [](double est, double exact) {return std::abs(est - exact) / std::max(exact, 1.0);};
+            auto Covered = [z](const SampledEstimate& est, double exact) {
+                return std::abs(est.value - exact) <= est.HalfWidth(z);
+            };
+            std::cout<<matname<<","<<rate<<","
+                <<exact[0]<<","<<flops.value<<","<<RelErr(flops.value, exact[0])<<","<<Covered(flops, exact[0])<<","
+                <<exact[1]<<","<<nnz.value<<","<<RelErr(nnz.value, exact[1])<<","<<Covered(nnz, exact[1])<<","
+                <<exactTime<<","<<sampledTime<<std::endl;
+        }
+    }
+
+}
+
+
+void parse_args(int argc, char ** argv,
+                std::string& matpath,
+                std::vector<float>& rates,
+                float& z)
+{
+    for (int i=1; i<argc; i++) {
+
+        if (!strcmp(argv[i], "--matpath"))
+            matpath = std::string(argv[i+1]);
+        if (!strcmp(argv[i], "--z"))
+            z = std::atof(argv[i+1]);
+        if (!strcmp(argv[i], "--rates")) {
+            rates.clear();
+            std::stringstream ss(argv[i+1]);
+            std::string rate;
+            while (std::getline(ss, rate, ','))
+                rates.push_back(std::atof(rate.c_str()));
+        }
+
+    }
+
+}
+
+
+int main(int argc, char ** argv)
+{
+
+    /* ./<binary> --matpath <path/to/mat> [--rates <r1,r2,...>] [--z <z>] */
+
+    assert(argc>2);
+
+    std::string matpath;
+    std::vector<float> rates {0.01, 0.05, 0.1, 0.25};
+    float z = SAMPLE_DEFAULT_Z;
+
+    parse_args(argc, argv, matpath, rates, z);
+
+    int rank; int n;
+    MPI_Init(&argc, &argv);
+    MPI_Comm_rank(MPI_COMM_WORLD, &rank);
+    MPI_Comm_size(MPI_COMM_WORLD, &n);
+
+    {
+        autotuning::Init(autotuning::M_OMPI);
+
+        RunSamplingBench(matpath, rank, rates, z);
+
+        autotuning::Finalize();
+    }
+
+    MPI_Finalize();
+
+}
@@ -0,0 +1,17 @@
+#!/usr/bin/bash
+
+
+matdir=$1
+ranks=$2
+rates=${3:-0.01,0.05,0.1,0.25}
+
+out=sampling-bench.csv
+
+echo "matrix,rate,flops,estFlops,flopRelErr,flopCovered,nnz,estNnz,nnzRelErr,nnzCovered,exactTime,sampledTime" > $out
+
+for mtx in $(ls $matdir); do
+    echo "Running $mtx..."
+    mpirun -n $ranks ../build/test/sampled-estimation --matpath $matdir/$mtx/$mtx.mtx --rates $rates >> $out
+done
+
+echo "Wrote $out"
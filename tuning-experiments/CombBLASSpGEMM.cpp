@@ -143,16 +143,17 @@ void runSpGEMM2Dcpu(int argc, char ** argv) {
     std::string matB = ExtractMatName(matNameB);
 
     /* Feature extraction */
+    FeatureExtractor<IT,NT,DER> extractor;
+    std::string sampleExt = extractor.Jsonl() ? ".jsonl" : ".txt";
     std::ofstream sampleFile;
     if (!std::string(argv[7]).compare("gnn")) { 
-        sampleFile.open(std::string("samples-gnn-")+std::getenv("SLURM_NNODES")+matA+matB+std::string(".txt"), std::ofstream::app);
+        sampleFile.open(std::string("samples-gnn-")+std::getenv("SLURM_NNODES")+matA+matB+sampleExt, std::ofstream::app);
     } else if (!std::string(argv[7]).compare("xgb")) {
-        sampleFile.open(std::string("samples-xgb-")+std::getenv("SLURM_NNODES")+matA+matB+std::string(".txt"), std::ofstream::app);
+        sampleFile.open(std::string("samples-xgb-")+std::getenv("SLURM_NNODES")+matA+matB+sampleExt, std::ofstream::app);
     } else {
         std::cout<<"file argument wrong: "<<argv[7]<<std::endl;
         exit(1);
     }
-    FeatureExtractor<IT,NT,DER> extractor;
     std::map<std::string, std::string> * timingsMap = new std::map<std::string,std::string>();
     
     int algCode = std::atoi(argv[4]);
@@ -216,8 +217,10 @@ void runSpGEMM2Dcpu(int argc, char ** argv) {
         auto etime = MPI_Wtime();
         if (i>0) //First iteration is slow
             totalTime += (etime-stime);
-        if (rank==0) {
-            timingsMap->emplace("total-time", std::to_string(etime-stime));
+        // JSONL samples have no problem key added afterwards, so every rank records the names
+        if (rank==0 || extractor.Jsonl()) {
+            if (rank==0)
+                timingsMap->emplace("total-time", std::to_string(etime-stime));
             timingsMap->emplace("A-name", matNameA);
             if (permute) {
                 timingsMap->emplace("B-name", matNameB+"-permuted");
@@ -289,6 +292,14 @@ void runSpGEMM3Dcpu(int argc, char ** argv) {
     SpParMat<IT, NT, DER> Btemp(grid); 
     std::string matNameB(argv[3]);
     Btemp.ParallelReadMM(matNameB, true, maximum<NT>());
+
+    bool permute = (bool)(std::atoi(argv[6]));
+    if (permute) {
+        FullyDistVec<IT,NT> p(Atemp.getcommgrid());
+        p.iota(Atemp.getnrow(), 0);
+        p.RandPerm();
+        (Btemp)(p,p,true);
+    }
     
     /* Convert A and B to 3D */
     int nLayers = std::atoi(argv[5]);
@@ -317,6 +328,23 @@ void runSpGEMM3Dcpu(int argc, char ** argv) {
     double totalTime = 0.0;
     double perProcessMem = (512)/np;
     int algCode = std::atoi(argv[4]);
+
+    std::string matA = ExtractMatName(matNameA);
+    std::string matB = ExtractMatName(matNameB);
+
+    /* Feature extraction, features come from the 2D layout A and B are read into */
+    FeatureExtractor<IT,NT,DER> extractor;
+    std::string sampleExt = extractor.Jsonl() ? ".jsonl" : ".txt";
+    std::ofstream sampleFile;
+    if (!std::string(argv[7]).compare("gnn")) { 
+        sampleFile.open(std::string("samples-gnn-")+std::getenv("SLURM_NNODES")+matA+matB+sampleExt, std::ofstream::app);
+    } else if (!std::string(argv[7]).compare("xgb")) {
+        sampleFile.open(std::string("samples-xgb-")+std::getenv("SLURM_NNODES")+matA+matB+sampleExt, std::ofstream::app);
+    } else {
+        std::cout<<"file argument wrong: "<<argv[7]<<std::endl;
+        exit(1);
+    }
+    std::map<std::string, std::string> * timingsMap = new std::map<std::string,std::string>();
     
     for (int i=0;i<ITERS;i++) {
         
@@ -357,12 +385,38 @@ void runSpGEMM3Dcpu(int argc, char ** argv) {
         if (i>0) //First iteration is slow
             totalTime += (etime - stime);
 
+        // Layers tells 3D samples apart from 2D ones of the same problem, nodes and ppn
+        if (rank==0 || extractor.Jsonl()) {
+            if (rank==0)
+                timingsMap->emplace("total-time", std::to_string(etime-stime));
+            timingsMap->emplace("Layers", std::to_string(nLayers));
+            timingsMap->emplace("A-name", matNameA);
+            if (permute) {
+                timingsMap->emplace("B-name", matNameB+"-permuted");
+            } else {
+                timingsMap->emplace("B-name", matNameB);
+            }
+        }
+
+        /* Feature extraction only for i>0 */
+        if (i>0) {
+            if (!std::string(argv[7]).compare("gnn"))
+                extractor.MakeSampleGNN(Atemp, Btemp, timingsMap, sampleFile);
+            else
+                extractor.MakeSample2D(Atemp, Btemp, timingsMap, sampleFile);
+        }
+        timingsMap->clear();
+
     }
+
+    delete timingsMap;
     
     double avgTime = totalTime / (ITERS-1);
     
-    if (rank==0)
+    if (rank==0) {
         PRINT("Avg time: " + std::to_string(avgTime) + "s\n");
+        sampleFile.close();
+    }
     
     
 
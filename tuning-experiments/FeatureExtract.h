@@ -4,6 +4,8 @@
 
 
 #include "common.h"
+#include "SampledEstimation.h"
+#include "InfoLog.h"
 
 #define PRECISION 20
 
@@ -17,7 +19,13 @@ typedef std::map<std::string, std::string> Map;
 
 public:
 
-FeatureExtractor(){}
+FeatureExtractor(){
+    // AUTOTUNING_OUTPUT=jsonl writes one JSON record per sample line
+    const char * format = std::getenv("AUTOTUNING_OUTPUT");
+    jsonl = format!=nullptr && !strcmp(format, "jsonl");
+}
+
+bool Jsonl() {return jsonl;}
 
 
 void MakeSample2D(SpParMat<IT,NT,DER>& A, SpParMat<IT,NT,DER>& B, Map * timings, std::ofstream& ofs) {
@@ -111,17 +119,29 @@ void MakeSampleGNN(SpParMat<IT,NT,DER>& A, SpParMat<IT,NT,DER>& B, Map * timings
 
     int rank = A.getcommgrid()->GetRank();
     
-    if (rank==0) ofs<<"----SAMPLE----"<<std::endl;
+    if (rank==0 && !jsonl) ofs<<"----SAMPLE----"<<std::endl;
     MPI_Barrier(MPI_COMM_WORLD);
 
 
     Map * featMap = new Map();
 
     featMap->emplace("rank", STR(rank));
+    if (jsonl) featMap->emplace("sample", STR(nSamples));
+    nSamples++;
 
     featMap->emplace("nnz-A", STR(A.seqptr()->getnnz()));
     featMap->emplace("nnz-B", STR(B.seqptr()->getnnz()));
 
+    // AUTOTUNING_SAMPLE_RATE in (0,1) estimates FLOPS and output nnz from a sample of B's columns
+    autotuning::SamplingPolicy sampling = autotuning::SamplingPolicy::FromEnv();
+    if (sampling.Enabled()) {
+        featMap->emplace("sample-rate", STR(sampling.rate));
+        MakeSampledNnzFeatures(A, B, sampling, featMap);
+        WriteSample(featMap, timings, ofs);
+        MPI_Barrier(MPI_COMM_WORLD);
+        return;
+    }
+
     typedef PlusTimesSRing<NT,NT> PTTF;
     IT localFLOPS = 0;
     EstimateFLOP<PTTF, IT, NT, NT, DER, DER>(A, B, false, false, &localFLOPS);
@@ -153,8 +173,40 @@ void MakeSampleGNN(SpParMat<IT,NT,DER>& A, SpParMat<IT,NT,DER>& B, Map * timings
     MPI_Barrier(MPI_COMM_WORLD);
 }
 
+/* Sampled FLOPS, outputNnz-intermediate and outputNnz-final, plus m and n of both tiles.
+ * The two SUMMA estimates run on B restricted to the sampled columns and are scaled by 1/rate */
+void MakeSampledNnzFeatures(SpParMat<IT,NT,DER>& A, SpParMat<IT,NT,DER>& B,
+                            autotuning::SamplingPolicy& sampling, Map * featMap)
+{
+    int rank = A.getcommgrid()->GetRank();
+
+    SpParMat<IT,NT,DER> Bsample = autotuning::SampleColumns(B, sampling);
+
+    typedef PlusTimesSRing<NT,NT> PTTF;
+    IT localFLOPS = 0;
+    EstimateFLOP<PTTF, IT, NT, NT, DER, DER>(A, Bsample, false, false, &localFLOPS);
+    featMap->emplace("FLOPS", STR(static_cast<IT>(localFLOPS / sampling.rate)));
+
+    featMap->emplace("m-A", STR(A.seqptr()->getnrow()));
+    featMap->emplace("m-B", STR(B.seqptr()->getnrow()));
+    featMap->emplace("n-A", STR(A.seqptr()->getncol()));
+    featMap->emplace("n-B", STR(B.seqptr()->getncol()));
+
+    auto est = autotuning::SampledFLOPNnz(*(A.seqptr()), *(B.seqptr()), sampling, rank);
+    featMap->emplace("outputNnz-intermediate", STR(static_cast<IT>(est.second.value)));
+    featMap->emplace("outputNnz-intermediate-halfwidth", STR(est.second.HalfWidth(sampling.z)));
+
+    int64_t outputNnzFinal = EstPerProcessNnzSUMMAMax(A, Bsample, false);
+    featMap->emplace("outputNnz-final", STR(static_cast<int64_t>(outputNnzFinal / sampling.rate)));
+}
+
 void WriteSample(const Map * features, const Map * timings, std::ofstream& ofs) {
 
+    if (jsonl) {
+        WriteSampleJsonl(features, timings, ofs);
+        return;
+    }
+
     // Write features
     std::for_each(features->begin(), features->end(),
         [&ofs](auto const& elem) {
@@ -175,6 +227,26 @@ void WriteSample(const Map * features, const Map * timings, std::ofstream& ofs)
 }
 
 
+// One JSON object per sample, numeric values are written as numbers
+void WriteSampleJsonl(const Map * features, const Map * timings, std::ofstream& ofs) {
+
+    std::string sep("{");
+    for (auto const& elem : *features) {
+        ofs<<sep<<autotuning::InfoLog::JsonString(elem.first)<<":"<<autotuning::InfoLog::JsonValue(elem.second);
+        sep = ",";
+    }
+    for (auto const& elem : *timings) {
+        if (features->find(elem.first)!=features->end())
+            continue;
+        ofs<<sep<<autotuning::InfoLog::JsonString(elem.first)<<":"<<autotuning::InfoLog::JsonValue(elem.second);
+        sep = ",";
+    }
+    if (sep=="{") ofs<<sep;
+    ofs<<"}"<<std::endl;
+
+}
+
+
 template <typename T>
 std::string ToStrScientific(T input) {
     std::ostringstream ss;
@@ -476,6 +548,12 @@ T ReduceMean(std::vector<T>& v) {
 }
 
 
+
+private:
+
+bool jsonl;
+int nSamples = 0;
+
 };
 
 #endif
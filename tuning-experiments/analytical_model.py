@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+
+from dataclasses import dataclass, field
+
+from problem_results import batch_metrics
+
+
+# Mirrors PlatformParams.h: alphas are us, betas are bytes/us, gamma is the cost of one FLOP
+@dataclass
+class PlatformParams:
+    inter_beta: float
+    inter_alpha: float
+    gamma:float
+    intra_beta:float = 42340.33
+    cores_per_node:int = 128
+    intra_alpha:float = 3.9
+    # threads per rank -> parallel efficiency of the local multiply, empty if not calibrated
+    thread_eff:dict = field(default_factory=dict)
+
+perlmutter_params = PlatformParams(23980.54, 3.9, 5.2e-9)
+
+
+# Platform profile written by calibrate_platform.py, the same file PlatformParams::LoadProfile reads
+def load_profile(path, defaults=perlmutter_params):
+    profile = {}
+    with open(path, 'r') as file:
+        for line in file:
+            if len(line.split())==2:
+                key, val = line.split()
+                profile[key] = float(val)
+    thread_eff = {int(key[len("threadEfficiency"):]):val for key, val in profile.items()
+                  if key.startswith("threadEfficiency")}
+    return PlatformParams(profile.get("internodeBeta", defaults.inter_beta),
+                          profile.get("internodeAlpha", defaults.inter_alpha),
+                          profile.get("costFLOP", defaults.gamma),
+                          profile.get("intranodeBeta", defaults.intra_beta),
+                          int(profile.get("coresPerNode", defaults.cores_per_node)),
+                          profile.get("intranodeAlpha", defaults.intra_alpha),
+                          thread_eff or dict(defaults.thread_eff))
+
+# sizeof(NT), sizeof(IT) of the matrices the autotuner is run on
+nt_bytes = 8
+it_bytes = 8
+
+
+# Same grid as SpGEMMParams::ConstructSearchSpace2D
+def search_space_2d(node_limit, ppn_limit):
+    nodes, ppn = [], []
+    n = 1
+    while n<=node_limit:
+        p = 1
+        while p<=ppn_limit:
+            if int(np.sqrt(n*p))**2==n*p:
+                nodes.append(n)
+                ppn.append(p)
+            p *= 2
+        n *= 2
+    return np.array(nodes), np.array(ppn)
+
+
+# Global matrix stats of every problem, rebuilt from the per-rank tile features
+# of one sampled config: tiles of a sqrt(P) x sqrt(P) grid.
+def matrix_stats(df):
+    grouped = df.groupby(['problem', 'Nodes', 'PPN'], sort=False, observed=True)
+    sums = grouped[['nnz-A', 'nnz-B', 'm-A', 'n-A', 'n-B']].sum()
+    grid_dim = np.sqrt(grouped.size().to_numpy(dtype=np.float64))
+
+    stats = pd.DataFrame({"nnz-A":sums['nnz-A'].to_numpy(),
+                          "nnz-B":sums['nnz-B'].to_numpy(),
+                          "m-A":sums['m-A'].to_numpy() / grid_dim,
+                          "n-A":sums['n-A'].to_numpy() / grid_dim,
+                          "n-B":sums['n-B'].to_numpy() / grid_dim,
+                          "problem":sums.index.get_level_values('problem')})
+    return stats.groupby('problem', sort=False, observed=True).first()
+
+
+# Nodes spanned by a process row and a process column of the grid, and the most ranks
+# either has on one node, as SpGEMMParams::RowCommPlacement and ColCommPlacement give them.
+# Ranks fill nodes in blocks of ppn. grid_dim and ppn are powers of two, as in search_space_2d.
+def comm_placement(grid_dim, ppn):
+    row_per_node = np.minimum(grid_dim, ppn)
+    col_per_node = np.where(grid_dim>=ppn, 1, np.minimum(grid_dim, ppn / grid_dim))
+    return (grid_dim / row_per_node, row_per_node), (grid_dim / col_per_node, col_per_node)
+
+
+# PlatformParams::ThreadSpeedup: threads times the efficiency interpolated in log2(threads),
+# flat past the largest calibrated thread count, 1 without a curve
+def thread_speedup(threads, platform=perlmutter_params):
+    threads = np.asarray(threads, dtype=np.float64)
+    if not platform.thread_eff:
+        return np.ones_like(threads)
+    counts = np.array(sorted(platform.thread_eff), dtype=np.float64)
+    eff = np.array([platform.thread_eff[t] for t in sorted(platform.thread_eff)])
+    clipped = np.clip(threads, 1, counts[-1])
+    speedup = clipped * np.interp(np.log2(clipped), np.log2(counts), eff)
+    return np.where(threads<=1, 1.0, speedup)
+
+
+# SpGEMM2DModelAnalytical::BcastTime, LocalSpGEMMTime and MergeTime for every
+# (problem, config) pair. stats columns and nodes/ppn/threads broadcast against each other.
+# threads=None means cores_per_node//ppn per rank, as SpGEMMParams::ThreadsPerRank gives configs without threads.
+def predict(nnz_a, nrows_a, ncols_a, ncols_b, nodes, ppn, platform=perlmutter_params, threads=None):
+
+    p = (nodes*ppn).astype(np.float64)
+    grid_dim = np.sqrt(p)
+
+    # HierarchicalBcastTime: a tree among nodes, then a tree within each node
+    def tree_bcast(placement, msg_size):
+        n_nodes, per_node = placement
+        inter = np.log2(n_nodes) * (platform.inter_alpha + msg_size / platform.inter_beta)
+        intra = np.log2(per_node) * (platform.intra_alpha + msg_size / platform.intra_beta)
+        return (inter + intra) / 1e6
+
+    def msg_size(nnz):
+        return nnz*nt_bytes + nnz*it_bytes + (nnz + 1)*it_bytes
+
+    c = nnz_a / ncols_a
+    loc_nnz_a = np.floor((c*ncols_a) / p)
+    loc_nnz_b = np.floor((c*ncols_b) / p)
+    row_placement, col_placement = comm_placement(grid_dim, ppn)
+    bcast = (tree_bcast(row_placement, msg_size(loc_nnz_a)) + tree_bcast(col_placement, msg_size(loc_nnz_b))) * grid_dim
+
+    # globDensity*ncols in the C++ model
+    c = nnz_a / nrows_a
+    n = np.floor(ncols_a)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mult = 2.0*np.minimum(1.0, c/grid_dim) + ((c**2*n) / (grid_dim*p)) * \
+               np.log2(np.minimum(n/grid_dim, (c**2*n)/(grid_dim*p)))
+    local = mult * grid_dim * platform.gamma
+    if threads is None:
+        threads = np.maximum(1, platform.cores_per_node // ppn)
+    local = local / thread_speedup(threads, platform)
+
+    merge = ((c**2*n*np.log2(grid_dim)) / p) * platform.gamma
+
+    return bcast, local, merge
+
+
+# Everything the offline evaluation needs that does not depend on the platform:
+# true runtimes of each sampled config and the matrix stats, as flat arrays.
+@dataclass
+class OfflineProblems:
+    problems:list
+    rows:np.ndarray
+    cols:np.ndarray
+    nodes:np.ndarray
+    ppn:np.ndarray
+    y:np.ndarray
+    lengths:np.ndarray
+    stats:pd.DataFrame
+
+
+def prepare_offline(df, label):
+
+    y_params = df.groupby(['problem', 'Nodes', 'PPN'], sort=False, observed=True)[label].max()
+    problem_idx = y_params.index.get_level_values('problem')
+
+    problems = list(pd.unique(problem_idx))
+    rows = pd.Index(problems).get_indexer(problem_idx)
+    cols = pd.Series(rows).groupby(rows).cumcount().to_numpy()
+    lengths = np.bincount(rows, minlength=len(problems))
+
+    y = np.full((len(problems), lengths.max() if len(problems) else 0), np.nan)
+    y[rows, cols] = y_params.to_numpy(dtype=np.float64)
+
+    stats = matrix_stats(df).loc[problems]
+
+    return OfflineProblems(problems, rows, cols,
+                           y_params.index.get_level_values('Nodes').to_numpy(dtype=np.int64),
+                           y_params.index.get_level_values('PPN').to_numpy(dtype=np.int64),
+                           y, lengths, stats)
+
+
+# Predict every sampled config of every problem and score the ranking,
+# without launching autotune. The samples ran with cores_per_node/ppn OpenMP threads per rank (driver.py),
+# which predict credits the local multiply with when the platform has an efficiency curve.
+def evaluate_offline(prepared, platform=perlmutter_params, ks=(1, 2, 3)):
+
+    stats = prepared.stats
+    r = prepared.rows
+    bcast, local, merge = predict(stats['nnz-A'].to_numpy()[r], stats['m-A'].to_numpy()[r],
+                                  stats['n-A'].to_numpy()[r], stats['n-B'].to_numpy()[r],
+                                  prepared.nodes, prepared.ppn, platform)
+
+    y_pred = np.full(prepared.y.shape, np.nan)
+    y_pred[prepared.rows, prepared.cols] = bcast + local + merge
+
+    return batch_metrics(prepared.y, y_pred, prepared.lengths, ks, prepared.problems)
+
+
+# Predictions over the whole ConstructSearchSpace2D grid, problems x configs
+def predict_search_space(stats, node_limit, ppn_limit, platform=perlmutter_params):
+    nodes, ppn = search_space_2d(node_limit, ppn_limit)
+    col = lambda name: stats[name].to_numpy(dtype=np.float64)[:, None]
+    bcast, local, merge = predict(col('nnz-A'), col('m-A'), col('n-A'), col('n-B'),
+                                  nodes[None, :], ppn[None, :], platform)
+    return nodes, ppn, bcast + local + merge
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+
+# Environment variables autotune reads that change its predictions. For the ones naming a file,
+# the file's contents go into the key too, so a recalibrated profile or table misses the cache.
+prediction_env = ["AUTOTUNING_PLATFORM", "AUTOTUNING_BCAST_TABLE", "AUTOTUNING_SAMPLE_RATE", "AUTOTUNING_SAMPLE_Z"]
+prediction_env_files = ["AUTOTUNING_PLATFORM", "AUTOTUNING_BCAST_TABLE"]
+
+
+# Content-addressed cache of parsed autotune output. Predictions depend on the matrix, the permute flag,
+# the node limit, the search dimensions, the binary and the prediction_env settings, so those
+# (plus the launch shape) make the key. Least recently used entries are evicted once
+# the cache grows past max_bytes.
+class AutotuneCache:
+
+    def __init__(self, root, binary, max_bytes=1<<30):
+        self.root = root
+        self.binary = binary
+        self.max_bytes = max_bytes
+        self.file_hashes = {}
+        os.makedirs(root, exist_ok=True)
+
+
+    # Content hash of path, recomputed only when its size or mtime changes
+    def get_file_hash(self, path):
+        stat = os.stat(path)
+        cached = self.file_hashes.get(path)
+        if cached is None or cached[0]!=(stat.st_size, stat.st_mtime):
+            h = hashlib.sha256()
+            with open(path, 'rb') as file:
+                for chunk in iter(lambda: file.read(1<<20), b""):
+                    h.update(chunk)
+            cached = ((stat.st_size, stat.st_mtime), h.hexdigest())
+            self.file_hashes[path] = cached
+        return cached[1]
+
+
+    def get_binary_hash(self):
+        return self.get_file_hash(self.binary)
+
+
+    # The prediction_env settings autotune will run with, files by content
+    def get_env_fields(self):
+        fields = []
+        for name in prediction_env:
+            val = os.environ.get(name)
+            fields.append(f"{name}={val}")
+            if val is not None and name in prediction_env_files:
+                fields.append(self.get_file_hash(val) if os.path.exists(val) else "missing")
+        return fields
+
+
+    def key(self, job):
+        fields = [job.mat_name, job.permuted, job.nodes_cmd, job.threads, job.ranks, job.dims, self.get_binary_hash()]
+        fields += self.get_env_fields()
+        return hashlib.sha256(" ".join(map(str, fields)).encode()).hexdigest()
+
+
+    def get(self, job):
+        path = os.path.join(self.root, f"{self.key(job)}.pkl")
+        try:
+            with open(path, 'rb') as file:
+                output = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # Reads count as use for eviction
+        os.utime(path)
+        return output
+
+
+    def put(self, job, output):
+        path = os.path.join(self.root, f"{self.key(job)}.pkl")
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump(output, file)
+        os.replace(tmp, path)
+        self.evict()
+
+
+    def evict(self):
+        entries = []
+        for fname in os.listdir(self.root):
+            if not fname.endswith(".pkl"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.root, fname))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fname))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, fname in sorted(entries):
+            if total<=self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.root, fname))
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,144 @@
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from infolog_parser import parse_infologs, load_trace, InfoLogData
+
+
+autotune_bin = "../build/Applications/autotune"
+matrix_prefix = "/pscratch/sd/j/jbellav/matrices"
+trace_name = "trace.json"
+
+
+@dataclass
+class AutotuneJob:
+    problem:str
+    mat_name:str
+    permuted:int
+    nodes_cmd:int
+    threads:int = 2
+    ranks:int = 16
+    dims:int = 2
+
+
+class AutotuneError(Exception):
+    pass
+
+
+class AutotuneTimeout(AutotuneError):
+    pass
+
+
+def autotune_cmd(job):
+    binary = os.path.abspath(autotune_bin)
+    mat_path = f"{matrix_prefix}/{job.mat_name}/{job.mat_name}.mtx"
+    # Brute force search without redistribution cost, so predictions stay comparable to SpGEMM times.
+    # dims=3 searches layers too.
+    return f"export OMP_NUM_THREADS={job.threads} && mpirun -n {job.ranks} {binary} {mat_path} {mat_path} {job.permuted} {job.nodes_cmd} 0 0 0 {job.dims}"
+
+
+# Parse the info files one autotune run leaves in workdir.
+# Configs are (nodes, ppn, layers) integer tuples.
+def parse_autotune_output(workdir, mat_name):
+
+    info = parse_infologs(workdir, mat_name)
+    if 0 not in info.globals:
+        raise ValueError(f"no globals from rank 0 in {workdir}")
+
+    # Runtime estimates and timings come from rank 0
+    estimates = info.estimates[info.estimates["rank"]==0]
+    rank_globals = info.globals.get(0, {})
+
+    output = {"y_pred":{}, "bcast":{}, "local_spgemm":{}, "merge":{}, "timings":{}}
+
+    for name in ["bcast", "local_spgemm", "merge"]:
+        output[name] = InfoLogData.by_config(info.predictions, name)
+    output["y_pred"] = InfoLogData.by_config(estimates, "runtime")
+
+    # TuneSpGEMM is whichever TuneSpGEMM* timer the run used
+    for name in ["Prediction", "FeatureInit", "TuneSpGEMM", "PredSpGEMMTime", "PrunedConfigs"]:
+        for key, val in rank_globals.items():
+            if key.startswith(name) and isinstance(val, float):
+                output["timings"][name] = val
+
+    # Span times from the trace are the slowest rank's, and take precedence over rank 0's globals
+    trace_path = os.path.join(workdir, trace_name)
+    if os.path.exists(trace_path):
+        _, _, summary = load_trace(trace_path)
+        for name in ["Prediction", "FeatureInit", "TuneSpGEMM", "ComputeNnzArr"]:
+            for key, stats in summary.items():
+                if key.startswith(name):
+                    output["timings"][name] = stats["max"]
+
+    return output
+
+
+# Run one autotune job in its own scratch directory, so info-* and logfile*
+# never collide with other jobs. The whole process group is killed on timeout,
+# otherwise mpirun outlives the shell.
+def run_autotune(job, timeout=300, scratch="."):
+
+    cmd = autotune_cmd(job)
+    workdir = tempfile.mkdtemp(prefix=f"autotune-{job.mat_name}-", dir=scratch)
+
+    print(f"Executing {cmd} in {workdir}...")
+
+    try:
+        proc = subprocess.Popen(cmd, shell=True, cwd=workdir, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True, start_new_session=True,
+                                env=dict(os.environ, AUTOTUNING_TRACE=trace_name))
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            # The group may have exited since the timeout fired
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            proc.communicate()
+            raise AutotuneTimeout(f"{job.problem.strip()} timed out after {timeout}s")
+
+        if proc.returncode!=0:
+            raise AutotuneError(f"{job.problem.strip()} exited with {proc.returncode}\n{stderr}")
+
+        try:
+            return parse_autotune_output(workdir, job.mat_name)
+        except (OSError, ValueError) as e:
+            raise AutotuneError(f"{job.problem.strip()} left unreadable output: {e}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# Keep n_jobs autotune runs in flight. Yields (job, output, error) as runs
+# complete; exactly one of output and error is None. Jobs found in cache are
+# yielded first, without launching anything.
+def run_autotune_jobs(jobs, n_jobs=1, timeout=300, scratch=".", cache=None):
+
+    os.makedirs(scratch, exist_ok=True)
+
+    to_run = []
+    for job in jobs:
+        output = cache.get(job) if cache else None
+        if output is not None:
+            print(f"Cache hit for {job.problem.strip()}")
+            yield job, output, None
+        else:
+            to_run.append(job)
+
+    with ThreadPoolExecutor(max_workers=max(1, n_jobs)) as pool:
+        futures = {pool.submit(run_autotune, job, timeout, scratch):job for job in to_run}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                output = future.result()
+            except AutotuneError as e:
+                yield job, None, e
+                continue
+            if cache:
+                cache.put(job, output)
+            yield job, output, None
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+import argparse
+import os
+import subprocess
+
+from calibrate_platform import calibrate_bin
+
+
+# Measures bcast time for every Open MPI bcast algorithm over message and communicator sizes,
+# by running calibrate's bcast sweep once per algorithm forced with coll_tuned dynamic rules.
+# The fastest algorithm at each point is compiled into the table BcastTable in BcastInfo.h reads.
+
+# coll_tuned_bcast_algorithm id -> BcastAlgorithm in BcastInfo.h
+ompi_algs = {1:0, # basic linear -> BCAST_LINEAR
+             2:1, # chain -> BCAST_CHAIN
+             3:1, # pipeline -> BCAST_CHAIN
+             4:2, # split binary tree -> BCAST_SPLIT_BIN_TREE
+             5:3, # binary tree -> BCAST_BIN_TREE
+             6:4, # binomial -> BCAST_BINOMIAL
+             7:5, # knomial -> BCAST_KNOMIAL
+             8:6, # scatter allgather -> BCAST_SCATTER_ALLGATHER
+             9:6} # scatter allgather ring -> BCAST_SCATTER_ALLGATHER
+
+
+def sweep(ranks, out_dir, algs=ompi_algs.keys()):
+
+    os.makedirs(out_dir, exist_ok=True)
+    binary = os.path.abspath(calibrate_bin)
+
+    for alg in algs:
+        csv = os.path.join(out_dir, f"bcast-alg{alg}.csv")
+        cmd = f"mpirun -n {ranks} --mca coll_tuned_use_dynamic_rules 1 --mca coll_tuned_bcast_algorithm {alg} {binary} {csv} bcast"
+        print(f"Executing {cmd}...")
+        result = subprocess.run(cmd, shell=True)
+        if result.returncode!=0:
+            print(f"!!!!!Algorithm {alg} failed, leaving it out of the table")
+
+
+def load_sweep(out_dir):
+    frames = []
+    for fname in sorted(os.listdir(out_dir)):
+        if fname.startswith("bcast-alg") and fname.endswith(".csv"):
+            df = pd.read_csv(os.path.join(out_dir, fname))
+            df = df[df['kind']=="bcast"].copy()
+            df['alg'] = ompi_algs[int(fname[len("bcast-alg"):-len(".csv")])]
+            frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+# Fastest algorithm at every (comm size, log2 message size) point. Comm sizes that are
+# missing some message size are dropped, BcastTable needs a full grid.
+def compile_table(df):
+
+    df = df.assign(log_size=np.round(np.log2(df['size'])).astype(int))
+    best = df.loc[df.groupby(['ranks', 'log_size'])['time_us'].idxmin()]
+
+    n_sizes = best['log_size'].nunique()
+    complete = best.groupby('ranks')['log_size'].transform('nunique')==n_sizes
+    return best[complete][['ranks', 'log_size', 'alg', 'time_us']].sort_values(['ranks', 'log_size'])
+
+
+def write_table(table, path):
+    with open(path, 'w') as file:
+        file.write("# commSize log2Bytes BcastAlgorithm time_us\n")
+        for ranks, log_size, alg, time_us in table.itertuples(index=False):
+            file.write(f"{ranks} {log_size} {alg} {time_us}\n")
+
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ranks", type=int, help="run the sweep with mpirun -n RANKS first")
+    parser.add_argument("--dir", type=str, default="./bcast-sweep")
+    parser.add_argument("--out", type=str, default="bcast.table")
+    args = parser.parse_args()
+
+    if args.ranks:
+        sweep(args.ranks, args.dir)
+
+    table = compile_table(load_sweep(args.dir))
+    print(table.to_string(index=False))
+
+    write_table(table, args.out)
+    print(f"Wrote {args.out}")
@@ -0,0 +1,117 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+from collections import defaultdict
+
+import data_utils
+from data_utils import load_gnn_df
+
+
+features = ["FLOPS", "m-A", "m-B", "n-A", "n-B", "nnz-A", "nnz-B",
+            "outputNnz-intermediate", "outputNnz-final", "Nodes", "PPN", "rank"]
+labels = ["bcast-A", "bcast-B", "total-time", "local-mult", "summed-time", "merge"]
+
+
+# Write files that look like samples-gnn-mod*, with a few extra keys per line.
+# Keys come out sorted like FeatureExtractor::WriteSample writes them.
+def write_synthetic(dirname, n_files, n_samples):
+    extra = ["A-name", "B-name", "symbolic", "kselect"]
+    for f in range(n_files):
+        with open(os.path.join(dirname, f"samples-gnn-mod-{f}.txt"), 'w') as file:
+            for s in range(n_samples):
+                file.write("----SAMPLE----\n")
+                mat = f"mat{random.randint(0, 50)}"
+                for rank in range(16):
+                    keys = sorted(features + labels + extra)
+                    toks = [f"{k}:{random.random()*1e6}" if k!="rank" else f"rank:{rank}" for k in keys]
+                    toks.append(f"problem:{mat}.mtx{mat}.mtx-permuted\n")
+                    file.write(" ".join(toks))
+
+
+# Original line-by-line parser, the reference load_gnn_df is checked and timed against
+def load_gnn_df_loop(features, labels, f_prefix="samples-gnn-mod"):
+    
+    graph_list = []
+    
+    file_names = list(filter(lambda s: f_prefix in s, os.listdir(data_utils.path_prefix)))
+    
+    df_dict = defaultdict(lambda: [])
+
+    stime = time.time()
+    for fname in file_names:
+        print(f"Processing {fname}...")
+        with open(data_utils.path_prefix+fname, 'r') as file:
+            for line in file:
+                if "SAMPLE" in line:
+                    continue
+                feats = line.split(" ")
+                found_feats = []
+                for f in feats:
+                    name, val = f.split(":")[0], f.split(":")[1]
+                    name = name.strip()
+                    if "problem" in name:
+                        df_dict[name].append(val)
+                        found_feats.append(name)
+                    elif name in features+labels and name not in found_feats:
+                        try:
+                            df_dict[name].append(float(val))
+                            found_feats.append(name)
+                        except:
+                            continue
+                for f in features+labels+["problem"]:
+                    if f not in found_feats:
+                        df_dict[f].append(None)
+    etime = time.time()
+    df = pd.DataFrame(df_dict)
+    print(f"Processsed {len(df)} samples in {etime-stime}s")
+
+    df["bcast"] = df["bcast-A"] + df["bcast-B"]
+    df["no-bcast"] = df["local-mult"] + df["merge"]
+    return df
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--f_prefix", type=str, default="samples-gnn-mod")
+    parser.add_argument("--synthetic", type=int, default=0, help="number of synthetic files to generate")
+    parser.add_argument("--samples", type=int, default=200, help="samples per synthetic file")
+    parser.add_argument("--workers", type=int, default=0, help="also time the parallel loader with this many workers")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.synthetic:
+        tmpdir = tempfile.TemporaryDirectory()
+        write_synthetic(tmpdir.name, args.synthetic, args.samples)
+        data_utils.path_prefix = tmpdir.name + "/"
+
+    stime = time.time()
+    df_loop = load_gnn_df_loop(features, labels, args.f_prefix)
+    loop_time = time.time() - stime
+
+    stime = time.time()
+    df = load_gnn_df(features, labels, args.f_prefix)
+    vec_time = time.time() - stime
+
+    pd.testing.assert_frame_equal(df, df_loop)
+
+    print(f"Loop: {loop_time}s")
+    print(f"Vectorized: {vec_time}s")
+    print(f"Speedup: {loop_time/vec_time}x")
+
+    if args.workers:
+        stime = time.time()
+        df_par = load_gnn_df(features, labels, args.f_prefix, parallel=True, workers=args.workers)
+        par_time = time.time() - stime
+
+        pd.testing.assert_frame_equal(df_par, df)
+
+        print(f"Parallel ({args.workers} workers): {par_time}s")
+        print(f"Speedup over serial: {vec_time/par_time}x")
+
+    if tmpdir:
+        tmpdir.cleanup()
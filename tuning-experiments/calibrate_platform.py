@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+import argparse
+import os
+import subprocess
+
+
+# Fits a platform profile to the rows src/calibrate.cpp writes, and writes it in the
+# "<member> <value>" format PlatformParams::LoadProfile reads.
+# Units follow PlatformParams: alphas are us, betas and memBW are bytes/us,
+# costFLOP is seconds per FLOP since the models add local time to bcast time in seconds.
+
+calibrate_bin = "../build/calibrate"
+
+
+# time = alpha + bytes/beta, least squares. A flat or noisy sweep fits no positive beta,
+# then None is returned and the profile leaves both out, so LoadProfile keeps the defaults.
+def fit_alpha_beta(size, time, name):
+    slope, intercept = np.polyfit(size.astype(np.float64), time.astype(np.float64), 1)
+    if not slope>0:
+        print(f"WARNING: {name} fit has slope {slope}, keeping the default alpha and beta")
+        return None
+    return max(intercept, 0.0), 1.0/slope
+
+
+def fit_profile(df):
+
+    profile = {}
+
+    cores = df[df['kind']=="cores"]
+    if len(cores):
+        profile["coresPerNode"] = int(cores['size'].iloc[0])
+
+    pingpong = df[df['kind']=="pingpong"]
+    bcast = df[df['kind']=="bcast"]
+
+    intra = pingpong[pingpong['nodes']==1]
+    if len(intra)>1:
+        intra_fit = fit_alpha_beta(intra['size'], intra['time_us'], "intranode pingpong")
+        if intra_fit:
+            profile["intranodeAlpha"], profile["intranodeBeta"] = intra_fit
+
+    inter = pingpong[pingpong['nodes']>1]
+    inter_fit = None
+    if len(inter)>1:
+        inter_fit = fit_alpha_beta(inter['size'], inter['time_us'], "internode pingpong")
+    elif len(bcast[bcast['nodes']>1])>1:
+        # Tree bcast: log2(P) steps of alpha + bytes/beta
+        multi = bcast[bcast['nodes']>1]
+        steps = np.log2(multi['ranks'].to_numpy(dtype=np.float64))
+        inter_fit = fit_alpha_beta(multi['size'], multi['time_us'] / steps, "internode bcast")
+    elif "intranodeAlpha" in profile:
+        print("WARNING: no internode measurements, using intranode alpha and beta for internode")
+        inter_fit = profile["intranodeAlpha"], profile["intranodeBeta"]
+    if inter_fit:
+        profile["internodeAlpha"], profile["internodeBeta"] = inter_fit
+
+    triad = df[df['kind']=="triad"]
+    if len(triad):
+        profile["memBW"] = int(np.median(triad['size'] / triad['time_us']))
+        profile["costMem"] = 1.0 / profile["memBW"]
+
+    spgemm = df[df['kind']=="spgemm"]
+    if len(spgemm)>1:
+        slope, _ = np.polyfit(spgemm['size'].to_numpy(dtype=np.float64), spgemm['time_us'].to_numpy(dtype=np.float64), 1)
+        profile["costFLOP"] = slope / 1e6
+    elif len(spgemm):
+        profile["costFLOP"] = float(spgemm['time_us'].iloc[0] / spgemm['size'].iloc[0]) / 1e6
+
+    # Thread sweep of one rank: costFLOP becomes the single thread cost, and
+    # threadEfficiency<t> = speedup over one thread / t, for PlatformParams::ThreadSpeedup
+    threads = df[df['kind']=="spgemm-threads"]
+    if len(threads):
+        times = threads.groupby('ranks')['time_us'].median()
+        flops = threads.groupby('ranks')['size'].median()
+        if 1 in times.index:
+            profile["costFLOP"] = float(times[1] / flops[1]) / 1e6
+            for t, time in times.items():
+                profile[f"threadEfficiency{t}"] = float(times[1] / time) / t
+        else:
+            print("WARNING: thread sweep has no single thread rows, leaving out the efficiency curve")
+
+    return profile
+
+
+def write_profile(profile, path):
+    with open(path, 'w') as file:
+        for key, val in profile.items():
+            file.write(f"{key} {val}\n")
+
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", type=str, default="calibration.csv")
+    parser.add_argument("--out", type=str, default="platform.profile")
+    parser.add_argument("--run", type=int, help="first run the microbenchmarks with mpirun -n RUN on this node")
+    parser.add_argument("--threads-csv", type=str, help="rows of the thread sweep, run on one rank first with --run")
+    args = parser.parse_args()
+
+    if args.run:
+        cmd = f"mpirun -n {args.run} {os.path.abspath(calibrate_bin)} {args.csv}"
+        print(f"Executing {cmd}...")
+        subprocess.run(cmd, shell=True, check=True)
+        if args.threads_csv:
+            cmd = f"mpirun -n 1 {os.path.abspath(calibrate_bin)} {args.threads_csv} threads"
+            print(f"Executing {cmd}...")
+            subprocess.run(cmd, shell=True, check=True)
+
+    df = pd.read_csv(args.csv)
+    if args.threads_csv:
+        df = pd.concat([df, pd.read_csv(args.threads_csv)], ignore_index=True)
+    profile = fit_profile(df)
+    for key, val in profile.items():
+        print(f"{key}: {val}")
+
+    write_profile(profile, args.out)
+    print(f"Wrote {args.out}")
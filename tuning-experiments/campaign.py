@@ -0,0 +1,133 @@
+import json
+import os
+import time
+
+from data_utils import sample_files, path_prefix
+
+
+# Record of a sample collection campaign. Every (matA, matB, alg, nodes, ppn,
+# layers, permute) configuration has an entry with its status and attempts, so
+# an interrupted sweep restarts with only the configurations still missing.
+# Configurations already in the sample files or perlmutter-dat/ count as done.
+
+fields = ["matA", "matB", "alg", "nodes", "ppn", "layers", "permute"]
+
+
+def config_key(matA, matB, alg, nodes, ppn, layers=1, permute=0):
+    return f"{matA}|{matB}|{alg}|{int(nodes)}|{int(ppn)}|{int(layers)}|{int(permute)}"
+
+
+# $PSCRATCH/matrices/A/A.mtx[-permuted] -> A
+def mat_name(path):
+    name = os.path.basename(path.strip())
+    if name.endswith("-permuted"):
+        name = name[:-len("-permuted")]
+    if name.endswith(".mtx"):
+        name = name[:-len(".mtx")]
+    return name
+
+
+# Only 3D runs record Layers
+def sample_key(sample):
+    if not all(k in sample for k in ["A-name", "B-name", "Nodes", "PPN"]):
+        return None
+    try:
+        alg, layers = ("3D", int(float(sample["Layers"]))) if "Layers" in sample else ("2D", 1)
+        return config_key(mat_name(sample["A-name"]), mat_name(sample["B-name"]), alg,
+                          float(sample["Nodes"]), float(sample["PPN"]),
+                          layers, sample["B-name"].strip().endswith("-permuted"))
+    except ValueError:
+        return None
+
+
+class CampaignManifest:
+
+    def __init__(self, path):
+        self.path = path
+        self.configs = {}
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                self.configs = json.load(file)["configs"]
+
+
+    def is_done(self, key):
+        return self.configs.get(key, {}).get("status")=="done"
+
+
+    # status is one of done, failed, timeout
+    def mark(self, key, status, attempts=1, error=None, source=None):
+        entry = self.configs.setdefault(key, {"attempts":0})
+        entry["status"] = status
+        entry["attempts"] += attempts
+        entry["updated"] = time.time()
+        if error is not None:
+            entry["error"] = error[-2000:]
+        if source is not None:
+            entry["source"] = source
+        self.write()
+
+
+    def index_samples(self, f_prefix="samples-gnn"):
+        n_found = 0
+        if not os.path.isdir(os.path.expandvars(path_prefix)):
+            return n_found
+        for fname in sample_files(f_prefix):
+            print(f"Indexing {fname}...")
+            for key in scan_sample_file(fname):
+                if not self.is_done(key):
+                    self.configs[key] = {"status":"done", "attempts":0, "source":os.path.basename(fname),
+                                         "updated":time.time()}
+                    n_found += 1
+        self.write()
+        return n_found
+
+
+    # Run records driver.py streams into dirname/*.jsonl
+    def index_results(self, dirname="./perlmutter-dat"):
+        n_found = 0
+        if not os.path.isdir(dirname):
+            return n_found
+        for fname in sorted(os.listdir(dirname)):
+            if not fname.endswith(".jsonl"):
+                continue
+            with open(os.path.join(dirname, fname), 'r') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if record.get("returncode")!=0 or record.get("timed_out") or "matA" not in record:
+                        continue
+                    key = config_key(*(record[f] for f in fields))
+                    if not self.is_done(key):
+                        self.configs[key] = {"status":"done", "attempts":record.get("attempt", 1),
+                                             "source":fname, "updated":time.time()}
+                        n_found += 1
+        self.write()
+        return n_found
+
+
+    def write(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as file:
+            json.dump({"configs":self.configs}, file, indent=1)
+        os.replace(tmp, self.path)
+
+
+# Distinct configuration keys in one text or JSONL sample file
+def scan_sample_file(fname):
+    keys = set()
+    with open(fname, 'r') as file:
+        for line in file:
+            if fname.endswith(".jsonl"):
+                try:
+                    sample = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+            else:
+                sample = dict(tok.split(":", 1) for tok in line.split() if ":" in tok)
+            key = sample_key(sample)
+            if key:
+                keys.add(key)
+    return keys
@@ -13,6 +13,8 @@
 #include <map>
 #include <iomanip>
 #include <sstream>
+#include <cstring>
+#include <cmath>
 
 #include "CombBLAS/CombBLAS.h"
 #include "CombBLAS/CommGrid3D.h"
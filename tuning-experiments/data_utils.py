@@ -1,7 +1,14 @@
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
+import numpy as np
 import pandas as pd
 
+import csv
+import io
+import json
+import mmap
 import os
 import time
 
@@ -52,42 +59,218 @@ def load_spgemm2d_data(filename="samples.txt"):
     return df
 
 
-def load_gnn_df(features, labels, f_prefix="samples-gnn-mod"):
-    
-    graph_list = []
-    
-    file_names = list(filter(lambda s: f_prefix in s, os.listdir(path_prefix)))
-    
-    df_dict = defaultdict(lambda: [])
+def sample_files(f_prefix):
+    prefix = os.path.expandvars(path_prefix)
+    return [prefix+fname for fname in os.listdir(prefix) if f_prefix in fname]
+
+
+# Parse one sample file in bulk. Returns the column order of the first sample,
+# the number of samples, and a dict of column arrays.
+def parse_gnn_file(fname, features, labels):
+
+    with open(fname, 'r') as file:
+        text = file.read()
+
+    wanted = set(features + labels)
+
+    # Turning name:value into name value lets the C csv parser tokenize the whole
+    # file and convert the values; names end up in even columns, values in odd ones.
+    # NOTE: a value that itself contains ':' would shift the line, samples never have one
+    pairs = text.replace(":", " ")
+    n_fields = max((line.count(" ") for line in pairs.split("\n")), default=0) + 1
+    n_fields += n_fields % 2
+    raw = pd.read_csv(io.StringIO(pairs), sep=" ", header=None,
+                      names=range(n_fields), quoting=csv.QUOTE_NONE, keep_default_na=False,
+                      na_values=[""], skip_blank_lines=True, low_memory=False,
+                      dtype={j: "category" for j in range(0, n_fields, 2)})
+    n_lines = len(raw)
+
+    name_cols = []
+    for j in range(0, n_fields, 2):
+        name_cols.append((j, raw[j].cat.codes.to_numpy(), [str(u) for u in raw[j].cat.categories]))
+
+    # Skip sample headers, and anything else that is not a name:value line
+    keep = raw[1].notna().to_numpy().copy()
+    for j, codes, uniques in name_cols:
+        for u, name in enumerate(uniques):
+            if "SAMPLE" in name:
+                keep &= codes!=u
+    for j in range(1, n_fields, 2):
+        if not pd.api.types.is_numeric_dtype(raw[j]):
+            keep &= ~raw[j].astype(str).str.contains("SAMPLE", regex=False, na=False).to_numpy(dtype=bool)
+    n_rows = int(keep.sum())
+
+    # Last line without a trailing newline keeps its raw problem value
+    ends_newline = np.ones(n_lines, dtype=bool)
+    if n_lines and not text.endswith("\n"):
+        ends_newline[-1] = False
+
+    cols = {}
+    numeric = {}
+
+    for j, codes, uniques in name_cols:
+        for u, name in enumerate(uniques):
+            if name not in wanted and "problem" not in name:
+                continue
+
+            rows = (codes==u) & keep
+            vals = raw[j+1]
+
+            if "problem" in name:
+                if name not in cols:
+                    cols[name] = np.full(n_lines, None, dtype=object)
+                col = cols[name]
+                rows &= np.equal(col, None)
+                # The loop kept the newline on the last token of a line
+                is_last = (raw[j+2].isna().to_numpy() if j+2<n_fields else True) & ends_newline
+                strs = vals.to_numpy(dtype=object)[rows].astype(str).astype(object)
+                strs[is_last[rows]] += "\n"
+                col[rows] = strs
+            else:
+                if j+1 not in numeric:
+                    numeric[j+1] = vals.to_numpy(np.float64) if pd.api.types.is_numeric_dtype(vals) \
+                                    else pd.to_numeric(vals, errors="coerce").to_numpy(np.float64)
+                if name not in cols:
+                    cols[name] = np.full(n_lines, np.nan)
+                col = cols[name]
+                # Only the first value that parses counts, same as the loop
+                rows &= np.isnan(col) & ~np.isnan(numeric[j+1])
+                col[rows] = numeric[j+1][rows]
+
+    order = []
+    first_row = np.flatnonzero(keep)[0] if n_rows else -1
+    # The loop made a column the first time it saw a name, parsed or not
+    if first_row >= 0:
+        for j, codes, uniques in name_cols:
+            if codes[first_row] < 0:
+                break
+            name = uniques[codes[first_row]]
+            if (name in wanted or "problem" in name) and name not in order:
+                order.append(name)
+
+    for name in features + labels:
+        if name not in cols:
+            cols[name] = np.full(n_lines, np.nan)
+    if "problem" not in cols:
+        cols["problem"] = np.full(n_lines, None, dtype=object)
+
+    cols = {name: col[keep] for name, col in cols.items()}
+
+    # Column order follows the first sample, then whatever it was missing
+    order += [f for f in features + labels + ["problem"] if f not in order]
+    order += [f for f in cols if f not in order]
+
+    return order, n_rows, cols
+
+
+def make_gnn_df(parsed, features, labels, compact=False):
+
+    # The first file with samples decides the column order
+    with_rows = [file_order for file_order, n_rows, _ in parsed if n_rows > 0]
+    order = list(with_rows[0] if with_rows else parsed[0][0]) if parsed else []
+    for file_order, _, _ in parsed:
+        order += [f for f in file_order if f not in order]
+
+    df_dict = {}
+    for name in order:
+        chunks = []
+        for _, n_rows, cols in parsed:
+            if name in cols:
+                chunks.append(cols[name])
+            elif name=="problem" or "problem" in name:
+                chunks.append(np.full(n_rows, None, dtype=object))
+            else:
+                chunks.append(np.full(n_rows, np.nan))
+        col = np.concatenate(chunks) if chunks else np.empty(0)
+        if compact:
+            col = pd.Categorical(col) if col.dtype==object else col.astype(np.float32)
+        df_dict[name] = col
+
+    df = pd.DataFrame(df_dict, copy=False)
+
+    df["bcast"] = df["bcast-A"] + df["bcast-B"]
+    df["no-bcast"] = df["local-mult"] + df["merge"]
+    return df
+
+
+# Reads every samples-gnn-mod file into one frame. With compact=True, numeric columns
+# are float32 and problem is categorical. With parallel=True the files are parsed
+# by a pool of workers (all cores by default); the result is the same as serial.
+def load_gnn_df(features, labels, f_prefix="samples-gnn-mod", compact=False, parallel=False, workers=None):
+
+    file_names = sample_files(f_prefix)
 
     stime = time.time()
+    if parallel and len(file_names)>1:
+        workers = min(workers or os.cpu_count(), len(file_names))
+        print(f"Processing {len(file_names)} files with {workers} workers...")
+        # map keeps the listdir order, so columns and rows come out as in the serial path
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(parse_gnn_file, file_names, repeat(features), repeat(labels),
+                                   chunksize=max(1, len(file_names)//(4*workers))))
+    else:
+        parsed = []
+        for fname in file_names:
+            print(f"Processing {fname}...")
+            parsed.append(parse_gnn_file(fname, features, labels))
+    df = make_gnn_df(parsed, features, labels, compact)
+    etime = time.time()
+    print(f"Processsed {len(df)} samples in {etime-stime}s")
+
+    return df
+
+
+def _to_float(val):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+# Problem name as it appears in samples-gnn-mod files, e.g. a.mtxa.mtx-permuted
+def _problem_name(record):
+    if "problem" in record:
+        return record["problem"]
+    if "A-name" not in record or "B-name" not in record:
+        return None
+    return os.path.basename(record["A-name"]) + os.path.basename(record["B-name"]) + "\n"
+
+
+# Parse one JSONL sample file (AUTOTUNING_OUTPUT=jsonl). Returns the same
+# (order, n_rows, cols) triple as parse_gnn_file.
+def _parse_gnn_jsonl(fname, features, labels):
+
+    records = []
+    with open(fname, 'rb') as file:
+        if os.fstat(file.fileno()).st_size>0:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                records = [json.loads(line) for line in iter(mm.readline, b"") if line.strip()]
+    n_rows = len(records)
+
+    names = features + labels + (["sample"] if any("sample" in r for r in records) else [])
+    cols = {}
+    for name in names:
+        cols[name] = np.fromiter((_to_float(r.get(name)) for r in records), dtype=np.float64, count=n_rows)
+    cols["problem"] = np.empty(n_rows, dtype=object)
+    cols["problem"][:] = [_problem_name(r) for r in records]
+
+    order = features + labels + ["problem"] + names[len(features + labels):]
+    return order, n_rows, cols
+
+
+# Load samples written with AUTOTUNING_OUTPUT=jsonl. Keys are looked up by name,
+# so their order in the file does not matter.
+def load_gnn_jsonl(features, labels, f_prefix="samples-gnn", compact=False):
+
+    file_names = [f for f in sample_files(f_prefix) if f.endswith(".jsonl")]
+
+    stime = time.time()
+    parsed = []
     for fname in file_names:
         print(f"Processing {fname}...")
-        with open(path_prefix+fname, 'r') as file:
-            for line in file:
-                if "SAMPLE" in line:
-                    continue
-                feats = line.split(" ")
-                found_feats = []
-                for f in feats:
-                    name, val = f.split(":")[0], f.split(":")[1]
-                    name = name.strip()
-                    if "problem" in name:
-                        df_dict[name].append(val)
-                        found_feats.append(name)
-                    elif name in features+labels and name not in found_feats:
-                        try:
-                            df_dict[name].append(float(val))
-                            found_feats.append(name)
-                        except:
-                            continue
-                for f in features+labels+["problem"]:
-                    if f not in found_feats:
-                        df_dict[f].append(None)
+        parsed.append(_parse_gnn_jsonl(fname, features, labels))
+    df = make_gnn_df(parsed, features, labels, compact)
     etime = time.time()
-    df = pd.DataFrame(df_dict)
     print(f"Processsed {len(df)} samples in {etime-stime}s")
 
-    df["bcast"] = df["bcast-A"] + df["bcast-B"]
-    df["no-bcast"] = df["local-mult"] + df["merge"]
-    return df 
+    return df
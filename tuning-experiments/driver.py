@@ -2,6 +2,14 @@ import argparse
 import subprocess
 import os
 import math
+import json
+import queue
+import signal
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from campaign import CampaignManifest, config_key
 
 
 def write_output(args, result_lst):
@@ -32,7 +40,28 @@ def get_layers(ppn, nodes):
     return layers
 
 
-def run(args):
+# Nodes of the allocation: --hosts, or the SLURM node list
+def get_hosts(args):
+    if args.hosts:
+        return args.hosts.split(",")
+    if "SLURM_JOB_NODELIST" in os.environ:
+        result = subprocess.run(["scontrol", "show", "hostnames", os.environ["SLURM_JOB_NODELIST"]],
+                                capture_output=True, text=True)
+        if result.returncode==0:
+            return result.stdout.split()
+    return []
+
+
+# Split the allocation into disjoint groups of args.nodes nodes, one run per group.
+# Without a host list everything runs on the whole allocation, one at a time.
+def get_host_groups(args):
+    hosts = get_hosts(args)
+    if len(hosts)<2*args.nodes:
+        return [None]
+    return [hosts[i:i+args.nodes] for i in range(0, len(hosts)-args.nodes+1, args.nodes)]
+
+
+def make_cmds(args):
     
     combblas_cmd = f" combblas-spgemm {args.alg} $PSCRATCH/matrices/{args.matA}/{args.matA}.mtx $PSCRATCH/matrices/{args.matB}/{args.matB}.mtx {args.code} "
     
@@ -51,29 +80,116 @@ def run(args):
                 combblas_cmd_tmp = combblas_cmd + str(l) + " " + str(args.permute)
                 cmd  = srun_cmd + combblas_cmd_tmp 
                 cmd += f" {args.model}"
-                cmd_lst.append(cmd)
+                cmd_lst.append((cmd, ppn, l))
         else:
             cmd = srun_cmd + combblas_cmd + "1 " + str(args.permute)
             cmd += f" {args.model}"
-            cmd_lst.append(cmd)
-    
+            cmd_lst.append((cmd, ppn, 1))
+
+    return cmd_lst
+
+
+# Pin a command to its host group, ppn slots on each node. The rank count stays
+# what the command asks for, packed or not.
+def place_cmd(cmd, ppn, hosts):
+    if hosts is None:
+        return cmd
+    host_arg = ",".join(f"{h}:{ppn}" for h in hosts)
+    return cmd.replace("mpirun -n 16", f"mpirun -n 16 --host {host_arg}")
+
+
+def run_one(cmd, ppn, layers, host_groups, timeout, attempt=1, delay=0):
+
+    # Back off before a retry without holding on to a host group
+    time.sleep(delay)
+
+    hosts = host_groups.get()
+    placed = place_cmd(cmd, ppn, hosts)
+    print(f"Executing {placed}")
+
+    record = {"cmd":placed, "ppn":ppn, "layers":layers, "hosts":hosts, "attempt":attempt, "timed_out":False}
+    stime = time.time()
+    try:
+        proc = subprocess.Popen(placed, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                text=True, start_new_session=True)
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            # Kill mpirun too, not just the shell. The group may have exited since the timeout fired.
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            stdout, stderr = proc.communicate()
+            record["timed_out"] = True
+        record.update(returncode=proc.returncode, stdout=stdout, stderr=stderr)
+    finally:
+        host_groups.put(hosts)
+    record["elapsed"] = time.time() - stime
+
+    return record
+
+
+def run(args):
+
+    os.makedirs("./perlmutter-dat", exist_ok=True)
+
+    # Skip everything the campaign already has samples or successful runs for
+    manifest = CampaignManifest(args.manifest)
+    if not args.no_index:
+        print(f"Found {manifest.index_samples()} configs in sample files")
+        print(f"Found {manifest.index_results()} configs in perlmutter-dat")
+
+    key = lambda ppn, layers: config_key(args.matA, args.matB, args.alg, args.nodes, ppn, layers, args.permute)
+    cmd_lst = [(cmd, ppn, layers) for cmd, ppn, layers in make_cmds(args) if not manifest.is_done(key(ppn, layers))]
     print(cmd_lst)
+
+    groups = get_host_groups(args)
+    host_groups = queue.Queue()
+    for group in groups:
+        host_groups.put(group)
+    print(f"Running {len(cmd_lst)} commands, {len(groups)} at a time")
     
     result_lst = []
     
+    rname = f"./perlmutter-dat/combblas-{args.alg}-{args.code}-N{args.nodes}-{args.matA}x{args.matB}.jsonl"
+    
     err_log = open(f"err-{args.nodes}-{args.model}.out", 'a')
 
-    for cmd in cmd_lst:
-        print(f"Executing {cmd}")
-        try:
-            result = subprocess.run(cmd, capture_output=True, text=True, shell=True)
-            result.check_returncode()
-        except subprocess.TimeoutExpired:
-            print(f"!!!!!{cmd} timed out")
-            err_log.write(args.matA+str(args.nodes)+ ":time-out\n")
-        except:
-            print(result.stderr)
-            err_log.write(args.matA+str(args.nodes)+ ":error\n")
+    # Each record is written as soon as its run finishes. Failed runs are
+    # resubmitted with exponential backoff until they have used args.retries attempts.
+    with ThreadPoolExecutor(max_workers=max(1, len(cmd_lst))) as pool, open(rname, 'a') as rfile:
+        futures = {pool.submit(run_one, cmd, ppn, layers, host_groups, args.timeout):(cmd, ppn, layers)
+                   for cmd, ppn, layers in cmd_lst}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                cmd, ppn, layers = futures.pop(future)
+                record = future.result()
+                record.update(matA=args.matA, matB=args.matB, nodes=args.nodes, alg=args.alg,
+                              code=args.code, permute=args.permute, model=args.model)
+                rfile.write(json.dumps(record) + "\n")
+                rfile.flush()
+
+                if record["timed_out"]:
+                    print(f"!!!!!{record['cmd']} timed out")
+                    err_log.write(args.matA+str(args.nodes)+ ":time-out\n")
+                    manifest.mark(key(ppn, layers), "timeout", source=rname)
+                elif record["returncode"]!=0:
+                    print(record["stderr"])
+                    err_log.write(args.matA+str(args.nodes)+ ":error\n")
+                    manifest.mark(key(ppn, layers), "failed", error=record["stderr"], source=rname)
+                else:
+                    manifest.mark(key(ppn, layers), "done", source=rname)
+                    result_lst.append((record["cmd"], record["stdout"]))
+                    continue
+
+                attempt = record["attempt"]
+                if attempt<args.retries:
+                    delay = args.backoff * 2**(attempt-1)
+                    print(f"Retrying in {delay}s")
+                    futures[pool.submit(run_one, cmd, ppn, layers, host_groups, args.timeout,
+                                        attempt+1, delay)] = (cmd, ppn, layers)
     
     err_log.close()
 
@@ -91,6 +207,12 @@ if __name__=="__main__":
     parser.add_argument("--model", type=str)
     parser.add_argument("--ppnmin", type=int)
     parser.add_argument("--ppnmax", type=int)
+    parser.add_argument("--hosts", type=str, help="comma separated nodes to pack runs onto, defaults to the SLURM allocation")
+    parser.add_argument("--timeout", type=int, default=1800, help="seconds before a run is killed")
+    parser.add_argument("--retries", type=int, default=3, help="attempts per config before giving up")
+    parser.add_argument("--backoff", type=float, default=30, help="seconds before the first retry, doubled after each")
+    parser.add_argument("--manifest", type=str, default="./perlmutter-dat/campaign.json")
+    parser.add_argument("--no_index", action='store_true', help="don't scan sample files and results for finished configs")
     args = parser.parse_args()
     result_lst = run(args)
-    #write_output(args, result_lst)
+    write_output(args, result_lst)
@@ -0,0 +1,166 @@
+import numpy as np
+
+import json
+import os
+import re
+
+from dataclasses import dataclass, field
+
+
+# Readers for the files InfoLog writes: PREDICTION INFO blocks from WriteInfo,
+# RUNTIME ESTIMATES from SpGEMM2DModel::WritePrediction, and the GLOBALS and
+# PERCENTAGES blocks from WriteInfoGlobal. Each file is read once, line by line.
+
+prediction_dtype = np.dtype([("nodes", np.int32), ("ppn", np.int32), ("layers", np.int32), ("threads", np.int32),
+                             ("rank", np.int32),
+                             ("bcast", np.float64), ("local_spgemm", np.float64), ("merge", np.float64)])
+estimate_dtype = np.dtype([("nodes", np.int32), ("ppn", np.int32), ("layers", np.int32), ("threads", np.int32),
+                           ("rank", np.int32), ("runtime", np.float64)])
+
+prediction_keys = {"PredBcastTime":"bcast", "PredLocalSpGEMMTime":"local_spgemm", "PredMergeTime":"merge"}
+
+
+@dataclass
+class InfoLogData:
+    predictions:np.ndarray
+    estimates:np.ndarray
+    globals:dict = field(default_factory=dict)
+    percentages:dict = field(default_factory=dict)
+
+    # {(nodes, ppn, layers): value} view of one column of a structured array,
+    # keys get threads as a fourth entry only for configs that set it
+    @staticmethod
+    def by_config(arr, name):
+        return {(int(n), int(p), int(l)) + ((int(t),) if t>0 else ()):float(v) for n, p, l, t, v in
+                zip(arr["nodes"], arr["ppn"], arr["layers"], arr["threads"], arr[name])}
+
+
+# "nodes,ppn[,layers[,threads]]" -> (nodes, ppn, layers, threads), threads is 0 if the config does not set it
+def parse_config(s):
+    dims = [int(float(d)) for d in s.split(",")]
+    return tuple(dims + [1]*(3-len(dims)) + [0]*(4-max(len(dims), 3)))
+
+
+def parse_value(s):
+    try:
+        return float(s)
+    except ValueError:
+        return s
+
+
+def file_rank(path):
+    m = re.search(r"-(\d+)\.out$", path)
+    return int(m.group(1)) if m else -1
+
+
+def parse_infolog(path, predictions=None, estimates=None, globals=None, percentages=None):
+
+    predictions = [] if predictions is None else predictions
+    estimates = [] if estimates is None else estimates
+    globals = {} if globals is None else globals
+    percentages = {} if percentages is None else percentages
+
+    rank = file_rank(path)
+    state, block = None, None
+
+    with open(path, 'r') as file:
+        first = file.read(1)
+        file.seek(0)
+        if first=="{":
+            parse_infolog_jsonl(file, rank, predictions, estimates, globals, percentages)
+            return predictions, estimates, globals, percentages
+
+        for line in file:
+
+            if line.startswith("----"):
+                header = line.strip("-\n")
+                if header=="PREDICTION INFO":
+                    state = "prediction"
+                elif header=="RUNTIME ESTIMATES":
+                    state = "estimates"
+                elif header.startswith("GLOBALS RANK"):
+                    state, block = "globals", globals.setdefault(int(header.split()[-1]), {})
+                elif header.startswith("PERCENTAGES RANK"):
+                    state, block = "percentages", percentages.setdefault(int(header.split()[-1]), {})
+                else:
+                    state = None
+                continue
+
+            if state=="prediction":
+                # One line of key:value pairs, Params first
+                pairs = dict(tok.split(":", 1) for tok in line.split() if ":" in tok)
+                if "Params" in pairs:
+                    predictions.append(parse_config(pairs["Params"]) + (rank,) +
+                                       tuple(float(pairs.get(k, "nan")) for k in prediction_keys))
+                state = None
+
+            elif state=="estimates":
+                for tok in line.split():
+                    config, runtime = tok.rsplit(":", 1)
+                    estimates.append(parse_config(config) + (rank, float(runtime.rstrip("s"))))
+                state = None
+
+            elif state in ("globals", "percentages"):
+                line = line.strip()
+                if not line:
+                    state = None
+                    continue
+                key, val = line.split(":", 1)
+                block[key] = parse_value(val.rstrip("%"))
+
+    return predictions, estimates, globals, percentages
+
+
+# Same sections, written one JSON record per line with AUTOTUNING_OUTPUT=jsonl
+def parse_infolog_jsonl(file, rank, predictions, estimates, globals, percentages):
+
+    for line in file:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        section = record.pop("section")
+        record_rank = record.pop("rank", rank)
+
+        if section=="prediction":
+            if "Params" in record:
+                predictions.append(parse_config(str(record["Params"])) + (rank,) +
+                                   tuple(float(record.get(k, "nan")) for k in prediction_keys))
+        elif section=="estimates":
+            for config, runtime in zip(record["configs"], record["runtimes"]):
+                estimates.append(parse_config(config) + (rank, float(runtime)))
+        elif section in ("globals", "percentages"):
+            block = (globals if section=="globals" else percentages).setdefault(record_rank, {})
+            block.update({k:float(v) if isinstance(v, (int, float)) else v for k, v in record.items()})
+
+
+trace_dtype = np.dtype([("rank", np.int32), ("depth", np.int32), ("start", np.float64), ("duration", np.float64)])
+
+
+# Chrome trace Tracer::Write leaves with AUTOTUNING_TRACE=<path>. Returns the span names,
+# a structured array of the spans (times in seconds), and the per-span summary over ranks.
+def load_trace(path):
+
+    with open(path, 'r') as file:
+        trace = json.load(file)
+
+    events = trace["traceEvents"]
+    names = np.array([e["name"] for e in events], dtype=object)
+    spans = np.array([(e["tid"], e["args"]["depth"], e["ts"]/1e6, e["dur"]/1e6) for e in events],
+                     dtype=trace_dtype)
+
+    return names, spans, trace["summary"]
+
+
+# Parse every info-<A>x<B>* file of one run
+def parse_infologs(workdir, mat_name, mat_name_b=None):
+
+    prefix = f"info-{mat_name}x{mat_name_b or mat_name}"
+    predictions, estimates, globals, percentages = [], [], {}, {}
+
+    for fname in sorted(os.listdir(workdir)):
+        if prefix in fname:
+            parse_infolog(os.path.join(workdir, fname), predictions, estimates, globals, percentages)
+
+    return InfoLogData(np.array(predictions, dtype=prediction_dtype),
+                       np.array(estimates, dtype=estimate_dtype),
+                       globals, percentages)
@@ -5,17 +5,25 @@ import matplotlib.pyplot as plt
 from dataclasses import dataclass
 from scipy.stats import kendalltau
 
+import json
+import os
 import statistics as stats
 
 
 class ProblemResults:
 
 
-    def __init__(self):
+    def __init__(self, checkpoint=None):
         self.results = {}
+        self.runtimes = {}
+        self.checkpoint = checkpoint
 
     @dataclass
     class Result:
+        __slots__ = ("problem", "rmse", "kt", "diff", "top1err", "top2err", "top3err",
+                     "correct1", "correct2", "correct3", "spgemm_runtime", "timings",
+                     "bcast_time", "local_spgemm_time", "merge_time", "params", "best_params")
+
         problem:str
         rmse:float
         kt:float
@@ -35,6 +43,10 @@ class ProblemResults:
         local_spgemm_time: float
         merge_time: float
 
+        # Predicted and measured best configs, (nodes, ppn, layers)
+        params: tuple
+        best_params: tuple
+
 
     def add_result(self, problem, y_arr, y_pred_arr, spgemm_runtime, timings,
                    bcast_pred_arr, local_spegmm_pred_arr, merge_pred_arr,
@@ -73,14 +85,56 @@ class ProblemResults:
 
         self.results[problem] = self.Result(problem, rmse, kt, diff, top_1_err, top_2_err, top_3_err, 
                                             is_correct1, is_correct2, is_correct3, spgemm_runtime, timings,
-                                            bcast, local_spgemm, merge)
+                                            bcast, local_spgemm, merge, params[min_idx], params[np.argmin(y_arr)])
+        self.runtimes[problem] = (y_arr, y_pred_arr)
+
+        if self.checkpoint:
+            self.append_checkpoint(problem)
+
+    # One JSON line per problem, so a checkpoint only costs the new record
+    def append_checkpoint(self, problem):
+        result = self.results[problem]
+        record = {name:to_json(getattr(result, name)) for name in result.__slots__}
+        record["y"], record["y_pred"] = map(lambda a: [float(v) for v in a], self.runtimes[problem])
+        with open(self.checkpoint, 'a') as file:
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    # Rebuild from a checkpoint log, new results keep appending to it
+    @classmethod
+    def from_checkpoint(cls, checkpoint):
+        results = cls(checkpoint)
+        if not os.path.exists(checkpoint):
+            return results
+        # Drop the partial last record of a run that died mid-write
+        with open(checkpoint, 'rb+') as file:
+            data = file.read()
+            if data and not data.endswith(b"\n"):
+                file.truncate(data.rfind(b"\n") + 1)
+        with open(checkpoint, 'r') as file:
+            for line in file:
+                record = json.loads(line)
+                y, y_pred = record.pop("y"), record.pop("y_pred")
+                # Records from before configs were kept
+                record.setdefault("params", None)
+                record.setdefault("best_params", None)
+                results.results[record["problem"]] = cls.Result(**record)
+                results.runtimes[record["problem"]] = (np.array(y), np.array(y_pred))
+        return results
+
+    def batch_metrics(self, ks=(1, 2, 3)):
+        problems = list(self.runtimes.keys())
+        y, lengths = pad_runtimes([self.runtimes[p][0] for p in problems])
+        y_pred, _ = pad_runtimes([self.runtimes[p][1] for p in problems])
+        return batch_metrics(y, y_pred, lengths, ks, problems)
     
     def get_stat_arr(self, stat_name):
-        arr = map(lambda r: self.results[r].__dict__[stat_name], self.results)
-        return list(filter(lambda x: x!=None, arr)) 
+        arr = (getattr(r, stat_name) for r in self.results.values())
+        return [x for x in arr if x is not None]
 
     def get_result_stat(self, problem, stat):
-        return self.results[problem].__dict__[stat]
+        return getattr(self.results[problem], stat)
 
     def output_eval(self):
 
@@ -118,6 +172,13 @@ class ProblemResults:
         print(f"----AVERAGE TOP 3 ERROR: {sum(err_arr3)/len(err_arr3)}")
         print(f"----MEDIAN TOP 3 ERROR: {stats.median(err_arr3)}")
 
+        # How well the layer count is chosen, for evaluations with 3D configs
+        layered = [r for r in self.results.values() if r.params is not None and len(r.params)>2]
+        if any(r.best_params[2]>1 or r.params[2]>1 for r in layered):
+            print(f"----CHOSE LAYERS>1 : {sum(r.params[2]>1 for r in layered)}/{len(layered)}")
+            print(f"----BEST HAS LAYERS>1 : {sum(r.best_params[2]>1 for r in layered)}/{len(layered)}")
+            print(f"----CORRECT LAYERS : {sum(r.params[2]==r.best_params[2] for r in layered)}/{len(layered)}")
+
     def plot_eval(self):
         
         problems = []
@@ -164,7 +225,8 @@ class ProblemResults:
         feature_init_times = list(map(lambda t: t["FeatureInit"], autotuning_timings))
         prediction_times = list(map(lambda t: t["Prediction"], autotuning_timings))
         autotuning_spgemm_times = list(map(lambda t: t["AutotuningSpGEMM"], autotuning_timings))
-        tuning_times = list(map(lambda t: t["TuneSpGEMM2D"], autotuning_timings))
+        # Older results name the tuning timer TuneSpGEMM2D
+        tuning_times = list(map(lambda t: t.get("TuneSpGEMM", t.get("TuneSpGEMM2D")), autotuning_timings))
 
         categories = ["Autotuning Runtime", "SpGEMM Runtime"]
         ind = np.arange(len(problems))*1.5
@@ -183,6 +245,14 @@ class ProblemResults:
         plt.savefig(f"{args.label}-plots/timing.png", bbox_inches='tight')
         plt.clf()
 
+def to_json(val):
+    if isinstance(val, dict):
+        return {k:to_json(v) for k, v in val.items()}
+    if isinstance(val, np.generic):
+        return val.item()
+    return val
+
+
 class ProblemPhaseResults: # Don't ask
 
 
@@ -340,3 +410,90 @@ class ProblemPhaseResults: # Don't ask
         ax.legend()
         plt.savefig(f"{args.label}-plots/timing.png", bbox_inches='tight')
         plt.clf()
+
+
+# Pad per-problem runtime arrays into one (problems x configs) array.
+# Returns the padded array and the number of configs of each problem.
+def pad_runtimes(arrs, fill=np.nan):
+    lengths = np.array([len(a) for a in arrs], dtype=np.int64)
+    padded = np.full((len(arrs), lengths.max() if len(arrs) else 0), fill, dtype=np.float64)
+    for i, a in enumerate(arrs):
+        padded[i, :len(a)] = a
+    return padded, lengths
+
+
+# Columnar metrics for a batch of problems, one array per metric
+class BatchMetrics:
+
+    def __init__(self, problems, columns):
+        self.problems = problems
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.problems)
+
+    def __getitem__(self, stat_name):
+        return self.columns[stat_name]
+
+    def get_stat_arr(self, stat_name):
+        arr = self.columns[stat_name]
+        return arr[~np.isnan(arr)] if arr.dtype.kind=="f" else arr
+
+    def get_result_stat(self, problem, stat):
+        return self.columns[stat][self.problems.index(problem)]
+
+
+# Same metrics as ProblemResults.add_result, for every row of y and y_pred at
+# once. Rows are padded past lengths[i] (or with NaN); top-k is computed for
+# each k in ks. Kendall tau is tau-b, like scipy.
+def batch_metrics(y, y_pred, lengths=None, ks=(1, 2, 3), problems=None):
+
+    y, y_pred = np.asarray(y, dtype=np.float64), np.asarray(y_pred, dtype=np.float64)
+    n_problems, n_configs = y.shape
+
+    if lengths is None:
+        valid = ~(np.isnan(y) | np.isnan(y_pred))
+    else:
+        valid = np.arange(n_configs)[None, :] < np.asarray(lengths)[:, None]
+    n = valid.sum(axis=1)
+    rows = np.arange(n_problems)
+
+    y_inf = np.where(valid, y, np.inf)
+    pred_inf = np.where(valid, y_pred, np.inf)
+
+    # Kendall tau-b over all valid pairs i<j
+    i, j = np.triu_indices(n_configs, 1)
+    pair_valid = valid[:, i] & valid[:, j]
+    sy = (y[:, i] > y[:, j]).view(np.int8) - (y[:, i] < y[:, j]).view(np.int8)
+    sp = (y_pred[:, i] > y_pred[:, j]).view(np.int8) - (y_pred[:, i] < y_pred[:, j]).view(np.int8)
+    n0 = pair_valid.sum(axis=1)
+    n_tied_y = ((sy==0) & pair_valid).sum(axis=1)
+    n_tied_p = ((sp==0) & pair_valid).sum(axis=1)
+    s = (sy*sp*pair_valid).sum(axis=1, dtype=np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        kt = s / np.sqrt((n0 - n_tied_y).astype(np.float64) * (n0 - n_tied_p))
+    kt[~np.isfinite(kt)] = np.nan
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rmse = np.linalg.norm(np.where(valid, y_pred - y, 0), axis=1) / n**2
+
+    # Configs ranked by predicted runtime, padding last
+    order = np.argsort(pred_inf, axis=1, kind="stable")
+    y_ranked = np.take_along_axis(y_inf, order, axis=1)
+    best = np.argmin(y_inf, axis=1)
+    y_min = y_inf[rows, best]
+
+    columns = {"kt":kt, "rmse":rmse, "diff":np.abs(y_ranked[:, 0] - y_min)}
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        err = np.minimum.accumulate(y_ranked / y_min[:, None] - 1, axis=1)
+    err[y_min<=0] = np.nan
+    hit = np.logical_or.accumulate(order==best[:, None], axis=1)
+
+    for k in ks:
+        k_idx = np.minimum(k, n) - 1
+        columns[f"correct{k}"] = hit[rows, k_idx].astype(np.int64)
+        columns[f"top{k}err"] = err[rows, k_idx]
+
+    problems = list(problems) if problems is not None else list(range(n_problems))
+    return BatchMetrics(problems, columns)
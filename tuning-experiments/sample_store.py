@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+
+import hashlib
+import json
+import os
+import re
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from data_utils import sample_files, parse_gnn_file, make_gnn_df
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    have_parquet = True
+except ImportError:
+    have_parquet = False
+
+
+# On-disk sample store. Each raw sample file is ingested once into fragments
+# partitioned as problem=<slug>/Nodes=<n>/, and the manifest records the size,
+# mtime and hash of every file ingested so refresh() only parses what changed.
+class SampleStore:
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.ext = ".parquet" if have_parquet else ".pkl"
+        self.manifest = {"columns": [], "files": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as file:
+                self.manifest = json.load(file)
+
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+
+    def refresh(self, features, labels, f_prefix="samples-gnn-mod", workers=None):
+
+        os.makedirs(self.root, exist_ok=True)
+
+        stime = time.time()
+        changed = []
+        for path in sample_files(f_prefix):
+            fname = os.path.basename(path)
+            stat = os.stat(path)
+            entry = self.manifest["files"].get(fname)
+
+            if entry and entry["size"]==stat.st_size and entry["mtime"]==stat.st_mtime:
+                continue
+
+            sha1 = file_hash(path)
+            if entry and entry["sha1"]==sha1:
+                entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+                continue
+
+            print(f"Ingesting {fname}...")
+            changed.append((path, fname, stat, sha1))
+
+        paths = [path for path, _, _, _ in changed]
+        if workers and workers>1 and len(paths)>1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+                parsed = list(pool.map(parse_gnn_file, paths, repeat(features), repeat(labels)))
+        else:
+            parsed = [parse_gnn_file(path, features, labels) for path in paths]
+
+        for (path, fname, stat, sha1), file_parsed in zip(changed, parsed):
+            df = make_gnn_df([file_parsed], features, labels)
+
+            entry = self.manifest["files"].get(fname)
+            if entry:
+                self.remove_fragments(entry["fragments"])
+
+            self.manifest["files"][fname] = {"size":stat.st_size, "mtime":stat.st_mtime,
+                                             "sha1":sha1, "fragments":self.write_fragments(fname, df)}
+            self.manifest["columns"] += [c for c in df.columns if c not in self.manifest["columns"]]
+
+        # Files that disappeared from path_prefix take their samples with them
+        found = {os.path.basename(path) for path in sample_files(f_prefix)}
+        for fname in [f for f in self.manifest["files"] if f_prefix in f and f not in found]:
+            self.remove_fragments(self.manifest["files"].pop(fname)["fragments"])
+
+        self.write_manifest()
+        etime = time.time()
+        print(f"Ingested {len(changed)} new or changed files in {etime-stime}s")
+
+
+    # Only the requested columns are read from each fragment
+    def load(self, columns=None):
+
+        stime = time.time()
+        frags = []
+        for entry in self.manifest["files"].values():
+            for frag in entry["fragments"]:
+                frags.append(self.read_fragment(os.path.join(self.root, frag), columns))
+
+        all_columns = columns if columns else self.manifest["columns"]
+        if not frags:
+            return pd.DataFrame(columns=all_columns)
+
+        df = pd.concat(frags, ignore_index=True, copy=False)
+        df = df[[c for c in all_columns if c in df.columns]]
+        etime = time.time()
+        print(f"Loaded {len(df)} samples in {etime-stime}s")
+        return df
+
+
+    def write_fragments(self, fname, df):
+        fragments = []
+        stem = os.path.splitext(fname)[0]
+        for (problem, nodes), df_part in df.groupby(["problem", "Nodes"], sort=False, dropna=False):
+            part_dir = f"problem={slug(problem)}/Nodes={nodes:g}"
+            os.makedirs(os.path.join(self.root, part_dir), exist_ok=True)
+            frag = f"{part_dir}/{stem}{self.ext}"
+            df_part = df_part.reset_index(drop=True)
+            if have_parquet:
+                df_part.to_parquet(os.path.join(self.root, frag), index=False)
+            else:
+                df_part.to_pickle(os.path.join(self.root, frag))
+            fragments.append(frag)
+        return fragments
+
+
+    # Fragments ingested before a column existed (e.g. Layers) lack it, so only the
+    # columns a fragment has are read and the rest come back as NaN.
+    def read_fragment(self, path, columns):
+        if path.endswith(".parquet"):
+            if not columns:
+                return pd.read_parquet(path)
+            present = set(pyarrow.parquet.read_schema(path).names)
+            df = pd.read_parquet(path, columns=[c for c in columns if c in present])
+        else:
+            df = pd.read_pickle(path)
+        return df.reindex(columns=columns) if columns else df
+
+
+    def remove_fragments(self, fragments):
+        for frag in fragments:
+            path = os.path.join(self.root, frag)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+    def write_manifest(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, 'w') as file:
+            json.dump(self.manifest, file, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1<<20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def slug(problem):
+    if problem is None or (isinstance(problem, float) and np.isnan(problem)):
+        return "none"
+    return re.sub(r"[^A-Za-z0-9.\-]", "_", str(problem).strip())
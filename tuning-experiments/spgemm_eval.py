@@ -10,12 +10,15 @@ import random
 import math
 import json
 import pickle
-import subprocess
 
 from collections import defaultdict
 
 from data_utils import *
 from problem_results import *
+from sample_store import SampleStore
+from autotune_jobs import AutotuneJob, run_autotune_jobs, autotune_bin
+from autotune_cache import AutotuneCache
+from analytical_model import perlmutter_params, load_profile, prepare_offline, evaluate_offline
 
 path_prefix = "/global/homes/j/jbellav/CombBLAS/tuning-experiments/"
 cores_per_node = 128
@@ -32,6 +35,7 @@ features = ["FLOPS",
             "outputNnz-final",
             "Nodes",
             "PPN",
+            "Layers",
             "rank"
             ]
 labels = [
@@ -45,137 +49,113 @@ labels = [
 n_features = len(features)
 
 
-@dataclass
-class PlatformParams:
-    inter_beta: float
-    inter_alpha: float
-    gamma:float
-
-perlmutter_params = PlatformParams(23980.54, 3.9, 5.2e-9)
+# Predictions keyed by (nodes, ppn, layers) like the samples. A thread search keys them by
+# (nodes, ppn, layers, threads), and the samples ran with cores_per_node//ppn threads per rank (driver.py),
+# so only that thread count of each config is scored.
+def sampled_configs(predictions):
+    return {p[:3]:t for p, t in predictions.items() if len(p)==3 or p[3]==cores_per_node//p[1]}
 
 
 def eval_spgemm(args, test_df):
     
-    test_df['params'] = test_df.apply(lambda row: f"{row['Nodes']}, {row['PPN']}", axis=1)
-    test_df['processes'] = test_df.apply(lambda row: f"{row['Nodes']*row['PPN']}", axis=1)
+    # Row positions of every problem, from one pass over the problem column
+    problem_rows = test_df.groupby('problem', sort=False, observed=True).indices
 
-    problems = test_df['problem'].unique()
+    problems = list(problem_rows.keys())
 
     print(problems)
 
     if args.problem:
         problems = [f"{args.problem}.mtx{args.problem}.mtx-permuted\n"]
 
-    results = ProblemResults()
+    jobs = []
+    for problem in problems:
+        if problem not in problem_rows:
+            continue
+        df_problem = test_df.iloc[problem_rows[problem]]
+
+        nodes_cmd = int(df_problem["Nodes"].max())
+        permuted = 1 if "permuted" in problem else 0
+        mat_name = problem.split(".")[0]
+
+        jobs.append(AutotuneJob(problem, mat_name, permuted, nodes_cmd, dims=args.dims))
+
+    cache = None
+    if args.cache and os.path.exists(autotune_bin):
+        cache = AutotuneCache(args.cache, autotune_bin, args.cache_mb<<20)
+
+    # Problems already in the checkpoint log are not evaluated again
+    results = ProblemResults.from_checkpoint(f"{args.pklname}.jsonl")
+    if results.results:
+        print(f"Resuming with {len(results.results)} problems from {args.pklname}.jsonl")
+        jobs = [job for job in jobs if job.problem not in results.results]
     i = 0
     
-    print(f"Evaluating {len(problems)} problems")
-    for problem in problems:
+    print(f"Evaluating {len(jobs)} problems, {args.jobs} at a time")
+    for job, output, error in run_autotune_jobs(jobs, args.jobs, args.timeout, args.scratch, cache):
 
         if i%10==0:
-            print(f"{i}/{len(problems)} evaluated...")
+            print(f"{i}/{len(jobs)} evaluated...")
+        i+=1
 
-        df_problem = test_df[test_df['problem']==problem]
-        
-        params = df_problem['params'].unique()
-        
-        y_pred_arr = np.zeros(shape=(len(params)))
-        y_arr = []
-        processes = []
-        valid_params = []
+        if error:
+            print(error)
+            continue
 
+        df_problem = test_df.iloc[problem_rows[job.problem]]
 
-        X = df_problem[features]
-        y = df_problem[args.label]
+        # A 2D search is only scored against one layer configs
+        if args.dims==2:
+            df_problem = df_problem[(df_problem["Layers"]==1).to_numpy()]
         
-        nodes_cmd = int(df_problem["Nodes"].max())
-        permuted = 1 if "permuted" in problem else 0
-        ppn_cmd = 64
-        threads = 2
-
-        mat_name = problem.split(".")[0]
-        
-        cmd = f"export OMP_NUM_THREADS={threads} && mpirun -n 16 ../build/Applications/autotune /pscratch/sd/j/jbellav/matrices/{mat_name}/{mat_name}.mtx /pscratch/sd/j/jbellav/matrices/{mat_name}/{mat_name}.mtx {permuted} {nodes_cmd} 0"
-
-        print(f"Executing {cmd}...")
-
-        try:
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=300)
-            result.check_returncode()
-        except:
-            print(result.stderr)
-            os.system(f"rm -f info-{mat_name}x{mat_name}*")
-            os.system("rm -f logfile*")
-            i+=1
+        # True runtime of each (Nodes, PPN, Layers) config, keyed by integer tuples
+        y_params = df_problem.groupby(['Nodes', 'PPN', 'Layers'], sort=False)[args.label].max()
+        params = [(int(nodes), int(ppn), int(layers)) for nodes, ppn, layers in y_params.index]
+
+        # A config without a prediction, e.g. one branch and bound pruned, must not score as a 0s prediction
+        y_pred = sampled_configs(output["y_pred"])
+        missing = [param for param in params if param not in y_pred]
+        if missing:
+            print(f"!!!!!No predictions for {missing} of {job.problem}, leaving it out")
             continue
-        
-        timings = {}
 
-        filenames = list(filter(lambda s: f"info-{mat_name}x{mat_name}" in s, os.listdir(".")))
+        y_arr = y_params.to_numpy(dtype=np.float64)
+        y_pred_arr = np.array([y_pred[param] for param in params])
 
-        bcast_pred_arr, local_spgemm_pred_arr, merge_pred_arr = {}, {}, {}
+        bcast_pred_arr = {p:t for p, t in sampled_configs(output["bcast"]).items() if p in y_params.index}
+        local_spgemm_pred_arr = {p:t for p, t in sampled_configs(output["local_spgemm"]).items() if p in y_params.index}
+        merge_pred_arr = {p:t for p, t in sampled_configs(output["merge"]).items() if p in y_params.index}
 
-        for filename in filenames:
-            with open(filename, 'r') as file:
-                for line in file:
-                    if line.find("PREDICTION INFO")!=-1:
-                        line = next(file)
-                        if "Params" not in line:
-                            break
-                        nodes, ppn = float(line.split(" ")[0].split(":")[1].split(",")[0]), float(line.split(" ")[0].split(":")[1].split(",")[1])
-                        bcast_time, local_spgemm_time, merge_time = map(lambda s: s.split(":")[1], line.split(" ")[1:-1])
-                        if f"{nodes}, {ppn}" in params:
-                            bcast_pred_arr[f"{nodes}, {ppn}"] = float(bcast_time) 
-                            local_spgemm_pred_arr[f"{nodes}, {ppn}"] = float(local_spgemm_time) 
-                            merge_pred_arr[f"{nodes}, {ppn}"] = float(merge_time) 
-
-        with open(f"info-{mat_name}x{mat_name}-0.out", 'r') as file:
-            for line in file:
-                if line.find("RUNTIME ESTIMATES")!=-1:
-                    
-                    line = next(file)
-                    trials = line.split(" ")
-                    
-                    for trial in trials[:-1]:
-                        params_curr,runtime = trial.split(":")[0], float(trial.split(":")[1][:-1])
-                        nodes,ppn = float(params_curr.split(",")[0]), float(params_curr.split(",")[1])
-                        if f"{nodes}, {ppn}" in params:
-                            y_pred_arr[list(params).index(f"{nodes}, {ppn}")] = runtime
-
-                if line.find("Prediction:")!=-1 and line.find("%")==-1:
-                    t = float(line.split(":")[1])
-                    timings["Prediction"] = t
-                if line.find("FeatureInit:")!=-1 and line.find("%")==-1:
-                    t = float(line.split(":")[1])
-                    timings["FeatureInit"] = t
-                if line.find("TuneSpGEMM2D")!=-1 and line.find("%")==-1:
-                    t = float(line.split(":")[1])
-                    timings["TuneSpGEMM2D"] = t
-                if line.find("PredSpGEMMTime")!=-1 and line.find("%")==-1:
-                    t = float(line.split(":")[1])
-                    timings["PredSpGEMMTime"] = t
-
-
-        os.system(f"rm -f info-{mat_name}x{mat_name}*")
-        os.system("rm -f logfile*")
-
-        y_arr = np.zeros(shape=(len(params)))
-        
-        for param in params:
-            param_time = df_problem[df_problem["params"]==param][args.label].max()
-            y_arr[list(params).index(param)] = param_time 
+        print(y_pred_arr)
 
+        results.add_result(job.problem, y_arr, y_pred_arr, 0.0, dict(output["timings"]), bcast_pred_arr,
+                           local_spgemm_pred_arr, merge_pred_arr, params)
 
-        print(y_pred_arr)
+    with open(f"{args.pklname}.pkl", 'wb') as picklefile:
+        pickle.dump(results, picklefile)
 
-        results.add_result(problem, y_arr, y_pred_arr, 0.0, timings, bcast_pred_arr,
-                           local_spgemm_pred_arr, merge_pred_arr, list(params))
 
-        i+=1
+# Score the analytical model on every problem in numpy, without launching autotune
+def eval_offline(args, test_df):
+
+    # The offline model is 2D
+    test_df = test_df[(test_df["Layers"]==1).to_numpy()]
+
+    stime = time.time()
+    prepared = prepare_offline(test_df, args.label)
+    platform = load_profile(args.platform) if args.platform else perlmutter_params
+    metrics = evaluate_offline(prepared, platform)
+    etime = time.time()
 
-        # Save once per trial, just incase we don't finish before batch job expires!
-        with open(f"{args.pklname}.pkl", 'wb') as picklefile:
-            pickle.dump(results, picklefile)
+    kt_arr = metrics.get_stat_arr("kt")
+    print(f"Evaluated {len(metrics)} problems in {etime-stime}s")
+    print(f"----AVERAGE KT: {kt_arr.mean()}")
+    print(f"----MEDIAN KT: {np.median(kt_arr)}")
+    for k in (1, 2, 3):
+        print(f"----NUMBER CORRECT{k} : {metrics[f'correct{k}'].sum()}/{len(metrics)}")
+        print(f"----AVERAGE TOP {k} ERROR: {metrics.get_stat_arr(f'top{k}err').mean()}")
+
+    return metrics
 
 
 def correctness(df, mat_name):
@@ -254,26 +234,41 @@ if __name__=="__main__":
     parser.add_argument("--dfname", type=str, default="master-df-gnn")
     parser.add_argument('--load', const=1, nargs='?', type=int)
     parser.add_argument('--correctness', const=1, nargs='?', type=int)
+    parser.add_argument('--offline', const=1, nargs='?', type=int, help="evaluate the analytical model in numpy")
+    parser.add_argument('--platform', type=str, help="platform profile from calibrate_platform.py for --offline")
+    parser.add_argument('--workers', type=int, default=1, help="processes used to parse sample files")
+    parser.add_argument('--jobs', type=int, default=1, help="autotune runs kept in flight")
+    parser.add_argument('--timeout', type=int, default=300, help="seconds before an autotune run is killed")
+    parser.add_argument('--scratch', type=str, default="./autotune-scratch", help="where each run gets its own directory")
+    parser.add_argument('--cache', type=str, default="./autotune-cache", help="autotune output cache, empty string disables it")
+    parser.add_argument('--cache_mb', type=int, default=1024, help="size limit of the autotune cache")
+    parser.add_argument('--dims', type=int, default=2, choices=[2, 3], help="3 tunes layers too, and scores against 3D samples")
 
     args = parser.parse_args()
     
     # Load in dataframe
-    if args.load:
-        df = load_gnn_df(features, labels) 
+    store = SampleStore(f"./tuning-dataframes/{args.dfname}-store")
+    if args.load or store.exists():
+        # Only parses sample files that are new or changed since the last load
+        if args.load:
+            store.refresh(features, labels, workers=args.workers)
+        df = store.load(columns=features+labels+["problem"])
 
         # Only problems with all nodes
-        all_problems = df['problem'].unique()
-        valid_problems = [p for p in all_problems if df[df['problem']==p]['Nodes'].unique().shape[0]==7]
-        df = df[df['problem'].isin(valid_problems)]
+        n_nodes = df.groupby('problem', sort=False, observed=True)['Nodes'].transform('nunique')
+        df = df[(n_nodes==7).to_numpy()]
 
-        print(f"{len(valid_problems)} total problems...")
-        
-        df.to_pickle(f"./tuning-dataframes/{args.dfname}")
+        print(f"{df['problem'].nunique()} total problems...")
     else:
         df = pd.read_pickle(f"./tuning-dataframes/{args.dfname}")
+
+    # Only 3D runs record Layers
+    df = df.assign(Layers=df["Layers"].fillna(1) if "Layers" in df else 1)
     
     if args.correctness:
         correctness(df, args.problem)
+    elif args.offline:
+        eval_offline(args, df)
     else:
         eval_spgemm(args, df)
     